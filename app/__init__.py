@@ -25,12 +25,31 @@ def _register_flow_templates(app):
 def create_app():
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'secret'
+    # Per-host settings, e.g. FLASK_STEP_QUEUE_URL or FLASK_NODE_SLOTS=4
+    app.config.from_prefixed_env()
 
     _register_flow_templates(app)
 
+    from . import cutout_cache, design_cache, executor, edb_pool, edb_service, events, flow_registry, packaging, registry, scheduler
+    flow_registry.init_app(app)
+    scheduler.init_app(app)
+    events.init_app(app)
+    registry.init_app(app)
+    executor.init_app(app)
+    edb_service.init_app(app)
+    edb_pool.init_app(app)
+    design_cache.init_app(app)
+    cutout_cache.init_app(app)
+    packaging.init_app(app)
+
     from .routes import main_bp
     from .admin import admin_bp
+    from .uploads import uploads_bp
+    from .batch import batch_bp, init_app as init_batches
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(batch_bp)
+    init_batches(app)
 
     return app
@@ -1,8 +1,11 @@
 import os
 import json
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify
 from app.utils import remove_dir
+from app import design_cache, executor, registry
+from app.edb_service import close_job
+from app.executor import cancel
 from .routes import (
     login_required,
     admin_required,
@@ -10,6 +13,7 @@ from .routes import (
     JOB_DIR,
     load_flows,
     load_jobs,
+    page_args,
     save_users,
     GROUPS,
     save_groups,
@@ -21,7 +25,22 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 @login_required
 @admin_required
 def dashboard():
-    return render_template('admin_dashboard.html')
+    return render_template('admin_dashboard.html', cache_stats=design_cache.stats(),
+                           node_stats=executor.status())
+
+
+@admin_bp.route('/api/design-cache')
+@login_required
+@admin_required
+def design_cache_stats():
+    return jsonify(design_cache.stats())
+
+
+@admin_bp.route('/api/nodes')
+@login_required
+@admin_required
+def node_stats():
+    return jsonify(executor.status())
 
 
 @admin_bp.route('/users', methods=['GET', 'POST'])
@@ -53,8 +72,10 @@ def delete_user(username):
 @login_required
 @admin_required
 def jobs():
-    jobs_list = load_jobs()
-    return render_template('jobs_info.html', jobs=jobs_list)
+    page, limit, offset = page_args(per_page=200)
+    jobs_list = load_jobs(limit=limit, offset=offset)
+    pages = max(1, -(-registry.count_jobs() // limit))
+    return render_template('jobs_info.html', jobs=jobs_list, page=page, pages=pages)
 
 
 @admin_bp.route('/jobs/delete/<job_id>', methods=['POST'])
@@ -62,8 +83,10 @@ def jobs():
 @admin_required
 def delete_job(job_id):
     job_path = os.path.join(JOB_DIR, job_id)
-    if os.path.isdir(job_path):
+    if os.path.isdir(job_path) and cancel(job_id):
+        close_job(job_id)
         remove_dir(job_path)
+        registry.remove(job_id)
     return redirect(url_for('admin.jobs'))
 
 
@@ -0,0 +1,345 @@
+"""Zip archives of job directories.
+
+Archives are produced as a stream of byte chunks, so they can be written
+to disk or sent straight to an HTTP response without materialising the zip
+first.  Entries use data descriptors and ZIP64 records where needed, so
+neither the sizes nor the CRC have to be known before a file is read.
+
+Deflate runs on a thread pool in the style of ``pigz``: every file is cut
+into ``BLOCK_SIZE`` blocks which are compressed independently (primed with
+the previous 32 KiB as dictionary) and concatenated in order.  All blocks but
+the last end with a sync flush, so the result is one valid deflate stream.
+zlib releases the GIL while compressing, so the threads really run in
+parallel.
+
+:func:`write_archive` stores a manifest hash of the source tree next to
+the zip and skips the work when the tree has not changed since.
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 1024 * 1024
+WINDOW_SIZE = 32 * 1024
+
+# Name -> zlib level; None means stored without compression
+LEVELS = {'store': None, 'fast': 1, 'default': 6, 'best': 9}
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# Deflate may grow incompressible data slightly; switch to ZIP64 early
+_DEFLATE_SLACK = 1 / 64
+
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+_pools = {}
+
+
+def default_threads():
+    """Thread count from ``ARCHIVE_THREADS`` or the number of CPUs."""
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context() and current_app.config.get('ARCHIVE_THREADS'):
+            return int(current_app.config['ARCHIVE_THREADS'])
+    except ImportError:
+        pass
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _pool(threads):
+    pool = _pools.get(threads)
+    if pool is None:
+        pool = _pools.setdefault(
+            threads, ThreadPoolExecutor(max_workers=threads, thread_name_prefix='archive'))
+    return pool
+
+
+class _Entry:
+    __slots__ = ('path', 'arcname', 'size', 'mode', 'dos_time', 'dos_date', 'mtime_ns')
+
+    def __init__(self, path, arcname, st):
+        self.path = path
+        self.arcname = arcname.replace(os.sep, '/').encode('utf-8')
+        self.size = st.st_size
+        self.mode = st.st_mode
+        self.mtime_ns = st.st_mtime_ns
+        t = time.localtime(max(st.st_mtime, 315532800))  # zip dates start in 1980
+        self.dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        self.dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def collect_entries(src_dir, skip=()):
+    """Return the files below ``src_dir``, named relative to its parent.
+
+    Directories listed in ``skip`` (absolute paths) are left out.
+    """
+    base = os.path.dirname(os.path.normpath(src_dir))
+    skip = {os.path.normpath(path) for path in skip}
+    entries = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) not in skip)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append(_Entry(path, os.path.relpath(path, base), st))
+    return entries
+
+
+def file_entry(path, arcname):
+    """The entry of a single file stored as ``arcname``."""
+    return _Entry(path, arcname, os.stat(path))
+
+
+def manifest_hash(entries, level):
+    """Hash of the entry names, sizes and mtimes plus the compression level."""
+    digest = hashlib.sha256(str(level).encode())
+    for entry in entries:
+        digest.update(entry.arcname)
+        digest.update(struct.pack('<QQ', entry.size, entry.mtime_ns))
+    return digest.hexdigest()
+
+
+def _needs_zip64(entry, method):
+    size = entry.size if method == 0 else entry.size * (1 + _DEFLATE_SLACK) + 1024
+    return size >= ZIP64_LIMIT
+
+
+def _local_header(entry, method, zip64):
+    extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+    return struct.pack(
+        '<IHHHHHIIIHH', 0x04034B50,
+        45 if zip64 else 20, _FLAG_DESCRIPTOR | _FLAG_UTF8, method,
+        entry.dos_time, entry.dos_date, 0,
+        ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0,
+        len(entry.arcname), len(extra),
+    ) + entry.arcname + extra
+
+
+def _descriptor(crc, csize, usize, zip64):
+    if zip64:
+        return struct.pack('<IIQQ', 0x08074B50, crc, csize, usize)
+    return struct.pack('<IIII', 0x08074B50, crc, csize, usize)
+
+
+def _central_header(entry, method, crc, csize, usize, offset):
+    zip64_fields = []
+    if usize >= ZIP64_LIMIT:
+        zip64_fields.append(usize)
+        usize = ZIP64_LIMIT
+    if csize >= ZIP64_LIMIT:
+        zip64_fields.append(csize)
+        csize = ZIP64_LIMIT
+    if offset >= ZIP64_LIMIT:
+        zip64_fields.append(offset)
+        offset = ZIP64_LIMIT
+    extra = b''
+    if zip64_fields:
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields)
+    version = 45 if extra else 20
+    return struct.pack(
+        '<IHHHHHHIIIHHHHHII', 0x02014B50,
+        (3 << 8) | version, version, _FLAG_DESCRIPTOR | _FLAG_UTF8, method,
+        entry.dos_time, entry.dos_date, crc, csize, usize,
+        len(entry.arcname), len(extra), 0, 0, 0, (entry.mode & 0xFFFF) << 16, offset,
+    ) + entry.arcname + extra
+
+
+def _end_records(count, cd_offset, cd_size):
+    out = b''
+    if count >= ZIP64_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        out += struct.pack('<IQHHIIQQQQ', 0x06064B50, 44, 45, 45, 0, 0,
+                           count, count, cd_size, cd_offset)
+        out += struct.pack('<IIQI', 0x07064B50, 0, zip64_offset, 1)
+        count = min(count, ZIP64_COUNT_LIMIT)
+        cd_offset = min(cd_offset, ZIP64_LIMIT)
+        cd_size = min(cd_size, ZIP64_LIMIT)
+    return out + struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+def _compress_block(data, zdict, level, last):
+    if zdict:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return comp.compress(data) + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _blocks(entry):
+    """Yield ``(data, zdict, last)`` for each block of a file."""
+    with open(entry.path, 'rb') as fh:
+        data = fh.read(BLOCK_SIZE)
+        zdict = b''
+        while True:
+            following = fh.read(BLOCK_SIZE) if data else b''
+            last = not following
+            yield data, zdict, last
+            if last:
+                return
+            zdict = data[-WINDOW_SIZE:]
+            data = following
+
+
+def _stored_chunks(entries):
+    for entry in entries:
+        # Read no more than the size in the entry, which archive_size relies on
+        remaining = entry.size
+        with open(entry.path, 'rb') as fh:
+            data = fh.read(min(BLOCK_SIZE, remaining))
+            yield entry, data, data  # an empty file still yields one chunk
+            remaining -= len(data)
+            while remaining > 0:
+                data = fh.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield entry, data, data
+
+
+def _deflated_chunks(entries, level, threads):
+    """Yield ``(entry, raw, compressed)`` per block, compressing ahead on threads."""
+    pool = _pool(threads)
+    pending = deque()
+
+    def submit():
+        for entry in entries:
+            for data, zdict, last in _blocks(entry):
+                yield entry, data, pool.submit(_compress_block, data, zdict, level, last)
+
+    for item in submit():
+        pending.append(item)
+        # Bound the blocks held in memory to a few per thread
+        while len(pending) > threads * 2:
+            entry, data, future = pending.popleft()
+            yield entry, data, future.result()
+    while pending:
+        entry, data, future = pending.popleft()
+        yield entry, data, future.result()
+
+
+def iter_zip(entries, level='fast', threads=None):
+    """Yield the bytes of a zip archive holding ``entries``."""
+    compress_level = LEVELS[level]
+    method = 0 if compress_level is None else 8
+    if method == 0:
+        chunks = _stored_chunks(entries)
+    else:
+        chunks = _deflated_chunks(entries, compress_level, threads or default_threads())
+
+    offset = 0
+    central = []
+    current = None
+    crc = csize = usize = start = 0
+    zip64 = False
+    for entry, raw, data in chunks:
+        if entry is not current:
+            if current is not None:
+                central.append(_central_header(current, method, crc, csize, usize, start))
+                out = _descriptor(crc, csize, usize, zip64)
+                offset += len(out)
+                yield out
+            current = entry
+            crc = csize = usize = 0
+            start = offset
+            zip64 = _needs_zip64(entry, method)
+            out = _local_header(entry, method, zip64)
+            offset += len(out)
+            yield out
+        crc = zlib.crc32(raw, crc)
+        csize += len(data)
+        usize += len(raw)
+        offset += len(data)
+        if data:
+            yield data
+    if current is not None:
+        central.append(_central_header(current, method, crc, csize, usize, start))
+        out = _descriptor(crc, csize, usize, zip64)
+        offset += len(out)
+        yield out
+
+    cd = b''.join(central)
+    yield cd + _end_records(len(central), offset, len(cd))
+
+
+def archive_size(entries):
+    """Exact size of the stored (``level='store'``) archive of ``entries``."""
+    total = 0
+    central = 0
+    for entry in entries:
+        zip64 = _needs_zip64(entry, 0)
+        offset = total
+        total += len(_local_header(entry, 0, zip64)) + entry.size
+        total += len(_descriptor(0, entry.size, entry.size, zip64))
+        central += len(_central_header(entry, 0, 0, entry.size, entry.size, offset))
+    return total + central + len(_end_records(len(entries), total, central))
+
+
+def stream_archive(src_dir, level='fast', threads=None):
+    """Generator of the zip bytes of ``src_dir`` for an HTTP response."""
+    return iter_zip(collect_entries(src_dir), level, threads)
+
+
+def archive_cache_path(job_path, subpath, level):
+    """Where a materialised archive of ``job_path/subpath`` is kept."""
+    slug = subpath.strip('/').replace('/', '__') or 'job'
+    return os.path.join(job_path, 'cache', 'archives', f'{slug}.{level}.zip')
+
+
+def _manifest_path(zip_path):
+    return f'{zip_path}.manifest.json'
+
+
+def read_manifest(zip_path):
+    """The manifest written next to ``zip_path``, or None."""
+    try:
+        with open(_manifest_path(zip_path)) as fp:
+            return json.load(fp)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+
+def is_current(src_dir, zip_path):
+    """True when ``zip_path`` was written by :func:`write_archive` from the current tree."""
+    manifest = read_manifest(zip_path)
+    if manifest is None or not os.path.isfile(zip_path):
+        return False
+    entries = collect_entries(src_dir, manifest.get('skip', ()))
+    return manifest.get('hash') == manifest_hash(entries, manifest.get('level'))
+
+
+def write_entries(entries, zip_path, level='fast', threads=None, manifest=None):
+    """Zip ``entries`` to ``zip_path`` through a temporary file.
+
+    ``manifest`` is stored next to the zip, with the level and file count.
+    """
+    os.makedirs(os.path.dirname(zip_path) or '.', exist_ok=True)
+    tmp_path = f'{zip_path}.tmp'
+    with open(tmp_path, 'wb') as out:
+        for chunk in iter_zip(entries, level, threads):
+            out.write(chunk)
+    os.replace(tmp_path, zip_path)
+    with open(_manifest_path(zip_path), 'w') as fp:
+        json.dump(dict(manifest or {}, level=level, files=len(entries)), fp)
+
+
+def write_archive(src_dir, zip_path, level='fast', threads=None, skip=()):
+    """Zip ``src_dir`` to ``zip_path`` unless an identical archive exists.
+
+    Returns True when the archive was (re)written.
+    """
+    skip = list(skip)
+    entries = collect_entries(src_dir, skip)
+    digest = manifest_hash(entries, level)
+    if os.path.isfile(zip_path) and (read_manifest(zip_path) or {}).get('hash') == digest:
+        return False
+    write_entries(entries, zip_path, level, threads, {'hash': digest, 'skip': skip})
+    return True
@@ -0,0 +1,428 @@
+"""Headless runs of a flow over many designs.
+
+A manifest names the flow, the designs and the form fields each step
+receives.  Every design becomes a job that runs the flow's steps end to end
+through the same step modules as the step pages::
+
+    {
+      "flow": "Flow_SIwave_SYZ",
+      "name": "nightly",
+      "user": "admin",
+      "workers": 4,
+      "config": {"edb_version": "2024.1"},
+      "steps": {
+        "step_01": {"unit": "mm", "show_layout": false},
+        "step_02": {"xlsx_file": {"file": "stackup.xlsx"}},
+        "step_03": {"new_RES_0402": "RES_0402_X"},
+        "step_04": {"val_CAP_0402": "100nF"},
+        "step_05": {"import_SIG1": "on", "import_GND": "on", "pwr_GND": "on"}
+      },
+      "designs": [
+        {"file": "boards/a.brd"},
+        {"file": "boards/b.zip", "topic": "B rev2", "steps": {"step_05": {"import_SIG2": "on"}}}
+      ]
+    }
+
+Field values are strings, lists of strings or booleans (checkboxes);
+``{"file": path}`` uploads a file in that field and ``"action": "pass"``
+skips the step.  A design's ``steps`` entry adds to, and overrides, the
+fields of the manifest.  Relative paths are resolved against the manifest's
+folder (or ``base_dir`` for manifests posted to the API).  ``last_step``
+stops every job after that step.
+
+Up to ``workers`` designs (``BATCH_WORKERS`` by default) are in flight at
+once.  Their steps go through the step queue as ``batch`` steps, so they
+share license tokens and nodes with interactive work at a lower priority
+(see :mod:`app.scheduler`).  The report is written to
+``jobs/.batches/<id>/report.json`` as designs finish, with the status,
+duration and queue wait of every step and a summary of failures.
+
+Run a manifest from the command line with::
+
+    python -m app.batch manifest.json [--workers 4] [--report report.json]
+
+or ``POST`` it to ``/api/batches`` as an admin and poll
+``/api/batches/<id>``.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+from werkzeug.datastructures import MultiDict
+
+from app import flow_registry
+from app.executor import StepTask, submit_step, wait_step
+from app.utils import clone_file, load_metadata, update_metadata
+from app.workspace import snapshot_step
+from .routes import JOB_DIR, USERS, admin_required, advance_step, create_job, current_user
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api/batches')
+
+DEFAULT_WORKERS = 2
+
+
+def init_app(app):
+    app.config.setdefault('BATCH_WORKERS', DEFAULT_WORKERS)
+
+
+class ManifestError(ValueError):
+    """The manifest is malformed or refers to missing files."""
+
+
+def batch_dir(batch_id=None):
+    path = os.path.join(JOB_DIR, '.batches')
+    return os.path.join(path, batch_id) if batch_id else path
+
+
+def _resolve_fields(fields, base_dir, where):
+    if not isinstance(fields, dict):
+        raise ManifestError(f'{where} must be an object of form fields')
+    resolved = {}
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            path = os.path.join(base_dir, str(value.get('file', '')))
+            if not value.get('file') or not os.path.isfile(path):
+                raise ManifestError(f'{where}.{name}: file not found: {value.get("file")}')
+            value = {'file': os.path.abspath(path)}
+        elif not isinstance(value, (str, bool, int, float, list)):
+            raise ManifestError(f'{where}.{name}: unsupported value')
+        resolved[name] = value
+    return resolved
+
+
+def load_manifest(manifest, base_dir):
+    """Validate ``manifest`` and resolve its paths; returns a batch description."""
+    if not isinstance(manifest, dict):
+        raise ManifestError('The manifest must be a JSON object')
+    flow_id = manifest.get('flow')
+    if flow_registry.get_flow(flow_id) is None:
+        raise ManifestError(f'Unknown flow: {flow_id}')
+    flow_steps = flow_registry.steps(flow_id)
+    steps = list(flow_steps)
+    last_step = manifest.get('last_step')
+    if last_step:
+        if last_step not in flow_steps:
+            raise ManifestError(f'Unknown last_step: {last_step}')
+        steps = steps[:steps.index(last_step) + 1]
+
+    defaults = manifest.get('steps') or {}
+    for step in defaults:
+        if step not in flow_steps:
+            raise ManifestError(f'Unknown step in steps: {step}')
+    designs = []
+    for index, design in enumerate(manifest.get('designs') or []):
+        if isinstance(design, str):
+            design = {'file': design}
+        path = os.path.join(base_dir, str(design.get('file', '')))
+        if not design.get('file') or not os.path.isfile(path):
+            raise ManifestError(f'designs[{index}]: file not found: {design.get("file")}')
+        own = design.get('steps') or {}
+        fields = {}
+        for step in steps:
+            merged = dict(defaults.get(step) or {})
+            merged.update(own.get(step) or {})
+            fields[step] = _resolve_fields(merged, base_dir, f'designs[{index}].steps.{step}')
+        designs.append({
+            'file': os.path.abspath(path),
+            'topic': design.get('topic') or os.path.basename(path),
+            'steps': fields,
+        })
+    if not designs:
+        raise ManifestError('The manifest lists no designs')
+
+    user = manifest.get('user') or 'admin'
+    if user not in USERS:
+        raise ManifestError(f'Unknown user: {user}')
+    config = dict(USERS[user].get('config') or {})
+    config.update(manifest.get('config') or {})
+    return {
+        'id': f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        'name': manifest.get('name') or '',
+        'flow': flow_id,
+        'first_step': flow_steps[0],
+        'steps': steps,
+        'user': user,
+        'config': config,
+        'workers': manifest.get('workers'),
+        'designs': designs,
+    }
+
+
+def _step_input(fields, job_path):
+    """Form data and staged files, as ``run_step`` would build them.
+
+    Files are staged in the job folder, like uploads, so any node can read them.
+    """
+    data = MultiDict()
+    staged = {}
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            filename = os.path.basename(value['file'])
+            path = os.path.join(job_path, 'tmp', 'uploads', name, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            clone_file(value['file'], path)
+            staged.setdefault(name, []).append((filename, path, None))
+        elif isinstance(value, bool):
+            if value:
+                data.add(name, 'on')
+        elif isinstance(value, list):
+            for item in value:
+                data.add(name, str(item))
+        else:
+            data.add(name, str(value))
+    return data, staged
+
+
+def _run_step(batch, job_path, step, data, staged):
+    """Run one step of a job; returns ``(status, error, seconds queued)``."""
+    flow_id = batch['flow']
+    module = flow_registry.load_step(flow_id, step)
+    if data.get('action') == 'pass' or module is None or not hasattr(module, 'run'):
+        snapshot_step(job_path, step, writes=())
+        update_metadata(job_path, **advance_step(flow_id, step, data))
+        return 'skipped', None, 0
+    snapshot_step(job_path, step, writes=flow_registry.step_writes(flow_id, step))
+    task = StepTask(
+        job_path,
+        step,
+        module.run,
+        data=data,
+        files=staged,
+        config=batch['config'],
+        user=batch['user'],
+        on_success=lambda: advance_step(flow_id, step, data),
+        flow_id=flow_id,
+        memoize=True,
+        origin='batch',
+    )
+    if not submit_step(task):
+        return 'failed', 'The job already has a step in progress', 0
+    wait_step(task.job_id)
+    meta = load_metadata(job_path)
+    waited = round((meta.get('started_at') or task.queued_at) - task.queued_at, 3)
+    if meta.get('status') == 'done':
+        return 'done', None, waited
+    return 'failed', meta.get('error') or 'The step did not finish', waited
+
+
+def run_design(batch, design):
+    """Create a job for ``design`` and run the batch steps; returns its result."""
+    started = time.monotonic()
+    result = {
+        'file': design['file'],
+        'topic': design['topic'],
+        'job_id': None,
+        'status': 'running',
+        'failed_step': None,
+        'error': None,
+        'steps': {},
+    }
+    step = 'setup'
+    try:
+        job_id, job_path = create_job(batch['flow'], batch['user'], design['topic'], batch=batch['id'])
+        result['job_id'] = job_id
+        input_dir = os.path.join(job_path, 'input')
+        os.makedirs(input_dir, exist_ok=True)
+        filename = os.path.basename(design['file'])
+        clone_file(design['file'], os.path.join(input_dir, filename))
+        for step in batch['steps']:
+            data, staged = _step_input(design['steps'].get(step, {}), job_path)
+            if step == batch['first_step']:
+                data['uploaded_file'] = filename
+            step_started = time.monotonic()
+            status, error, waited = _run_step(batch, job_path, step, data, staged)
+            result['steps'][step] = {
+                'status': status,
+                'seconds': round(time.monotonic() - step_started, 3),
+                'waited': waited,
+            }
+            if status == 'failed':
+                result['steps'][step]['error'] = error
+                result.update(status='failed', failed_step=step, error=error)
+                break
+        else:
+            result['status'] = 'done'
+    except Exception as e:
+        result.update(status='failed', failed_step=step, error=str(e) or e.__class__.__name__)
+    result['seconds'] = round(time.monotonic() - started, 3)
+    return result
+
+
+def summarize(designs):
+    """Counts, per-step timings and failures of the design results."""
+    counts = {}
+    steps = {}
+    failures = []
+    for design in designs:
+        counts[design['status']] = counts.get(design['status'], 0) + 1
+        for step, info in design.get('steps', {}).items():
+            stats = steps.setdefault(step, {'runs': 0, 'failed': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                            'total_waited': 0.0})
+            stats['runs'] += 1
+            stats['failed'] += info['status'] == 'failed'
+            stats['total_seconds'] += info['seconds']
+            stats['max_seconds'] = max(stats['max_seconds'], info['seconds'])
+            stats['total_waited'] += info.get('waited', 0)
+        if design['status'] == 'failed':
+            failures.append({key: design[key] for key in ('file', 'job_id', 'failed_step', 'error')})
+    for stats in steps.values():
+        stats['mean_seconds'] = round(stats['total_seconds'] / stats['runs'], 3)
+        stats['total_seconds'] = round(stats['total_seconds'], 3)
+        stats['mean_waited'] = round(stats.pop('total_waited') / stats['runs'], 3)
+    return {'designs': len(designs), 'counts': counts, 'steps': steps, 'failures': failures}
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp, indent=2)
+    os.replace(tmp_path, path)
+
+
+def report_path(batch_id):
+    return os.path.join(batch_dir(batch_id), 'report.json')
+
+
+def load_report(batch_id):
+    try:
+        with open(report_path(batch_id)) as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def start_report(batch, workers):
+    """Store the manifest and a report with every design pending; returns the report."""
+    _write_json(os.path.join(batch_dir(batch['id']), 'manifest.json'), batch)
+    pending = [{'file': d['file'], 'topic': d['topic'], 'job_id': None, 'status': 'pending', 'steps': {}}
+               for d in batch['designs']]
+    report = {
+        'id': batch['id'],
+        'name': batch['name'],
+        'flow': batch['flow'],
+        'user': batch['user'],
+        'workers': workers,
+        'status': 'running',
+        'started_at': time.time(),
+        'finished_at': None,
+        'designs': pending,
+        'summary': summarize(pending),
+    }
+    _write_json(report_path(batch['id']), report)
+    return report
+
+
+def run_batch(batch, app, workers=None, report=None):
+    """Run every design of ``batch`` and return the final report."""
+    workers = int(workers or batch.get('workers') or app.config.get('BATCH_WORKERS', DEFAULT_WORKERS))
+    if report is None:
+        report = start_report(batch, workers)
+    path = report_path(batch['id'])
+
+    def run_in_app(design):
+        with app.app_context():
+            return run_design(batch, design)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f'batch-{batch["id"]}') as pool:
+        futures = {pool.submit(run_in_app, design): index for index, design in enumerate(batch['designs'])}
+        for future in as_completed(futures):
+            report['designs'][futures[future]] = future.result()
+            report['summary'] = summarize(report['designs'])
+            _write_json(path, report)
+    report['status'] = 'finished'
+    report['finished_at'] = time.time()
+    _write_json(path, report)
+    return report
+
+
+@batch_bp.route('', methods=['POST'])
+@admin_required
+def create_batch():
+    """Start a batch from a JSON manifest; returns its id and report URL."""
+    manifest = request.get_json(silent=True)
+    if isinstance(manifest, dict) and not manifest.get('user'):
+        manifest['user'] = current_user()['username']
+    try:
+        batch = load_manifest(manifest, (manifest or {}).get('base_dir') or os.getcwd())
+    except ManifestError as e:
+        return jsonify({'error': str(e)}), 400
+    app = current_app._get_current_object()
+    workers = int(batch.get('workers') or app.config['BATCH_WORKERS'])
+    report = start_report(batch, workers)
+    threading.Thread(target=run_batch, args=(batch, app, workers, report), name=f'batch-{batch["id"]}', daemon=True).start()
+    return jsonify({
+        'id': batch['id'],
+        'designs': len(batch['designs']),
+        'report': url_for('batch.batch_report', batch_id=batch['id']),
+    }), 202
+
+
+@batch_bp.route('', methods=['GET'])
+@admin_required
+def list_batches():
+    batches = []
+    root = batch_dir()
+    for batch_id in sorted(os.listdir(root), reverse=True) if os.path.isdir(root) else []:
+        report = load_report(batch_id)
+        if report:
+            entry = {key: report.get(key) for key in
+                     ('id', 'name', 'flow', 'user', 'status', 'started_at', 'finished_at')}
+            entry['counts'] = report['summary']['counts']
+            batches.append(entry)
+    return jsonify({'batches': batches})
+
+
+@batch_bp.route('/<batch_id>')
+@admin_required
+def batch_report(batch_id):
+    report = load_report(os.path.basename(batch_id))
+    if report is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(report)
+
+
+def _print_report(report):
+    summary = report['summary']
+    print(f"Batch {report['id']}: {summary['designs']} designs, "
+          + ', '.join(f'{n} {status}' for status, n in sorted(summary['counts'].items())))
+    print(f"{'step':<12}{'runs':>6}{'failed':>8}{'mean s':>10}{'max s':>10}{'queued s':>10}")
+    for step, stats in summary['steps'].items():
+        print(f"{step:<12}{stats['runs']:>6}{stats['failed']:>8}"
+              f"{stats['mean_seconds']:>10.2f}{stats['max_seconds']:>10.2f}{stats['mean_waited']:>10.2f}")
+    for failure in summary['failures']:
+        print(f"FAILED {failure['file']} at {failure['failed_step']}: {failure['error']}")
+    print(f'Report: {report_path(report["id"])}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.batch',
+                                     description='Run a flow headless over the designs of a manifest.')
+    parser.add_argument('manifest', help='path to the JSON manifest')
+    parser.add_argument('--workers', type=int, help='designs run at the same time')
+    parser.add_argument('--report', help='also write the report to this path')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    app = create_app()
+    try:
+        with open(args.manifest) as fp:
+            manifest = json.load(fp)
+        batch = load_manifest(manifest, os.path.dirname(os.path.abspath(args.manifest)))
+    except (OSError, json.JSONDecodeError, ManifestError) as e:
+        parser.error(str(e))
+    report = run_batch(batch, app, workers=args.workers)
+    if args.report:
+        _write_json(os.path.abspath(args.report), report)
+    _print_report(report)
+    return 1 if report['summary']['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
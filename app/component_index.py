@@ -0,0 +1,78 @@
+"""Component lookups over an open EDB, built once per handle.
+
+``edb.components.components`` and ``edb.component_defs`` are rebuilt by
+pyedb on every access and can hold tens of thousands of entries.  The index
+reads both once and keeps part name -> component definition, part name ->
+component instances and type -> part names, so renaming parts or setting
+values costs one lookup per change.  It is cached per EDB handle (see
+:func:`component_index`); operations that change components must do so
+through the index, or call :func:`invalidate`, to keep it in step with the
+design.
+"""
+import threading
+import weakref
+from collections import defaultdict
+
+_lock = threading.Lock()
+_indexes = weakref.WeakKeyDictionary()
+
+
+class ComponentIndex:
+    def __init__(self, edb):
+        self.defs = {comp_def.GetName(): comp_def for comp_def in edb.component_defs}
+        self.instances = defaultdict(list)
+        self.parts_by_type = defaultdict(set)
+        for comp in edb.components.components.values():
+            self.instances[comp.part_name].append(comp)
+            self.parts_by_type[comp.type].add(comp.part_name)
+
+    def value(self, part_name):
+        """Value of the first instance of a part, or None."""
+        comps = self.instances.get(part_name)
+        return comps[0].value if comps else None
+
+    def part_values(self):
+        return {part_name: comps[0].value for part_name, comps in self.instances.items()}
+
+    def rename(self, old_name, new_name):
+        """Rename the definition of a placed part once; returns True if renamed.
+
+        A rename onto the name of another definition is refused, since it
+        would merge two parts.
+        """
+        comp_def = self.defs.get(old_name)
+        if comp_def is None or old_name not in self.instances or new_name in self.defs:
+            return False
+        comp_def.SetName(new_name)
+        self.defs[new_name] = self.defs.pop(old_name)
+        comps = self.instances.pop(old_name)
+        self.instances[new_name].extend(comps)
+        for parts in self.parts_by_type.values():
+            if old_name in parts:
+                parts.discard(old_name)
+                parts.add(new_name)
+        return True
+
+    def set_value(self, part_name, value):
+        """Set the value of every instance of a part; returns True if any changed."""
+        changed = False
+        for comp in self.instances.get(part_name, ()):
+            if comp.value != value:
+                comp.value = value
+                changed = True
+        return changed
+
+
+def component_index(edb):
+    """The index of an open EDB, building it on first use."""
+    with _lock:
+        index = _indexes.get(edb)
+        if index is None:
+            index = _indexes[edb] = ComponentIndex(edb)
+        return index
+
+
+def invalidate(edb):
+    """Forget the index of ``edb`` after its components changed elsewhere."""
+    with _lock:
+        _indexes.pop(edb, None)
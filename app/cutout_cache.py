@@ -0,0 +1,108 @@
+"""Per-job cache of Step 5 cutouts.
+
+A cutout only depends on the design and the cutout parameters, so each one
+is kept under a key made of the design hash, the signal and reference nets
+and the extent options::
+
+    jobs/<id>/cache/cutouts/<key>/entry.json
+    jobs/<id>/cache/cutouts/<key>/cutout.aedb/...
+
+Submitting a selection that was cut before links the cached cutout into
+``output/`` instead of running pyedb again.  Entries are never modified
+after they are stored, so the output copies are hard links (see
+``REPLACED_DIRS`` in :mod:`app.workspace`).  At most ``CUTOUT_CACHE_ENTRIES``
+entries are kept per job; the least recently used are removed first.
+"""
+import hashlib
+import json
+import os
+import time
+
+from app.utils import clone_tree, remove_dir
+
+ENTRY_VERSION = 1
+
+_settings = {'max_entries': 8}
+
+
+def init_app(app):
+    app.config.setdefault('CUTOUT_CACHE_ENTRIES', 8)
+    _settings['max_entries'] = int(app.config['CUTOUT_CACHE_ENTRIES'])
+
+
+def cache_root(job_path):
+    return os.path.join(job_path, 'cache', 'cutouts')
+
+
+def cutout_key(design_hash, signal_nets, reference_nets, options):
+    """Cache key of a cutout; the order of the nets does not matter."""
+    data = {
+        'version': ENTRY_VERSION,
+        'design': design_hash,
+        'signal': sorted(signal_nets),
+        'reference': sorted(reference_nets),
+        'options': options,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def entry_path(job_path, key):
+    """Where the cutout of ``key`` is (or is to be) written."""
+    return os.path.join(cache_root(job_path), key, 'cutout.aedb')
+
+
+def lookup(job_path, key):
+    """True if the cutout of ``key`` is cached; marks it as recently used."""
+    entry = os.path.join(cache_root(job_path), key, 'entry.json')
+    if not (os.path.isfile(entry) and os.path.isdir(entry_path(job_path, key))):
+        return False
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    return True
+
+
+def store(job_path, key, info):
+    """Record a cutout written to :func:`entry_path`."""
+    entry = os.path.join(cache_root(job_path), key, 'entry.json')
+    tmp_path = f'{entry}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(dict(info, key=key, created_at=time.time()), fp)
+    os.replace(tmp_path, entry)
+
+
+def materialize(job_path, key, target):
+    """Replace ``target`` with the cached cutout of ``key``."""
+    remove_dir(target)
+    clone_tree(entry_path(job_path, key), target, link=True)
+
+
+def discard(job_path, key):
+    remove_dir(os.path.join(cache_root(job_path), key))
+
+
+def prune(job_path, keep=(), max_entries=None):
+    """Remove the least recently used entries beyond ``max_entries``.
+
+    Call it once no cutout of the job is being written; entries in
+    ``keep`` are never removed.
+    """
+    max_entries = _settings['max_entries'] if max_entries is None else max_entries
+    root = cache_root(job_path)
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    entries = []
+    for name in names:
+        try:
+            used = os.path.getmtime(os.path.join(root, name, 'entry.json'))
+        except OSError:
+            # Unfinished or broken entry
+            used = 0
+        entries.append((used, name))
+    entries.sort(reverse=True)
+    for used, name in entries[max(0, max_entries):]:
+        if name not in keep:
+            remove_dir(os.path.join(root, name))
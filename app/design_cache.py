@@ -0,0 +1,208 @@
+"""Content-addressed cache of converted designs.
+
+Step 1 turns an uploaded ``.brd`` or zipped AEDB into ``design.aedb``,
+``stackup.xlsx`` and optionally the layer images.  The result only depends
+on the uploaded bytes, the EDB version, the stackup unit and whether layers
+are plotted, so it is stored once under a key made of those and copied into
+later jobs that upload the same file::
+
+    <DESIGN_CACHE_DIR>/<key>/entry.json
+    <DESIGN_CACHE_DIR>/<key>/output/design.aedb/...
+    <DESIGN_CACHE_DIR>/<key>/output/stackup.xlsx
+    <DESIGN_CACHE_DIR>/<key>/cache/design_snapshot.json
+
+Files are materialised with reflinks where the filesystem supports them.
+Files the steps modify in place are otherwise copied; the layer tiles,
+which are only ever replaced, are hard linked.  The cache is bounded by
+``DESIGN_CACHE_MAX_BYTES`` and evicts the least recently used entries.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from app.utils import clone_file, clone_tree, remove_dir, tree_size
+
+ENTRY_VERSION = 1
+# Output artifacts kept per entry, relative to the job folder
+ARTIFACTS = ('output/design.aedb', 'output/stackup.xlsx', 'output/tiles', 'cache/design_snapshot.json')
+LINKABLE = ('output/tiles',)
+
+_lock = threading.Lock()
+_settings = {
+    'root': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jobs', '.design_cache'),
+    'max_bytes': 20 * 1024 ** 3,
+}
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def init_app(app):
+    app.config.setdefault('DESIGN_CACHE_DIR', _settings['root'])
+    app.config.setdefault('DESIGN_CACHE_MAX_BYTES', _settings['max_bytes'])
+    _settings['root'] = app.config['DESIGN_CACHE_DIR']
+    _settings['max_bytes'] = int(app.config['DESIGN_CACHE_MAX_BYTES'])
+    os.makedirs(_settings['root'], exist_ok=True)
+    _load_stats()
+
+
+def cache_key(file_hash, edb_version, unit, show_layout):
+    raw = f'{ENTRY_VERSION}|{file_hash}|{edb_version}|{unit}|{int(bool(show_layout))}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _entry_dir(key):
+    return os.path.join(_settings['root'], key)
+
+
+def _read_entry(key):
+    try:
+        with open(os.path.join(_entry_dir(key), 'entry.json')) as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp)
+    os.replace(tmp_path, path)
+
+
+def _stats_path():
+    return os.path.join(_settings['root'], 'stats.json')
+
+
+def _load_stats():
+    try:
+        with open(_stats_path()) as fp:
+            saved = json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return
+    with _lock:
+        for name in _stats:
+            _stats[name] = int(saved.get(name, 0))
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+        snapshot = dict(_stats)
+    try:
+        _write_json(_stats_path(), snapshot)
+    except OSError:
+        pass
+
+
+def stats():
+    """Hit/miss counters plus the current size of the cache."""
+    entries = _entries()
+    with _lock:
+        result = dict(_stats)
+    result['entries'] = len(entries)
+    result['bytes'] = sum(entry.get('size', 0) for entry in entries)
+    result['max_bytes'] = _settings['max_bytes']
+    lookups = result['hits'] + result['misses']
+    result['hit_rate'] = result['hits'] / lookups if lookups else None
+    return result
+
+
+def materialize(key, job_path):
+    """Copy a cached conversion into ``job_path``; returns False on a miss."""
+    entry = _read_entry(key)
+    if entry is None:
+        _count('misses')
+        return False
+    src_root = _entry_dir(key)
+    for rel in entry.get('artifacts', []) + entry.get('images', []):
+        src = os.path.join(src_root, rel)
+        dst = os.path.join(job_path, rel)
+        link = rel in LINKABLE
+        if os.path.isdir(src):
+            remove_dir(dst)
+            clone_tree(src, dst, link=link)
+        elif os.path.isfile(src):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.isfile(dst):
+                os.remove(dst)
+            clone_file(src, dst, link=link)
+    entry['last_used'] = time.time()
+    try:
+        _write_json(os.path.join(src_root, 'entry.json'), entry)
+    except OSError:
+        pass
+    _count('hits')
+    return True
+
+
+def store(key, job_path):
+    """Add the Step 1 outputs of ``job_path`` to the cache under ``key``."""
+    if _read_entry(key) is not None:
+        return
+    output_dir = os.path.join(job_path, 'output')
+    images = sorted(
+        f'output/{name}' for name in os.listdir(output_dir)
+        if name.lower().endswith('.png')
+    )
+    tmp_dir = os.path.join(_settings['root'], f'.tmp-{uuid.uuid4().hex}')
+    artifacts = []
+    try:
+        for rel in ARTIFACTS + tuple(images):
+            src = os.path.join(job_path, rel)
+            dst = os.path.join(tmp_dir, rel)
+            if os.path.isdir(src):
+                clone_tree(src, dst)
+            elif os.path.isfile(src):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                clone_file(src, dst)
+            else:
+                continue
+            if rel not in images:
+                artifacts.append(rel)
+        now = time.time()
+        _write_json(os.path.join(tmp_dir, 'entry.json'), {
+            'version': ENTRY_VERSION,
+            'artifacts': artifacts,
+            'images': images,
+            'size': tree_size(tmp_dir),
+            'created': now,
+            'last_used': now,
+        })
+        os.rename(tmp_dir, _entry_dir(key))
+    except OSError:
+        # Another job stored the same design first, or the disk is full
+        remove_dir(tmp_dir)
+        return
+    _count('stores')
+    evict()
+
+
+def _entries():
+    entries = []
+    root = _settings['root']
+    if not os.path.isdir(root):
+        return entries
+    for key in os.listdir(root):
+        if key.startswith('.') or not os.path.isdir(os.path.join(root, key)):
+            continue
+        entry = _read_entry(key)
+        if entry is not None:
+            entry['key'] = key
+            entries.append(entry)
+    return entries
+
+
+def evict(max_bytes=None):
+    """Remove least recently used entries until the cache fits ``max_bytes``."""
+    max_bytes = _settings['max_bytes'] if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=lambda e: e.get('last_used', 0))
+    total = sum(entry.get('size', 0) for entry in entries)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        remove_dir(_entry_dir(entry['key']))
+        total -= entry.get('size', 0)
+        _count('evictions')
+
@@ -0,0 +1,270 @@
+"""Pure-Python stand-in for ``pyedb.Edb`` (``EDB_BACKEND = 'fake'``).
+
+It implements the part of the pyedb API used by :mod:`app.edb_ops`,
+:mod:`app.snapshot` and :mod:`app.layer_render`, so the EDB worker service
+and the flow can be exercised on machines without Ansys.  A design is kept
+as JSON in ``<name>.aedb/edb.def``::
+
+    {"layers": {"L1": {"type": "signal", "thickness": 3.5e-05, "material": "copper"}, ...},
+     "materials": {"copper": {"conductivity": 5.8e7}, "FR4": {"permittivity": 4.4, "loss_tangent": 0.02}},
+     "components": {"R1": {"type": "Resistor", "part": "RES_0402", "value": "10ohm"}, ...},
+     "nets": ["GND", "VCC", ...]}
+
+Opening a ``.brd`` file reads it as such a JSON document when it is one and
+otherwise generates a small sample board.
+"""
+import json
+import os
+
+SIGNAL_LAYERS = 4
+
+
+def sample_design():
+    """A small board with a few components, nets and a 4-layer stackup."""
+    layers = {}
+    for i in range(SIGNAL_LAYERS):
+        layers[f'L{i + 1}'] = {'type': 'signal', 'thickness': 3.5e-5, 'material': 'copper'}
+        if i + 1 < SIGNAL_LAYERS:
+            layers[f'D{i + 1}'] = {'type': 'dielectric', 'thickness': 1e-4, 'material': 'FR4'}
+    parts = [
+        ('R', 'Resistor', 'RES_0402', '10ohm'),
+        ('C', 'Capacitor', 'CAP_0402', '100nF'),
+        ('L', 'Inductor', 'IND_0603', '1uH'),
+        ('U', 'IC', 'MCU_QFN48', None),
+        ('J', 'IO', 'CONN_10P', None),
+    ]
+    components = {}
+    for prefix, comp_type, part, value in parts:
+        for n in range(1, 4):
+            components[f'{prefix}{n}'] = {'type': comp_type, 'part': part, 'value': value}
+    return {
+        'layers': layers,
+        'materials': {
+            'copper': {'conductivity': 5.8e7},
+            'FR4': {'permittivity': 4.4, 'loss_tangent': 0.02},
+        },
+        'components': components,
+        'nets': ['GND', 'VCC'] + [f'SIG{i}' for i in range(16)],
+    }
+
+
+def _load_brd(path):
+    try:
+        with open(path) as fp:
+            data = json.load(fp)
+        if isinstance(data, dict) and 'layers' in data:
+            return data
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+        pass
+    return sample_design()
+
+
+class Material:
+    def __init__(self, name, data):
+        self.name = name
+        self.conductivity = data.get('conductivity')
+        self.permittivity = data.get('permittivity')
+        self.dielectric_loss_tangent = data.get('loss_tangent')
+
+
+class Materials:
+    def __init__(self, edb):
+        self._edb = edb
+
+    @property
+    def materials(self):
+        return {name: Material(name, data) for name, data in self._edb.data['materials'].items()}
+
+    def add_conductor_material(self, name, conductivity):
+        data = {'conductivity': conductivity}
+        self._edb.data['materials'][name] = data
+        return Material(name, data)
+
+    def add_dielectric_material(self, name, permittivity, dielectric_loss_tangent):
+        data = {'permittivity': permittivity, 'loss_tangent': dielectric_loss_tangent}
+        self._edb.data['materials'][name] = data
+        return Material(name, data)
+
+
+class Layer:
+    def __init__(self, edb, name):
+        self._data = edb.data['layers'][name]
+        self.name = name
+
+    @property
+    def type(self):
+        return self._data['type']
+
+    @property
+    def thickness(self):
+        return self._data['thickness']
+
+    @thickness.setter
+    def thickness(self, value):
+        self._data['thickness'] = float(value)
+
+    @property
+    def material(self):
+        return self._data['material']
+
+    @material.setter
+    def material(self, value):
+        self._data['material'] = value
+
+
+class Stackup:
+    def __init__(self, edb):
+        self._edb = edb
+
+    @property
+    def stackup_layers(self):
+        return {name: Layer(self._edb, name) for name in self._edb.data['layers']}
+
+    @property
+    def signal_layers(self):
+        return {name: layer for name, layer in self.stackup_layers.items() if layer.type == 'signal'}
+
+
+class Component:
+    def __init__(self, edb, refdes):
+        self._data = edb.data['components'][refdes]
+        self.refdes = refdes
+
+    @property
+    def type(self):
+        return self._data['type']
+
+    @property
+    def part_name(self):
+        return self._data['part']
+
+    @property
+    def value(self):
+        return self._data.get('value')
+
+    @value.setter
+    def value(self, value):
+        self._data['value'] = value
+
+
+class Components:
+    def __init__(self, edb):
+        self._edb = edb
+
+    @property
+    def components(self):
+        return {refdes: Component(self._edb, refdes) for refdes in self._edb.data['components']}
+
+
+class ComponentDef:
+    """Mimics the .NET component definition object (``GetName``/``SetName``)."""
+
+    def __init__(self, edb, name):
+        self._edb = edb
+        self._name = name
+
+    def GetName(self):
+        return self._name
+
+    def SetName(self, name):
+        for comp in self._edb.data['components'].values():
+            if comp['part'] == self._name:
+                comp['part'] = name
+        self._name = name
+
+
+class Net:
+    def __init__(self, name):
+        self.name = name
+        self.is_power_ground = name.upper().startswith(('GND', 'VCC', 'VDD'))
+
+
+class Nets:
+    def __init__(self, edb):
+        self._edb = edb
+
+    @property
+    def nets(self):
+        return {name: Net(name) for name in self._edb.data['nets']}
+
+    def plot(self, layers=None, show=False, save_plot=None):
+        raise NotImplementedError('The fake EDB backend only provides geometry through modeler.primitives')
+
+
+class Primitive:
+    def __init__(self, layer_name, net_name, points):
+        self.layer_name = layer_name
+        self.net_name = net_name
+        self._points = points
+        self.voids = []
+
+    def points(self, arc_segments=6):
+        return [p[0] for p in self._points], [p[1] for p in self._points]
+
+
+class Modeler:
+    def __init__(self, edb):
+        self._edb = edb
+
+    @property
+    def primitives(self):
+        """One trace per net on every signal layer, offset by layer."""
+        prims = []
+        layers = list(self._edb.stackup.signal_layers)
+        for i, layer in enumerate(layers):
+            for j, net in enumerate(self._edb.data['nets']):
+                x = j * 1e-3
+                y = i * 2e-4
+                prims.append(Primitive(layer, net, [(x, y), (x + 5e-4, y), (x + 5e-4, y + 1e-2), (x, y + 1e-2)]))
+        return prims
+
+
+class Edb:
+    """Open a ``.aedb`` folder written by this class, or import a ``.brd``."""
+
+    def __init__(self, edbpath=None, edbversion=None, **kwargs):
+        self.edbpath = edbpath
+        self.edbversion = edbversion
+        if edbpath.lower().endswith('.brd'):
+            self.data = _load_brd(edbpath)
+        else:
+            with open(os.path.join(edbpath, 'edb.def')) as fp:
+                self.data = json.load(fp)
+        self.materials = Materials(self)
+        self.stackup = Stackup(self)
+        self.components = Components(self)
+        self.nets = Nets(self)
+        self.modeler = Modeler(self)
+
+    @property
+    def component_defs(self):
+        return [ComponentDef(self, name) for name in sorted({c['part'] for c in self.data['components'].values()})]
+
+    def save(self):
+        self._write(self.edbpath, self.data)
+        return True
+
+    def save_as(self, path):
+        self.edbpath = path
+        return self.save()
+
+    def close_edb(self):
+        return True
+
+    close = close_edb
+
+    def cutout(self, signal_list=None, reference_list=None, extent_type='ConvexHull',
+               output_aedb_path=None, open_cutout_at_end=True, **kwargs):
+        nets = list(signal_list or []) + list(reference_list or [])
+        data = dict(self.data, nets=[net for net in self.data['nets'] if net in nets])
+        self._write(output_aedb_path, data)
+        return True
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(path, exist_ok=True)
+        def_path = os.path.join(path, 'edb.def')
+        tmp_path = f'{def_path}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, def_path)
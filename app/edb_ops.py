@@ -0,0 +1,264 @@
+"""Operations on a job's design, run by the EDB workers.
+
+Every operation is called as ``op(job_path, edb_version, progress, **kwargs)``
+and borrows the job's ``design.aedb`` from :mod:`app.edb_pool`.  Arguments
+and results are plain data so they can cross the process boundary of
+:mod:`app.edb_service`; ``progress(*args)`` is relayed to the caller.
+"""
+import math
+import os
+
+from app.component_index import component_index, invalidate
+from app.edb_pool import adopt, design_dir, edb_session, open_edb
+from app.layer_render import render_layers
+from app.stackup_io import read_stackup, write_stackup
+from app.snapshot import build_snapshot as _build_snapshot, extract_stackup, load_snapshot, update_snapshot
+from app.utils import clone_tree, remove_dir
+
+OPERATIONS = {}
+
+
+def operation(func):
+    OPERATIONS[func.__name__] = func
+    return func
+
+
+def run(name, job_path, edb_version, kwargs=None, progress=None):
+    """Run the operation ``name`` and return its result."""
+    func = OPERATIONS.get(name)
+    if func is None:
+        raise ValueError(f'Unknown EDB operation: {name}')
+    return func(job_path, edb_version, progress or (lambda *args: None), **(kwargs or {}))
+
+
+def _blank(value):
+    return value is None or value == ''
+
+
+def _same(a, b):
+    """Compare two property values, numerically when both are numbers."""
+    if _blank(a) or _blank(b):
+        return _blank(a) and _blank(b)
+    try:
+        return math.isclose(float(a), float(b), rel_tol=1e-6, abs_tol=1e-15)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def diff_stackup(rows, current):
+    """The changes the sheet ``rows`` make to the ``current`` stackup.
+
+    ``current`` is the stackup as stored in the design snapshot.  Returns
+    one dict per changed layer with ``name`` and the ``(old, new)`` pair of
+    each changed ``thickness``, ``conductivity`` (signal layers) or
+    ``dielectric`` (``(permittivity, loss_tangent)``) property.  Blank
+    material cells leave the material alone.  :func:`apply_changes` adds
+    the ``material`` pair of layers whose material it switched.
+    """
+    layers = {layer['name']: layer for layer in current}
+    changes = []
+    for row in rows:
+        layer = layers.get(row['name'])
+        if layer is None:
+            raise ValueError(f"Layer {row['name']} is not in the design's stackup")
+        change = {'name': row['name']}
+        if not _same(row['thickness'], layer['thickness']):
+            change['thickness'] = (layer['thickness'], row['thickness'])
+        if row['type'] == 'signal':
+            if not _blank(row['conductivity']) and not _same(row['conductivity'], layer.get('conductivity')):
+                change['conductivity'] = (layer.get('conductivity'), row['conductivity'])
+        elif not _blank(row['permittivity']):
+            old = (layer.get('permittivity'), layer.get('loss_tangent'))
+            new = (row['permittivity'], row['loss_tangent'])
+            if not (_same(old[0], new[0]) and _same(old[1], new[1])):
+                change['dielectric'] = (old, new)
+        if len(change) > 1:
+            changes.append(change)
+    return changes
+
+
+def _material_for(edb, materials, report, conductivity=None, dielectric=None):
+    """Name of a material with these properties, reusing an existing one if possible."""
+    for name, mat in materials.items():
+        if conductivity is not None:
+            found = not _blank(mat.conductivity) and _same(mat.conductivity, conductivity)
+        else:
+            found = _same(mat.permittivity, dielectric[0]) and _same(mat.dielectric_loss_tangent, dielectric[1])
+        if found:
+            if name not in report['materials_reused']:
+                report['materials_reused'].append(name)
+            return name
+    if conductivity is not None:
+        mat = edb.materials.add_conductor_material(f'metal_{conductivity}', conductivity)
+    else:
+        mat = edb.materials.add_dielectric_material(f'dielectric_{dielectric[0]}_{dielectric[1]}', *dielectric)
+    materials[mat.name] = mat
+    report['materials_created'].append(mat.name)
+    return mat.name
+
+
+def apply_changes(edb, changes, report):
+    """Set the thickness and material of the changed layers only.
+
+    The materials are resolved first, then every layer is updated in a
+    single pass over the stackup.
+    """
+    materials = dict(edb.materials.materials)
+    targets = {}
+    for change in changes:
+        if 'conductivity' in change:
+            targets[change['name']] = _material_for(edb, materials, report, conductivity=change['conductivity'][1])
+        elif 'dielectric' in change:
+            targets[change['name']] = _material_for(edb, materials, report, dielectric=change['dielectric'][1])
+    layers = edb.stackup.stackup_layers
+    for change in changes:
+        layer = layers[change['name']]
+        if 'thickness' in change:
+            layer.thickness = change['thickness'][1]
+        material = targets.get(change['name'])
+        if material is not None and material != layer.material:
+            change['material'] = (layer.material, material)
+            layer.material = material
+
+
+@operation
+def convert_brd(job_path, edb_version, progress, brd_path):
+    """Import a BRD file as ``output/design.aedb`` and keep it open."""
+    edb = open_edb(brd_path, edb_version)
+    edb_dir = design_dir(job_path)
+    remove_dir(edb_dir)
+    edb.save_as(edb_dir)
+    adopt(job_path, edb_version, edb)
+
+
+@operation
+def export_stackup(job_path, edb_version, progress, xlsx_path, unit='mm'):
+    """Write the stackup sheet; the format follows the extension of ``xlsx_path``."""
+    with edb_session(job_path, edb_version, writable=False) as edb:
+        write_stackup(extract_stackup(edb), xlsx_path, unit=unit)
+
+
+@operation
+def apply_stackup(job_path, edb_version, progress, xlsx_path):
+    """Apply the layers of a stackup sheet that differ from the design; returns a change report.
+
+    The design is not opened for writing when nothing changed.
+    """
+    rows = read_stackup(xlsx_path)
+    previous = load_snapshot(job_path)
+    if previous is not None and 'stackup' in previous:
+        current = previous['stackup']
+    else:
+        with edb_session(job_path, edb_version, writable=False) as edb:
+            current = extract_stackup(edb)
+    changes = diff_stackup(rows, current)
+    report = {'layers': len(rows), 'changed': changes, 'materials_created': [], 'materials_reused': []}
+    if not changes:
+        return report
+    with edb_session(job_path, edb_version) as edb:
+        apply_changes(edb, changes, report)
+        edb.save()
+        update_snapshot(job_path, edb, previous, stackup=True)
+    return report
+
+
+@operation
+def build_snapshot(job_path, edb_version, progress):
+    """Extract and store the design snapshot; returns it."""
+    with edb_session(job_path, edb_version, writable=False) as edb:
+        return _build_snapshot(job_path, edb)
+
+
+@operation
+def list_nets(job_path, edb_version, progress):
+    with edb_session(job_path, edb_version, writable=False) as edb:
+        return list(edb.nets.nets.keys())
+
+
+@operation
+def list_components(job_path, edb_version, progress):
+    """``[{'refdes', 'part_name', 'type', 'value'}]`` for every component."""
+    with edb_session(job_path, edb_version, writable=False) as edb:
+        return [
+            {'refdes': refdes, 'part_name': comp.part_name, 'type': comp.type, 'value': comp.value}
+            for refdes, comp in edb.components.components.items()
+        ]
+
+
+@operation
+def rename_parts(job_path, edb_version, progress, renames):
+    """Rename part definitions; returns ``{old: new}`` for those renamed."""
+    rename_log = {}
+    previous = load_snapshot(job_path)
+    with edb_session(job_path, edb_version) as edb:
+        index = component_index(edb)
+        for old_name, new_name in renames.items():
+            if new_name and new_name != old_name and index.rename(old_name, new_name):
+                rename_log[old_name] = new_name
+        if rename_log:
+            edb.save()
+            update_snapshot(job_path, edb, previous, renames=rename_log)
+    return rename_log
+
+
+@operation
+def set_values(job_path, edb_version, progress, values):
+    """Set part values; returns ``{part: value}`` for the values that changed."""
+    changes = {}
+    previous = load_snapshot(job_path)
+    with edb_session(job_path, edb_version) as edb:
+        index = component_index(edb)
+        for part_name, val in values.items():
+            if val and index.set_value(part_name, val):
+                changes[part_name] = val
+        if changes:
+            edb.save()
+            update_snapshot(job_path, edb, previous, values=changes)
+    return changes
+
+
+@operation
+def cutout(job_path, edb_version, progress, signal_nets, reference_nets, output_path,
+           extent_type='Bounding', expansion_size=0.002, number_of_threads=4, private=False):
+    """Cut the selected nets out of the design into ``output_path``.
+
+    With ``private`` the cutout is made from a temporary copy of the design
+    instead of the job's pooled handle, so several cutouts of one job can
+    run in different workers at the same time.
+    """
+    options = dict(
+        signal_list=list(signal_nets),
+        reference_list=list(reference_nets),
+        extent_type=extent_type,
+        expansion_size=expansion_size,
+        number_of_threads=number_of_threads,
+        output_aedb_path=output_path,
+        open_cutout_at_end=False,
+    )
+    remove_dir(output_path)
+    if not private:
+        # The cutout is saved to output_path; the design is only read, so
+        # its files stay shared with the step snapshots
+        with edb_session(job_path, edb_version, writable=False) as edb:
+            invalidate(edb)
+            edb.cutout(**options)
+        return
+    source = f'{output_path}.source.aedb'
+    remove_dir(source)
+    clone_tree(design_dir(job_path), source)
+    try:
+        edb = open_edb(source, edb_version)
+        try:
+            edb.cutout(**options)
+        finally:
+            edb.close_edb()
+    finally:
+        remove_dir(source)
+
+
+@operation
+def plot_layers(job_path, edb_version, progress, workers=None):
+    """Render the signal layers into ``output/``; reports ``(done, total, layer)``."""
+    output_dir = os.path.join(job_path, 'output')
+    with edb_session(job_path, edb_version, writable=False) as edb:
+        return render_layers(edb, output_dir, workers=workers, progress=progress)
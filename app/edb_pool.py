@@ -0,0 +1,234 @@
+"""Pool of open EDB databases, kept by each EDB worker process.
+
+Opening ``design.aedb`` is the most expensive EDB operation, so handles are
+kept open between requests, keyed by ``(job_id, edb_version)``.  Each handle
+is borrowed exclusively through :func:`edb_session`, which serialises all
+access to one database.  The pool is bounded (least recently used handles
+are closed first) and handles idle for longer than the configured timeout
+are closed by a background reaper.  The pool lives in the processes of
+:mod:`app.edb_service`, or in the web process when ``EDB_WORKERS`` is 0.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.workspace import break_links, has_links
+
+_lock = threading.Lock()
+_sessions = OrderedDict()
+_settings = {'max_size': 4, 'idle_timeout': 600, 'backend': 'pyedb'}
+_reaper = None
+
+
+class _Session:
+    def __init__(self, key, edb_dir):
+        self.key = key
+        self.edb_dir = edb_dir
+        self.edb = None
+        self.lock = threading.RLock()
+        self.borrowers = 0
+        self.retired = False
+        self.last_used = time.time()
+
+
+def init_app(app):
+    app.config.setdefault('EDB_POOL_SIZE', 4)
+    app.config.setdefault('EDB_POOL_IDLE_TIMEOUT', 600)
+    app.config.setdefault('EDB_BACKEND', 'pyedb')
+    configure(app.config)
+
+
+def configure(config):
+    """Apply the ``EDB_POOL_*`` and ``EDB_BACKEND`` settings of ``config``."""
+    global _reaper
+    _settings['max_size'] = int(config.get('EDB_POOL_SIZE', 4))
+    _settings['idle_timeout'] = float(config.get('EDB_POOL_IDLE_TIMEOUT', 600))
+    _settings['backend'] = config.get('EDB_BACKEND', 'pyedb')
+    if _reaper is None:
+        _reaper = threading.Thread(target=_reap_forever, name='edb-pool-reaper', daemon=True)
+        _reaper.start()
+
+
+def edb_class():
+    """The ``Edb`` class of the configured backend (imports pyedb on first use)."""
+    if _settings['backend'] == 'fake':
+        from app.edb_fake import Edb
+    else:
+        from pyedb import Edb
+    return Edb
+
+
+def open_edb(path, edb_version='2024.1'):
+    """Open a design outside the pool, e.g. to import a ``.brd`` file."""
+    return edb_class()(path, edbversion=edb_version)
+
+
+def design_dir(job_path):
+    return os.path.join(job_path, 'output', 'design.aedb')
+
+
+def _job_id(job_path):
+    return os.path.basename(os.path.normpath(job_path))
+
+
+def _close(session):
+    edb, session.edb = session.edb, None
+    if edb is None:
+        return
+    try:
+        edb.close_edb()
+    except Exception:
+        pass
+
+
+def _acquire(key, edb_dir):
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _Session(key, edb_dir)
+            _sessions[key] = session
+        _sessions.move_to_end(key)
+        session.borrowers += 1
+    return session
+
+
+def _release(session):
+    with _lock:
+        session.borrowers -= 1
+        session.last_used = time.time()
+    _evict_overflow()
+
+
+@contextmanager
+def edb_session(job_path, edb_version='2024.1', writable=True):
+    """Borrow the open ``design.aedb`` of a job, opening it if needed.
+
+    The handle stays locked for the duration of the ``with`` block.  If the
+    block raises, the handle is closed without saving so the next borrower
+    starts from the state on disk.  Unless ``writable`` is False, files the
+    design shares with a step snapshot are unshared first (see
+    :mod:`app.workspace`).
+    """
+    key = (_job_id(job_path), edb_version)
+    while True:
+        session = _acquire(key, design_dir(job_path))
+        session.lock.acquire()
+        if not session.retired:
+            break
+        # Closed by close_job() while we were waiting; start over
+        session.lock.release()
+        _release(session)
+    try:
+        if writable and has_links(session.edb_dir):
+            # The open handle may point at the snapshot's files; reopen on private copies.
+            # Saving rewrites edb.def, which holds nearly all of the design, in place;
+            # which of the few small side files EDB touches is not documented, so
+            # the whole directory is unshared.
+            _close(session)
+            break_links(session.edb_dir)
+        if session.edb is None:
+            session.edb = open_edb(session.edb_dir, edb_version)
+        try:
+            yield session.edb
+        except BaseException:
+            _close(session)
+            raise
+    finally:
+        session.lock.release()
+        _release(session)
+
+
+def adopt(job_path, edb_version, edb):
+    """Hand an already open ``design.aedb`` handle over to the pool."""
+    key = (_job_id(job_path), edb_version)
+    session = _acquire(key, design_dir(job_path))
+    try:
+        with session.lock:
+            if session.retired:
+                edb.close_edb()
+                return
+            if session.edb is not None and session.edb is not edb:
+                _close(session)
+            session.edb = edb
+    finally:
+        _release(session)
+
+
+def close_job(job_id):
+    """Close every pooled handle of a job, waiting for current borrowers."""
+    with _lock:
+        keys = [key for key in _sessions if key[0] == job_id]
+        sessions = [_sessions.pop(key) for key in keys]
+        for session in sessions:
+            session.retired = True
+    for session in sessions:
+        with session.lock:
+            _close(session)
+
+
+def open_jobs():
+    """Ids of the jobs with a design open, or being opened, in this process."""
+    with _lock:
+        return sorted({key[0] for key, session in _sessions.items()
+                       if session.edb is not None or session.borrowers})
+
+
+def close_all():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        for session in sessions:
+            session.retired = True
+    for session in sessions:
+        with session.lock:
+            _close(session)
+
+
+def _evict_overflow():
+    """Close least recently used idle handles beyond the pool size."""
+    victims = []
+    with _lock:
+        excess = len(_sessions) - _settings['max_size']
+        for key, session in list(_sessions.items()):
+            if excess <= 0:
+                break
+            if session.borrowers == 0 and session.lock.acquire(blocking=False):
+                del _sessions[key]
+                session.retired = True
+                victims.append(session)
+                excess -= 1
+    for session in victims:
+        try:
+            _close(session)
+        finally:
+            session.lock.release()
+
+
+def _reap_idle():
+    """Close handles that have not been borrowed within the idle timeout."""
+    victims = []
+    deadline = time.time() - _settings['idle_timeout']
+    with _lock:
+        for key, session in list(_sessions.items()):
+            if session.borrowers == 0 and session.last_used < deadline \
+                    and session.lock.acquire(blocking=False):
+                del _sessions[key]
+                session.retired = True
+                victims.append(session)
+    for session in victims:
+        try:
+            _close(session)
+        finally:
+            session.lock.release()
+
+
+def _reap_forever():
+    while True:
+        time.sleep(max(1.0, min(60.0, _settings['idle_timeout'] / 2)))
+        _reap_idle()
+
+
+atexit.register(close_all)
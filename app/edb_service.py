@@ -0,0 +1,353 @@
+"""EDB work in long-lived worker processes instead of the web server.
+
+pyedb drives .NET code that can crash, leak memory or hang.  Steps and page
+views therefore never open a design themselves: they call the named
+operations of :mod:`app.edb_ops` through :func:`call`, which sends them
+over a pipe to one of ``EDB_WORKERS`` spawned processes.  Each worker
+imports pyedb once when it starts and keeps its own :mod:`app.edb_pool` of
+open designs.  A job always goes to the same worker, so its design is open
+in a single process.
+
+The protocol is a tuple per message.  The parent sends
+``('call', op, job_path, edb_version, kwargs)``, ``('close', job_id)``,
+``('sessions',)`` (answered with the jobs of the open designs) or
+``('stop',)``.  While an operation runs the worker may send
+``('progress', args)``; it then answers ``('ok', result, rss)`` or
+``('error', exc_type, message, traceback, rss)``.
+
+A worker is replaced after ``EDB_WORKER_MAX_CALLS`` calls or once its
+resident memory exceeds ``EDB_WORKER_MAX_RSS_MB``.  A worker that dies, or
+does not answer within ``EDB_CALL_TIMEOUT`` seconds, is killed and started
+again; the call raises :class:`EdbServiceError`.  With ``EDB_WORKERS = 0``
+the operations run in the calling process.
+
+Every open design holds an Ansys license, also between steps and for page
+views, so :func:`open_jobs` reports them to the step queue (see
+:meth:`app.job_queue.SqliteQueue.claim`).
+"""
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+import traceback
+
+from app import edb_pool
+
+# Settings forwarded to the worker processes
+WORKER_CONFIG = ('EDB_POOL_SIZE', 'EDB_POOL_IDLE_TIMEOUT', 'EDB_BACKEND')
+# An idle worker answers ('sessions',) at once; do not stall the heartbeat
+SESSIONS_TIMEOUT = 10
+
+_lock = threading.Lock()
+_workers = []
+_assignments = {}
+_settings = {
+    'workers': 2,
+    'max_calls': 200,
+    'max_rss': 4096 * 1024 * 1024,
+    'timeout': 3600,
+    'config': {},
+}
+
+
+class EdbServiceError(RuntimeError):
+    """An EDB operation failed, or its worker crashed or timed out."""
+
+
+class _RemoteTraceback(Exception):
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def init_app(app):
+    app.config.setdefault('EDB_WORKERS', 2)
+    app.config.setdefault('EDB_WORKER_MAX_CALLS', 200)
+    app.config.setdefault('EDB_WORKER_MAX_RSS_MB', 4096)
+    app.config.setdefault('EDB_CALL_TIMEOUT', 3600)
+    app.config.setdefault('EDB_POOL_SIZE', 4)
+    app.config.setdefault('EDB_POOL_IDLE_TIMEOUT', 600)
+    app.config.setdefault('EDB_BACKEND', 'pyedb')
+    _settings['workers'] = int(app.config['EDB_WORKERS'])
+    _settings['max_calls'] = int(app.config['EDB_WORKER_MAX_CALLS'])
+    _settings['max_rss'] = int(app.config['EDB_WORKER_MAX_RSS_MB']) * 1024 * 1024
+    _settings['timeout'] = float(app.config['EDB_CALL_TIMEOUT'])
+    _settings['config'] = {name: app.config[name] for name in WORKER_CONFIG}
+
+
+def _job_id(job_path):
+    return os.path.basename(os.path.normpath(job_path))
+
+
+def _rss():
+    """Resident memory of the current process in bytes, or 0 if unknown."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _worker_main(conn, config):
+    """Entry point of a worker process."""
+    from app import edb_ops
+
+    edb_pool.configure(config)
+    try:
+        # Pay the pyedb/.NET import once, before the first request
+        edb_pool.edb_class()
+    except ImportError:
+        pass
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == 'stop':
+            break
+        if message[0] == 'close':
+            edb_pool.close_job(message[1])
+            conn.send(('ok', None, _rss()))
+            continue
+        if message[0] == 'sessions':
+            conn.send(('ok', edb_pool.open_jobs(), _rss()))
+            continue
+        _, op, job_path, edb_version, kwargs = message
+        try:
+            result = edb_ops.run(op, job_path, edb_version, kwargs,
+                                 progress=lambda *args: conn.send(('progress', args)))
+            reply = ('ok', result, _rss())
+        except Exception as e:
+            reply = ('error', type(e).__name__, str(e), traceback.format_exc(), _rss())
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result could not be pickled
+            conn.send(('error', type(e).__name__, str(e), traceback.format_exc(), _rss()))
+    edb_pool.close_all()
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.calls = 0
+        self.rss = 0
+        # Jobs of the designs open in the process, as of the last ('sessions',)
+        self.sessions = []
+        # Routing key of the call in flight
+        self.current = None
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        # spawn: forking a process that has .NET loaded is not safe
+        ctx = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = ctx.Pipe()
+        # Not a daemon: the worker starts its own processes to render layers
+        process = ctx.Process(target=_worker_main, args=(child_conn, dict(_settings['config'])),
+                              name=f'edb-worker-{self.index}', daemon=False)
+        try:
+            process.start()
+        finally:
+            child_conn.close()
+        self.process = process
+        self.conn = parent_conn
+        self.calls = 0
+        self.rss = 0
+
+    def stop(self, kill=False):
+        """Shut the process down; ``kill`` skips closing its designs."""
+        process, conn = self.process, self.conn
+        self.process = self.conn = None
+        self.sessions = []
+        with _lock:
+            # Its designs close with it, so its jobs may go to any worker next
+            for job_id in [job_id for job_id, index in _assignments.items() if index == self.index]:
+                del _assignments[job_id]
+        if process is None:
+            return
+        if not kill:
+            try:
+                conn.send(('stop',))
+            except (OSError, ValueError):
+                pass
+            process.join(30)
+        if process.is_alive():
+            process.kill()
+            process.join(5)
+        conn.close()
+
+    def request(self, message, progress=None, timeout=None):
+        """Send ``message`` and return the reply; caller holds ``self.lock``."""
+        if not self.alive():
+            self.stop(kill=True)
+            self.start()
+        timeout = _settings['timeout'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        try:
+            self.conn.send(message)
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and (remaining <= 0 or not self.conn.poll(remaining)):
+                    self.stop(kill=True)
+                    raise EdbServiceError(f'The EDB worker did not answer within {timeout:.0f} s')
+                reply = self.conn.recv()
+                if reply[0] != 'progress':
+                    break
+                if progress:
+                    progress(*reply[1])
+        except (EOFError, OSError) as e:
+            self.stop(kill=True)
+            raise EdbServiceError('The EDB worker exited unexpectedly') from e
+        if message[0] == 'call':
+            self.calls += 1
+        self.rss = reply[-1]
+        if self.calls >= _settings['max_calls'] or (_settings['max_rss'] and self.rss > _settings['max_rss']):
+            # Recycle; open designs are reopened by the next worker
+            self.stop()
+        return reply
+
+
+def _worker_for(job_id):
+    """The worker that owns ``job_id``, assigning the least loaded one."""
+    with _lock:
+        if not _workers:
+            _workers.extend(_Worker(i) for i in range(_settings['workers']))
+            # Runs at exit before multiprocessing joins the (non-daemon) workers
+            multiprocessing.util.Finalize(None, shutdown, exitpriority=10)
+        index = _assignments.get(job_id)
+        if index is None:
+            load = [0] * len(_workers)
+            for assigned in _assignments.values():
+                load[assigned] += 1
+            index = min(range(len(_workers)), key=lambda i: (_workers[i].lock.locked(), load[i]))
+            _assignments[job_id] = index
+        return _workers[index]
+
+
+def call(op, job_path, edb_version='2024.1', progress=None, affinity=None, **kwargs):
+    """Run the EDB operation ``op`` for a job and return its result.
+
+    ``progress`` receives the arguments of every progress report of the
+    operation, in the calling thread.  ``affinity`` routes the call by that
+    key instead of the job, so independent operations of one job (that do
+    not use the job's pooled design) can run on different workers at once;
+    the key is released when the call returns.
+    """
+    if _settings['workers'] <= 0:
+        from app import edb_ops
+        return edb_ops.run(op, job_path, edb_version, kwargs, progress)
+    key = affinity or _job_id(job_path)
+    worker = _worker_for(key)
+    try:
+        with worker.lock:
+            worker.current = key
+            try:
+                reply = worker.request(('call', op, job_path, edb_version, kwargs), progress)
+            finally:
+                worker.current = None
+    finally:
+        if affinity:
+            with _lock:
+                _assignments.pop(affinity, None)
+    if reply[0] == 'error':
+        _, exc_type, message, tb, _ = reply
+        raise EdbServiceError(f'{exc_type}: {message}' if message else exc_type) from _RemoteTraceback(tb)
+    return reply[1]
+
+
+def parallelism():
+    """How many EDB operations can run at the same time."""
+    return max(1, _settings['workers'])
+
+
+def open_jobs():
+    """Jobs holding an EDB design open in this node, i.e. using a license.
+
+    Idle workers are asked for their pooled designs; a busy one is counted
+    with the designs it reported last plus the routing key of its current
+    call (an ``affinity`` key for a call on a private copy of the design).
+    """
+    if _settings['workers'] <= 0:
+        return edb_pool.open_jobs()
+    with _lock:
+        workers = list(_workers)
+    held = set()
+    for worker in workers:
+        if worker.lock.acquire(blocking=False):
+            try:
+                if worker.alive():
+                    try:
+                        worker.sessions = worker.request(('sessions',), timeout=SESSIONS_TIMEOUT)[1]
+                    except EdbServiceError:
+                        worker.sessions = []
+            finally:
+                worker.lock.release()
+        else:
+            current = worker.current
+            if current:
+                held.add(current)
+        held.update(worker.sessions)
+    return sorted(held)
+
+
+def close_job(job_id):
+    """Close the open designs of a job wherever they are held."""
+    edb_pool.close_job(job_id)
+    with _lock:
+        index = _assignments.pop(job_id, None)
+        worker = _workers[index] if index is not None else None
+    if worker is None:
+        return
+    with worker.lock:
+        if worker.alive():
+            try:
+                worker.request(('close', job_id))
+            except EdbServiceError:
+                pass
+
+
+def status():
+    """Per-worker process id, call count and resident memory."""
+    with _lock:
+        workers = list(_workers)
+        assignments = dict(_assignments)
+    return [
+        {
+            'index': worker.index,
+            'pid': worker.process.pid if worker.alive() else None,
+            'calls': worker.calls,
+            'rss': worker.rss,
+            'busy': worker.lock.locked(),
+            'jobs': sum(1 for index in assignments.values() if index == worker.index),
+            'designs': list(worker.sessions),
+        }
+        for worker in workers
+    ]
+
+
+def shutdown():
+    with _lock:
+        workers = list(_workers)
+    for worker in workers:
+        if worker.lock.acquire(timeout=5):
+            try:
+                worker.stop()
+            finally:
+                worker.lock.release()
+        else:
+            # Still running an operation; do not wait for it
+            worker.stop(kill=True)
+
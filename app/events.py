@@ -0,0 +1,140 @@
+"""In-process job event bus and server-sent-events streams.
+
+The job registry publishes a delta whenever a job is created, changes step
+or status, reports progress, completes or is deleted.  The deck page
+subscribes through ``/api/jobs/stream``.  Each stream ends after
+``SSE_STREAM_SECONDS`` (the browser reconnects with ``Last-Event-ID``) and at
+most ``SSE_MAX_STREAMS`` streams, ``SSE_MAX_STREAMS_PER_USER`` per user, are
+open at once, so idle subscribers never pin waitress threads indefinitely.  Clients that are refused fall back to
+polling ``/api/jobs`` with ``If-None-Match``.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+_cond = threading.Condition()
+_events = deque(maxlen=1000)
+_state = {'seq': 0}
+# Open streams: slot id -> [user, reserved at, started]
+_slots = {}
+_settings = {'max_streams': 4, 'max_user_streams': 2, 'stream_seconds': 30, 'heartbeat': 15}
+# A reserved slot whose stream has not started by then is given up
+UNSTARTED_SECONDS = 30
+
+
+def init_app(app):
+    app.config.setdefault('SSE_MAX_STREAMS', 4)
+    app.config.setdefault('SSE_MAX_STREAMS_PER_USER', 2)
+    app.config.setdefault('SSE_STREAM_SECONDS', 30)
+    _settings['max_streams'] = int(app.config['SSE_MAX_STREAMS'])
+    _settings['max_user_streams'] = int(app.config['SSE_MAX_STREAMS_PER_USER'])
+    _settings['stream_seconds'] = float(app.config['SSE_STREAM_SECONDS'])
+
+
+def publish(user, kind, job):
+    """Queue a ``kind`` event about ``job`` for ``user``'s subscribers."""
+    with _cond:
+        _state['seq'] += 1
+        _events.append((_state['seq'], user, kind, job))
+        _cond.notify_all()
+
+
+def _parse_event_id(last_event_id):
+    """Return the sequence number of a Last-Event-ID from this process, else None."""
+    if not last_event_id:
+        return None
+    boot, _, seq = last_event_id.partition('-')
+    if boot != BOOT_ID or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def _format(seq, kind, payload):
+    return f'id: {BOOT_ID}-{seq}\nevent: {kind}\ndata: {json.dumps(payload)}\n\n'
+
+
+class _Stream:
+    """Response body of one SSE stream, holding a stream slot until it is closed.
+
+    The WSGI server closes the body whether or not it was ever iterated, so
+    the slot is released even for a client that left before the first event.
+    """
+
+    def __init__(self, slot, user, cursor, reset):
+        self._slot = slot
+        self._events = _stream(slot, user, cursor, reset)
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+        _release(self._slot)
+
+
+def _prune(now):
+    """Drop the slots of streams that were never started (response lost on the way)."""
+    for slot, (_, reserved_at, started) in list(_slots.items()):
+        if not started and now - reserved_at > UNSTARTED_SECONDS:
+            del _slots[slot]
+
+
+def _release(slot):
+    with _cond:
+        _slots.pop(slot, None)
+
+
+def open_stream(user, last_event_id=None):
+    """Return an SSE response body for ``user``, or None when no slot is free.
+
+    Streams are capped at ``SSE_MAX_STREAMS`` in all and at
+    ``SSE_MAX_STREAMS_PER_USER`` per user.
+    """
+    with _cond:
+        now = time.time()
+        _prune(now)
+        if len(_slots) >= _settings['max_streams']:
+            return None
+        if sum(1 for owner, _, _ in _slots.values() if owner == user) >= _settings['max_user_streams']:
+            return None
+        slot = uuid.uuid4().hex
+        _slots[slot] = [user, now, False]
+        cursor = _parse_event_id(last_event_id)
+        reset = last_event_id is not None and (
+            cursor is None or (_events and cursor < _events[0][0] - 1))
+        if cursor is None or reset:
+            cursor = _state['seq']
+    return _Stream(slot, user, cursor, reset)
+
+
+def _stream(slot, user, cursor, reset):
+    with _cond:
+        # Pruned while the response was on its way; take the slot back
+        _slots.setdefault(slot, [user, time.time(), True])[2] = True
+    try:
+        yield 'retry: 3000\n\n'
+        if reset:
+            # Events were missed (restart or buffer overflow); reload the list
+            yield _format(cursor, 'reset', {})
+        deadline = time.time() + _settings['stream_seconds']
+        while True:
+            with _cond:
+                pending = [e for e in _events if e[0] > cursor and e[1] == user]
+                if not pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    _cond.wait(min(remaining, _settings['heartbeat']))
+                    pending = [e for e in _events if e[0] > cursor and e[1] == user]
+                cursor = max(cursor, _state['seq'])
+            if pending:
+                for seq, _, kind, job in pending:
+                    yield _format(seq, kind, job)
+            else:
+                yield ': keep-alive\n\n'
+    finally:
+        _release(slot)
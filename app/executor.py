@@ -0,0 +1,529 @@
+"""Background execution of flow steps.
+
+POST requests enqueue a step instead of running it inside the request
+thread.  Steps wait in the queue of :mod:`app.job_queue`, which several
+nodes (``run.py`` processes on different hosts) can share.  Each node runs
+up to ``NODE_SLOTS`` steps at a time and only claims a step while its user
+has fewer than ``STEP_MAX_WORKERS_PER_USER`` steps running on any node.
+Which step a node claims next is decided by :mod:`app.scheduler` (resource
+classes, license tokens, priorities).  Status is persisted in
+``metadata.json`` as ``queued`` / ``running`` / ``done`` / ``failed`` together with a progress percentage and the node
+running the step, so the step page and ``/api/jobs`` can report it.
+
+A dispatcher thread per node claims steps, sends the node's heartbeat and
+queues again the steps of nodes that stopped sending theirs.  A step run
+again after its node was lost first gets the job's outputs restored from
+the snapshot taken before the step.  If the node was only slow, its run
+still finishes but is discarded: a result is only kept once the queue
+confirms the node still owns the step.
+"""
+import atexit
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from app import edb_service, job_queue, memo, scheduler
+from app.edb_service import close_job
+from app.registry import JOB_DIR
+from app.utils import remove_dir, update_metadata
+from app.workspace import has_snapshot, restore, unshare_outputs
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_lock = threading.Lock()
+# Steps submitted by this process that no node has claimed yet, by task id
+_submitted = {}
+# Steps running on this node: job id -> task id
+_running = {}
+# Jobs whose step is being queued by this process right now
+_enqueuing = set()
+_settings = {
+    'node_id': f'{socket.gethostname()}-{os.getpid()}',
+    'host': socket.gethostname(),
+    'slots': 2,
+    'per_user': 1,
+    'poll': 1.0,
+    'heartbeat': 5.0,
+    'node_timeout': 30.0,
+}
+_node = {'queue': None, 'url': None, 'app': None, 'pool': None, 'dispatcher': None}
+_wake = threading.Event()
+# Notified whenever a step finishes on this node
+_finished = threading.Condition()
+_local = threading.local()
+
+
+class StepTask:
+    """A step waiting for, or holding, an execution slot.
+
+    ``flow_id`` lets another node rebuild the task from the queue; without
+    it only the submitting node can run it.  A ``memoize`` task fingerprints
+    its inputs on the worker before it runs (see :mod:`app.memo`), reuses the
+    result of an identical earlier run and records its own.
+    ``origin`` is ``'interactive'`` or ``'batch'`` (see :mod:`app.scheduler`).
+    """
+
+    def __init__(self, job_path, step, run, data=None, files=None, config=None,
+                 user='', on_success=None, flow_id=None, memoize=False, task_id=None,
+                 origin='interactive'):
+        self.job_path = job_path
+        self.job_id = os.path.basename(os.path.normpath(job_path))
+        self.step = step
+        self.run = run
+        self.data = data
+        self.files = files or {}
+        self.config = config
+        self.user = user
+        self.on_success = on_success
+        self.flow_id = flow_id
+        self.memoize = memoize
+        self.fingerprint = None
+        self.task_id = task_id or uuid.uuid4().hex
+        self.origin = origin
+        self.queued_at = time.time()
+
+
+def init_app(app):
+    app.config.setdefault('STEP_MAX_WORKERS', 2)
+    app.config.setdefault('STEP_MAX_WORKERS_PER_USER', 1)
+    app.config.setdefault('STEP_QUEUE_URL', 'memory://')
+    app.config.setdefault('STEP_QUEUE_POLL_SECONDS', 1)
+    app.config.setdefault('NODE_ID', _settings['node_id'])
+    app.config.setdefault('NODE_HOST', _settings['host'])
+    app.config.setdefault('NODE_SLOTS', app.config['STEP_MAX_WORKERS'])
+    app.config.setdefault('NODE_HEARTBEAT_SECONDS', 5)
+    app.config.setdefault('NODE_TIMEOUT_SECONDS', 30)
+    _settings['node_id'] = app.config['NODE_ID']
+    _settings['host'] = app.config['NODE_HOST']
+    _settings['slots'] = int(app.config['NODE_SLOTS'])
+    _settings['per_user'] = int(app.config['STEP_MAX_WORKERS_PER_USER'])
+    _settings['poll'] = float(app.config['STEP_QUEUE_POLL_SECONDS'])
+    _settings['heartbeat'] = float(app.config['NODE_HEARTBEAT_SECONDS'])
+    _settings['node_timeout'] = float(app.config['NODE_TIMEOUT_SECONDS'])
+    if _node['queue'] is None or _node['url'] != app.config['STEP_QUEUE_URL']:
+        _node['queue'] = job_queue.open_queue(app.config['STEP_QUEUE_URL'])
+        _node['url'] = app.config['STEP_QUEUE_URL']
+    _node['app'] = app
+
+
+def start_node():
+    """Register this process as a node and start claiming steps.
+
+    Called by ``run.py`` so a host takes work from the shared queue right
+    away, and on the first submitted step otherwise.
+    """
+    with _lock:
+        if _node['dispatcher'] is not None:
+            return
+        _node['queue'].register(_settings['node_id'], _settings['host'], _settings['slots'])
+        _node['pool'] = ThreadPoolExecutor(max_workers=max(1, _settings['slots']), thread_name_prefix='step')
+        _node['dispatcher'] = threading.Thread(target=_dispatch_forever, name='step-dispatcher', daemon=True)
+        _node['dispatcher'].start()
+    atexit.register(stop_node)
+
+
+def stop_node():
+    """Leave the cluster; steps still marked as running here are queued again."""
+    with _lock:
+        if _node['dispatcher'] is None:
+            return
+        _node['dispatcher'] = None
+    try:
+        _node['queue'].unregister(_settings['node_id'])
+    except Exception:
+        pass
+
+
+def queue_summary():
+    """Queue depth, license tokens in use and per-class wait times."""
+    stats = _node['queue'].stats(node_timeout=_settings['node_timeout'])
+    stats.pop('nodes')
+    stats['license_tokens'] = scheduler.license_tokens()
+    return stats
+
+
+def status():
+    """This node's settings and load, with the queue's counts and nodes."""
+    with _lock:
+        running = len(_running)
+    info = {
+        'node_id': _settings['node_id'],
+        'host': _settings['host'],
+        'slots': _settings['slots'],
+        'running_here': running,
+        'license_tokens': scheduler.license_tokens(),
+    }
+    info.update(_node['queue'].stats(node_timeout=_settings['node_timeout']))
+    now = time.time()
+    for node in info['nodes']:
+        node['heartbeat_age'] = round(now - node['heartbeat'], 1)
+    return info
+
+
+def stage_files(files, job_path):
+    """Copy uploaded files out of the request so a worker can read them later.
+
+    Returns a mapping of field name to a list of ``(filename, path,
+    content_type)`` tuples stored under ``<job>/tmp/uploads``.
+    """
+    staged = {}
+    if not files:
+        return staged
+    upload_dir = os.path.join(job_path, 'tmp', 'uploads')
+    for field in files:
+        for storage in files.getlist(field):
+            if not storage or not storage.filename:
+                continue
+            field_dir = os.path.join(upload_dir, field)
+            os.makedirs(field_dir, exist_ok=True)
+            path = os.path.join(field_dir, os.path.basename(storage.filename))
+            storage.save(path)
+            staged.setdefault(field, []).append(
+                (storage.filename, path, storage.content_type))
+    return staged
+
+
+def _open_staged(staged):
+    files = MultiDict()
+    for field, items in staged.items():
+        for filename, path, content_type in items:
+            files.add(field, FileStorage(stream=open(path, 'rb'), filename=filename,
+                                         name=field, content_type=content_type))
+    return files
+
+
+def discard_staged(job_path):
+    """Remove the files staged by :func:`stage_files` for a job."""
+    remove_dir(os.path.join(job_path, 'tmp', 'uploads'))
+
+
+def _close_staged(files, job_path, discard=True):
+    for _, storage in files.items(multi=True):
+        try:
+            storage.close()
+        except Exception:
+            pass
+    if discard:
+        discard_staged(job_path)
+
+
+def call_step(run, job_path, data=None, files=None, config=None):
+    """Call a step ``run`` function with the arguments it accepts."""
+    try:
+        return run(job_path, data=data, files=files, config=config)
+    except TypeError:
+        try:
+            return run(job_path, data=data, config=config)
+        except TypeError:
+            return run(job_path, data=data)
+
+
+def is_active(job_id):
+    """Return True when the job has a queued or running step on any node."""
+    with _lock:
+        if job_id in _running or job_id in _enqueuing:
+            return True
+    return _node['queue'].task(job_id) is not None
+
+
+def cancel(job_id):
+    """Drop a queued step for the job; return False if it is already running."""
+    with _lock:
+        if job_id in _running:
+            return False
+    if not _node['queue'].cancel(job_id):
+        return False
+    _node['queue'].forget(job_id)
+    return True
+
+
+def queue_position(job_id):
+    """Return the 1-based position of a queued job, or None."""
+    return _node['queue'].position(job_id, scheduler.aging())
+
+
+def queue_status(job_id):
+    """Where the job's step is in line, or None if it has none.
+
+    Returns its ``status``, ``resource`` class, ``position``, the queue
+    ``depth``, the seconds it has ``waited`` and the ``typical_wait`` (mean
+    over the last hour) of steps of its class.
+    """
+    queue = _node['queue']
+    task = queue.task(job_id)
+    if task is None:
+        return None
+    stats = queue.stats()
+    queued = task['status'] == 'queued'
+    return {
+        'status': task['status'],
+        'resource': task['resource'],
+        'position': queue.position(job_id, scheduler.aging()) if queued else None,
+        'depth': stats['queued'],
+        'waited': round(time.time() - task['queued_at'], 1) if queued else None,
+        'typical_wait': stats['classes'].get(task['resource'], {}).get('mean_wait'),
+    }
+
+
+def _inside(path, folder):
+    folder = os.path.abspath(folder)
+    return os.path.commonpath([os.path.abspath(path), folder]) == folder
+
+
+def _to_record(task):
+    """The queue entry for ``task``: plain data that any node can rebuild it from."""
+    if isinstance(task.data, MultiDict):
+        data = list(task.data.items(multi=True))
+    else:
+        data = list((task.data or {}).items())
+    files = {}
+    for field, items in task.files.items():
+        files[field] = [
+            (filename, os.path.relpath(path, task.job_path) if _inside(path, task.job_path) else path,
+             content_type)
+            for filename, path, content_type in items
+        ]
+    record = {
+        'id': task.task_id,
+        'job_id': task.job_id,
+        'step': task.step,
+        'user': task.user,
+        'queued_at': task.queued_at,
+        'origin': task.origin,
+        'payload': {
+            'flow_id': task.flow_id,
+            'memoize': task.memoize,
+            'data': data,
+            'files': files,
+            'config': task.config,
+        },
+    }
+    record.update(scheduler.requirements(task.flow_id, task.step, task.origin))
+    return record
+
+
+def _from_record(record):
+    """Rebuild a task submitted by another node from its queue entry."""
+    from app import flow_registry
+    from app.routes import advance_step
+
+    payload = record['payload']
+    flow_id = payload.get('flow_id')
+    step = record['step']
+    job_path = os.path.join(JOB_DIR, record['job_id'])
+    module = flow_registry.load_step(flow_id, step)
+    if module is None or not hasattr(module, 'run'):
+        raise ValueError(f'Step {step} of flow {flow_id} is not available on this node')
+    data = MultiDict(payload.get('data') or [])
+    files = {
+        field: [(filename, os.path.join(job_path, path), content_type) for filename, path, content_type in items]
+        for field, items in (payload.get('files') or {}).items()
+    }
+    return StepTask(job_path, step, module.run, data=data, files=files, config=payload.get('config'),
+                    user=record['user'], on_success=lambda: advance_step(flow_id, step, data), flow_id=flow_id,
+                    memoize=bool(payload.get('memoize')), task_id=record['id'], origin=record['origin'])
+
+
+def submit_step(task):
+    """Queue ``task``; returns False if the job already has an active step."""
+    if is_active(task.job_id):
+        return False
+    record = _to_record(task)
+    # Until the queue has the step, a page load must not take the "queued"
+    # status for an interrupted step
+    with _lock:
+        _enqueuing.add(task.job_id)
+        _submitted[task.task_id] = task
+    try:
+        update_metadata(task.job_path, status='queued', progress=0,
+                        progress_message='Waiting for a free worker', node=None, resource=record['resource'],
+                        error=None, error_kind=None, queued_at=task.queued_at)
+        if not _node['queue'].enqueue(record):
+            with _lock:
+                _submitted.pop(task.task_id, None)
+            return False
+    finally:
+        with _lock:
+            _enqueuing.discard(task.job_id)
+    start_node()
+    _wake.set()
+    return True
+
+
+def wait_step(job_id, poll=0.5):
+    """Block until the job has no queued or running step on any node."""
+    while is_active(job_id):
+        with _finished:
+            _finished.wait(poll)
+
+
+def report_progress(percent, message=None, job_path=None):
+    """Record progress for the step running in the current worker thread."""
+    task = getattr(_local, 'task', None)
+    job_path = job_path or (task.job_path if task else None)
+    if not job_path:
+        return
+    changes = {'progress': max(0, min(100, int(percent)))}
+    if message is not None:
+        changes['progress_message'] = message
+    update_metadata(job_path, **changes)
+
+
+def _can_run(record):
+    """Whether this node can run a claimed step: it sees the job and can load the step."""
+    if not os.path.isdir(os.path.join(JOB_DIR, record['job_id'])):
+        return False
+    if record['payload'].get('flow_id'):
+        return True
+    with _lock:
+        return record['id'] in _submitted
+
+
+def _heartbeat(queue):
+    with _lock:
+        running = len(_running)
+    queue.heartbeat(_settings['node_id'], _settings['host'], _settings['slots'], running,
+                    edb_service.open_jobs())
+    for record in queue.requeue_lost(_settings['node_timeout']):
+        job_path = os.path.join(JOB_DIR, record['job_id'])
+        if os.path.isdir(job_path):
+            update_metadata(job_path, status='queued', progress=0, node=None,
+                            progress_message=f"Queued again: node {record['node']} stopped responding")
+    # Steps another node claimed no longer need their local task
+    queued = queue.queued_ids()
+    with _lock:
+        for task_id in [task_id for task_id in _submitted if task_id not in queued]:
+            _submitted.pop(task_id, None)
+
+
+def _dispatch(queue):
+    """Claim queued steps for the free slots of this node and start them."""
+    with _lock:
+        if len(_running) >= _settings['slots']:
+            return
+    claimed = queue.claim(_settings['node_id'], _settings['host'],
+                          scheduler.limits(_settings['slots'], _settings['per_user']),
+                          _settings['node_timeout'], can_run=_can_run)
+    for record in claimed:
+        with _lock:
+            _running[record['job_id']] = record['id']
+        _node['pool'].submit(_worker, record)
+
+
+def _dispatch_forever():
+    queue = _node['queue']
+    last_beat = 0.0
+    while _node['dispatcher'] is not None:
+        try:
+            if time.monotonic() - last_beat >= _settings['heartbeat']:
+                last_beat = time.monotonic()
+                _heartbeat(queue)
+            _dispatch(queue)
+        except Exception:
+            # The queue may be briefly unavailable (e.g. locked on shared storage)
+            traceback.print_exc()
+        _wake.wait(_settings['poll'])
+        _wake.clear()
+
+
+def _worker(record):
+    """Run a claimed step and release its slot."""
+    with _lock:
+        task = _submitted.pop(record['id'], None)
+    try:
+        with _node['app'].app_context():
+            if task is None:
+                try:
+                    task = _from_record(record)
+                except Exception as e:
+                    update_metadata(os.path.join(JOB_DIR, record['job_id']), status='failed',
+                                    error=str(e) or e.__class__.__name__, error_kind='exception',
+                                    finished_at=time.time())
+                    return
+            if record.get('attempts') and has_snapshot(task.job_path, task.step):
+                # Interrupted on a lost node; start again from the step's inputs
+                from app import flow_registry
+                close_job(task.job_id)
+                restore(task.job_path, task.step)
+                unshare_outputs(task.job_path, flow_registry.step_writes(task.flow_id, task.step))
+            _execute(task, record)
+    finally:
+        with _lock:
+            _running.pop(record['job_id'], None)
+        # No-op when _execute already finished it
+        _node['queue'].finish(record['id'], _settings['node_id'], record.get('attempts'))
+        _wake.set()
+        with _finished:
+            _finished.notify_all()
+
+
+def _owns(task, record):
+    """Finish the claim of ``record``; False when the step was queued again meanwhile."""
+    if _node['queue'].finish(record['id'], _settings['node_id'], record.get('attempts')):
+        return True
+    with open(os.path.join(task.job_path, 'error.log'), 'a') as fp:
+        fp.write(f"{task.step}: result discarded on {_settings['node_id']}, "
+                 f"the step was queued again after this node was presumed lost\n")
+    return False
+
+
+def _reuse(task):
+    """Fingerprint the inputs of ``task``; True once the result of an identical run is back in place."""
+    from app import flow_registry
+
+    task.fingerprint = memo.fingerprint(flow_registry.step_path(task.flow_id, task.step), task.job_path,
+                                        task.data, task.files, task.config)
+    if not memo.lookup(task.job_path, task.step, task.fingerprint):
+        return False
+    close_job(task.job_id)
+    memo.reuse(task.job_path, task.step)
+    return True
+
+
+def _execute(task, record):
+    _local.task = task
+    files = _open_staged(task.files)
+    update_metadata(task.job_path, status='running', progress=0, progress_message='Running',
+                    node=_settings['node_id'], started_at=time.time())
+    owned = False
+    reused = False
+    try:
+        reused = task.memoize and _reuse(task)
+        if not reused:
+            result = call_step(task.run, task.job_path, data=task.data, files=files,
+                               config=task.config)
+        # Another node may own the step by now; only the owner finishes the job
+        owned = _owns(task, record)
+        if not owned:
+            return
+        if not reused and isinstance(result, dict) and result.get('error'):
+            update_metadata(task.job_path, status='failed', error=result['error'],
+                            error_kind='result', finished_at=time.time())
+            return
+        if task.fingerprint and not reused:
+            memo.record(task.job_path, task.step, task.fingerprint)
+        changes = task.on_success() if task.on_success else None
+    except Exception as e:
+        if not owned:
+            owned = _owns(task, record)
+            if not owned:
+                return
+        with open(os.path.join(task.job_path, 'error.log'), 'a') as fp:
+            fp.write(f'{task.step}: {traceback.format_exc()}\n')
+        update_metadata(task.job_path, status='failed', error=str(e) or e.__class__.__name__,
+                        error_kind='exception', finished_at=time.time())
+        return
+    finally:
+        # A step queued again still needs its staged files on its new node
+        _close_staged(files, task.job_path, discard=owned)
+        _local.task = None
+
+    update_metadata(task.job_path, status='done', progress=100,
+                    progress_message='Reused the previous result' if reused else 'Completed',
+                    finished_at=time.time(), **(changes or {}))
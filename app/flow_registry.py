@@ -0,0 +1,156 @@
+"""Flows discovered once and kept in memory.
+
+Each ``flows/<id>/flow.json`` is parsed when the registry is first used;
+step modules are imported the first time a step is run and reused after
+that.  ``next_step`` is a lookup table built from the step order.
+
+With ``FLOW_HOT_RELOAD`` enabled (meant for development) the flow folder,
+each ``flow.json`` and each step module are re-read when their mtime
+changes.  In production the registry is only refreshed by :func:`reload`.
+"""
+import importlib.util
+import json
+import os
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.RLock()
+_settings = {'flow_dir': os.path.join(BASE_DIR, 'flows'), 'hot_reload': False}
+_state = {'dir_mtime': None, 'flows': {}}
+_modules = {}
+
+
+def init_app(app):
+    app.config.setdefault('FLOW_HOT_RELOAD', app.debug)
+    _settings['hot_reload'] = bool(app.config['FLOW_HOT_RELOAD'])
+    reload()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _parse_flow(flow_id):
+    flow_path = os.path.join(_settings['flow_dir'], flow_id)
+    flow_json = os.path.join(flow_path, 'flow.json')
+    mtime = _mtime(flow_json)
+    if mtime is None:
+        return None
+    try:
+        with open(flow_json) as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    data['id'] = flow_id
+    steps = list(data.get('steps', []))
+    next_step = {step: (steps[i + 1] if i + 1 < len(steps) else None)
+                 for i, step in enumerate(steps)}
+    return {
+        'id': flow_id,
+        'path': flow_path,
+        'meta': data,
+        'steps': steps,
+        'next_step': next_step,
+        'mtime': mtime,
+    }
+
+
+def reload():
+    """Discover every flow again and forget the imported step modules."""
+    with _lock:
+        flow_dir = _settings['flow_dir']
+        flows = {}
+        if os.path.isdir(flow_dir):
+            for name in sorted(os.listdir(flow_dir)):
+                if os.path.isdir(os.path.join(flow_dir, name)):
+                    flow = _parse_flow(name)
+                    if flow is not None:
+                        flows[name] = flow
+        _state['flows'] = flows
+        _state['dir_mtime'] = _mtime(flow_dir)
+        _modules.clear()
+
+
+def _flows():
+    """The current flow table, refreshed first when hot reload is on."""
+    if _state['dir_mtime'] is None and not _state['flows']:
+        reload()
+    elif _settings['hot_reload']:
+        with _lock:
+            if _mtime(_settings['flow_dir']) != _state['dir_mtime']:
+                reload()
+            else:
+                for flow_id, flow in list(_state['flows'].items()):
+                    if _mtime(os.path.join(flow['path'], 'flow.json')) != flow['mtime']:
+                        fresh = _parse_flow(flow_id)
+                        if fresh is None:
+                            _state['flows'].pop(flow_id)
+                        else:
+                            _state['flows'][flow_id] = fresh
+    return _state['flows']
+
+
+def flows():
+    """Metadata of every flow (the parsed ``flow.json`` plus ``id``)."""
+    return [dict(flow['meta']) for flow in _flows().values()]
+
+
+def get_flow(flow_id):
+    return _flows().get(flow_id)
+
+
+def flow_name(flow_id):
+    flow = get_flow(flow_id)
+    return flow['meta'].get('name', flow_id) if flow else flow_id
+
+
+def steps(flow_id):
+    flow = get_flow(flow_id)
+    return list(flow['steps']) if flow else []
+
+
+def next_step(flow_id, step):
+    """The step after ``step``, or None when it is the last one."""
+    flow = get_flow(flow_id)
+    return flow['next_step'].get(step) if flow else None
+
+
+def step_writes(flow_id, step):
+    """Patterns of the outputs ``step`` rewrites in place, from ``writes`` in flow.json.
+
+    None when the flow does not declare them (see :mod:`app.workspace`).
+    """
+    flow = get_flow(flow_id)
+    writes = (flow['meta'].get('writes') or {}).get(step) if flow else None
+    return list(writes) if writes is not None else None
+
+
+def step_path(flow_id, step):
+    return os.path.join(_settings['flow_dir'], flow_id, f'{step}.py')
+
+
+def load_step(flow_id, step):
+    """Return the imported module of a step, or None if it does not exist."""
+    path = step_path(flow_id, step)
+    key = (flow_id, step)
+    cached = _modules.get(key)
+    if cached is not None and not _settings['hot_reload']:
+        return cached[1]
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _lock:
+        cached = _modules.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        spec = importlib.util.spec_from_file_location(f'app.flows.{flow_id}.{step}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[key] = (mtime, module)
+        return module
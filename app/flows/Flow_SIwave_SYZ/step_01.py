@@ -2,54 +2,24 @@ import os
 import shutil
 import zipfile
 from app.utils import remove_dir
-from openpyxl import Workbook
-from pyedb import Edb
-
-
-def export_stackup(edb_obj, xlsx_path, unit="mm"):
-    data = []
-    for layer_name, layer in edb_obj.stackup.stackup_layers.items():
-        mat = edb_obj.materials.materials[layer.material]
-        if layer.type == "signal":
-            permittivity = ""
-            loss_tangent = ""
-            conductivity = mat.conductivity
-        else:
-            permittivity = mat.permittivity
-            loss_tangent = mat.dielectric_loss_tangent
-            conductivity = ""
-        if unit == "mil":
-            thickness = layer.thickness * 1000.0 / 0.0254
-        else:
-            thickness = layer.thickness * 1000.0
-        data.append(
-            [
-                layer_name,
-                layer.type,
-                thickness,
-                permittivity,
-                loss_tangent,
-                conductivity,
-            ]
-        )
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Stackup"
-    ws.append(["unit", unit])
-    header = [
-        "Layer Name",
-        "Type",
-        f"Thickness ({unit})",
-        "Permittivity",
-        "Loss Tangent",
-        "Conductivity (S/m)",
-    ]
-    ws.append(header)
-    for row in data:
-        ws.append(row)
-    wb.save(xlsx_path)
-
-
+from app.executor import report_progress
+from app import design_cache, edb_service
+from app.snapshot import file_hash
+from app.layer_render import default_workers
+
+
+def plot_layers(job_path, edb_version):
+    """Render every signal layer to ``<layer>.png`` in parallel."""
+    report_progress(70, "Plotting layers")
+    edb_service.call(
+        "plot_layers",
+        job_path,
+        edb_version,
+        workers=default_workers(),
+        progress=lambda done, total, name: report_progress(
+            70 + 25 * done // total, f"Plotted {name} ({done}/{total})"
+        ),
+    )
 
 
 def run(job_path, data=None, files=None, config=None):
@@ -65,35 +35,46 @@ def run(job_path, data=None, files=None, config=None):
         show_layout = 'show_layout' in data
     design = files.get("design_file") if files else None
     edb_version = (config or {}).get("edb_version", "2024.1")
+    filename = None
     if design and design.filename:
         filename = design.filename
+        design.save(os.path.join(input_dir, filename))
+    elif data and data.get("uploaded_file"):
+        # Sent beforehand through the chunked upload API (app/uploads.py)
+        filename = os.path.basename(data.get("uploaded_file"))
+        if not os.path.isfile(os.path.join(input_dir, filename)):
+            return {"error": f"Uploaded file {filename} was not found. Please upload it again."}
+    if filename:
+        # design.aedb is about to be replaced; drop any pooled handle to it
+        edb_service.close_job(os.path.basename(os.path.normpath(job_path)))
         ext = os.path.splitext(filename)[1].lower()
         design_path = os.path.join(input_dir, filename)
-        design.save(design_path)
+        report_progress(10, "Design uploaded")
+
+        cache_key = design_cache.cache_key(file_hash(design_path), edb_version, unit, show_layout)
+        if design_cache.materialize(cache_key, job_path):
+            with open(os.path.join(output_dir, "rename.log"), "w") as fp:
+                fp.write(f"Uploaded {filename} restored from the design cache\n")
+            return {}
+        error_log = os.path.join(output_dir, "plot_error.log")
+        if os.path.isfile(error_log):
+            os.remove(error_log)
 
         if ext == ".brd":
-            edb = Edb(design_path, edbversion=edb_version)
-            edb_dir = os.path.join(output_dir, "design.aedb")
-            remove_dir(edb_dir)
-            edb.save_as(edb_dir)
+            report_progress(15, "Converting BRD to AEDB")
+            edb_service.call("convert_brd", job_path, edb_version, brd_path=design_path)
 
             with open(os.path.join(output_dir, "rename.log"), "w") as fp:
                 fp.write("BRD converted to design.aedb\n")
 
+            report_progress(60, "Exporting stackup")
             xlsx_path = os.path.join(output_dir, "stackup.xlsx")
-            export_stackup(edb, xlsx_path, unit=unit)
+            edb_service.call("export_stackup", job_path, edb_version, xlsx_path=xlsx_path, unit=unit)
+            edb_service.call("build_snapshot", job_path, edb_version)
 
             # Plot all signal layers only when user requests layout images
             if show_layout:
-                try:
-                    for layer_name in edb.stackup.signal_layers:
-                        img_path = os.path.join(output_dir, f"{layer_name}.png")
-                        edb.nets.plot(layers=[layer_name], show=False, save_plot=img_path)
-                except Exception as e:
-                    with open(os.path.join(output_dir, "plot_error.log"), "a") as fp:
-                        fp.write(f"Failed to plot {layer_name}: {e}\n")
-
-            edb.close()
+                plot_layers(job_path, edb_version)
         else:
             tmp_dir = os.path.join(input_dir, "aedb_zip")
             remove_dir(tmp_dir)
@@ -112,23 +93,22 @@ def run(job_path, data=None, files=None, config=None):
 
             edb_dir = os.path.join(output_dir, "design.aedb")
             remove_dir(edb_dir)
-            shutil.copytree(aedb_folder, edb_dir)
+            # Move rather than copy so the job keeps a single copy of the design
+            shutil.move(aedb_folder, edb_dir)
+            remove_dir(tmp_dir)
 
             with open(os.path.join(output_dir, "rename.log"), "w") as fp:
                 fp.write(f"Uploaded {filename} extracted to design.aedb\n")
 
-            edb = Edb(edb_dir, edbversion=edb_version)
+            report_progress(40, "Opening design.aedb")
             xlsx_path = os.path.join(output_dir, "stackup.xlsx")
-            export_stackup(edb, xlsx_path, unit=unit)
+            edb_service.call("export_stackup", job_path, edb_version, xlsx_path=xlsx_path, unit=unit)
+            edb_service.call("build_snapshot", job_path, edb_version)
 
             # Plot all signal layers only when user requests layout images
             if show_layout:
-                try:
-                    for layer_name in edb.stackup.signal_layers:
-                        img_path = os.path.join(output_dir, f"{layer_name}.png")
-                        edb.nets.plot(layers=[layer_name], show=False, save_plot=img_path)
-                except Exception as e:
-                    with open(os.path.join(output_dir, "plot_error.log"), "a") as fp:
-                        fp.write(f"Failed to plot {layer_name}: {e}\n")
-
-            edb.close()
+                plot_layers(job_path, edb_version)
+
+        # Keep the conversion for later uploads of the same file, unless a layer failed
+        if not os.path.isfile(error_log):
+            design_cache.store(cache_key, job_path)
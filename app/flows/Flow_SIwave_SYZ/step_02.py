@@ -1,47 +1,10 @@
+import json
 import os
 import shutil
-import zipfile
-import openpyxl
-from pyedb import Edb
 from app.utils import is_file_locked
-
-def apply_xlsx(xlsx_path, edb_path, edb_version="2024.1"):
-    edb = Edb(edb_path, edbversion=edb_version)
-    wb = openpyxl.load_workbook(xlsx_path)
-    ws = wb["Stackup"]
-
-    unit = str(ws.cell(row=1, column=2).value or "mm").lower()
-
-    material_dic = {}
-    for row in ws.iter_rows(min_row=3, values_only=True):
-        layer_name, layer_type, thickness_val, permittivity, loss_tangent, conductivity = row
-        if unit == "mil":
-            # Convert from mil to meters: 1 mil = 0.0254 mm = 2.54e-5 m
-            thickness_m = float(thickness_val) * 25.4e-6
-        else:
-            thickness_m = float(thickness_val) / 1000.0
-        edb.stackup.stackup_layers[layer_name].thickness = thickness_m
-    
-        if layer_type == "signal":
-            if conductivity not in material_dic:
-                name = f'metal_{conductivity}'
-                mat = edb.materials.add_conductor_material(name, conductivity)
-                material_dic[conductivity] = mat
-                
-            edb.stackup.stackup_layers[layer_name].material = material_dic[conductivity].name
-        else:
-            if (permittivity, loss_tangent) not in material_dic:
-                name = f'dielectric_{permittivity}_{loss_tangent}'
-                mat = edb.materials.add_dielectric_material(name, 
-                                                            permittivity, 
-                                                            loss_tangent)
-                material_dic[(permittivity, loss_tangent)] = mat
-            
-            edb.stackup.stackup_layers[layer_name].material = material_dic[(permittivity, loss_tangent)].name
-    
-    edb.save()
-    edb.close_edb()
-
+from app import edb_service
+from app.stackup_io import FORMATS
+from app.executor import report_progress
 
 def run(job_path, data=None, files=None, config=None):
     input_dir = os.path.join(job_path, 'input')
@@ -52,6 +15,9 @@ def run(job_path, data=None, files=None, config=None):
     edb_version = (config or {}).get("edb_version", "2024.1")
     xlsx = files.get('xlsx_file') if files else None
     if xlsx and xlsx.filename:
+        ext = os.path.splitext(xlsx.filename)[1].lower()
+        if ext not in FORMATS:
+            return {'error': f"Unsupported stackup file; use {', '.join(FORMATS)}"}
         x_path = os.path.join(input_dir, xlsx.filename)
         xlsx.save(x_path)
 
@@ -64,11 +30,15 @@ def run(job_path, data=None, files=None, config=None):
                 )
             }
 
-        shutil.copy(x_path, os.path.join(output_dir, 'updated.xlsx'))
+        shutil.copy(x_path, os.path.join(output_dir, f'updated{ext}'))
 
         edb_dir = os.path.join(output_dir, 'design.aedb')
         if os.path.isdir(edb_dir):
-            apply_xlsx(x_path, edb_dir, edb_version)
+            report_progress(20, 'Applying stackup')
+            report = edb_service.call('apply_stackup', job_path, edb_version, xlsx_path=x_path)
+            with open(os.path.join(output_dir, 'stackup_changes.json'), 'w') as fp:
+                json.dump(report, fp, indent=2)
+            report_progress(90, f"{len(report['changed'])} of {report['layers']} layers changed")
 
             # Generate layer images for visualization
             # try:
@@ -82,15 +52,4 @@ def run(job_path, data=None, files=None, config=None):
             #     with open(os.path.join(output_dir, "plot_error.log"), "a") as fp:
             #         fp.write(f"Failed to plot {layer_name}: {e}\n")
 
-            # Create a zipped copy of the updated AEDB for easy download
-            zip_path = os.path.join(output_dir, 'updated_pyedb.zip')
-            if os.path.isfile(zip_path):
-                os.remove(zip_path)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, dirs, files in os.walk(edb_dir):
-                    for file in files:
-                        abs_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(abs_path, os.path.dirname(edb_dir))
-                        zf.write(abs_path, rel_path)
-
     return {}
@@ -1,7 +1,7 @@
 import os
 import json
 import re
-from pyedb import Edb
+from app import edb_service
 
 def normalize_value(value_str):
     """Normalize user entered value strings to EDG standard format."""
@@ -22,23 +22,17 @@ def run(job_path, data=None, files=None, config=None):
         return {}
 
     edb_version = (config or {}).get("edb_version", "2024.1")
-    edb = Edb(edb_dir, edbversion=edb_version)
-
     changes = {}
     if data:
         # Build lookup of part_name -> normalized value entered by user
-        for comp in edb.components.components.values():
-            key = f"val_{comp.part_name}"
-            if key in data and data[key]:
-                val = normalize_value(data[key])
-                if val and val != comp.value:
-                    changes[comp.part_name] = val
-        if changes:
-            for comp in edb.components.components.values():
-                if comp.part_name in changes:
-                    comp.value = changes[comp.part_name]
-            edb.save()
-    edb.close_edb()
+        values = {}
+        for key, value in data.items():
+            if key.startswith("val_") and value:
+                val = normalize_value(value)
+                if val:
+                    values[key[len("val_"):]] = val
+        if values:
+            changes = edb_service.call("set_values", job_path, edb_version, values=values)
 
     if changes:
         with open(os.path.join(output_dir, "updated_values.json"), "w") as fp:
@@ -1,11 +1,110 @@
+import math
 import os
+import re
 import json
-import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.executor import report_progress
+from app import cutout_cache, edb_service, net_index, packaging
+from app.snapshot import design_hash
 from app.utils import remove_dir
-from pyedb import Edb
 
+EXTENT_TYPES = ("Bounding", "Conforming", "ConvexHull")
+DEFAULT_EXPANSION_MM = 2.0
+DEFAULT_THREADS = 4
+MAX_THREADS = 64
 
 
+def _names(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value else []
+        except ValueError:
+            return []
+    return [name for name in value if isinstance(name, str)] if isinstance(value, list) else []
+
+
+def _selection(data):
+    """Selected and power/ground net names posted by the page or a batch manifest.
+
+    The page posts ``selected_nets`` and ``pwr_nets`` as JSON lists; batch
+    manifests may still use one ``import_<net>`` / ``pwr_<net>`` field per net.
+    """
+    selected_nets = _names(data.get("selected_nets"))
+    pwr_nets = _names(data.get("pwr_nets"))
+    for key in data:
+        if key.startswith("import_") and data.get(key):
+            selected_nets.append(key[len("import_"):])
+        elif key.startswith("pwr_") and data.get(key):
+            pwr_nets.append(key[len("pwr_"):])
+    return selected_nets, pwr_nets
+
+
+def _options(data):
+    """Cutout options from the form; returns ``(options, error)``."""
+    extent_type = data.get("extent_type") or "Bounding"
+    if extent_type not in EXTENT_TYPES:
+        return None, f"Unknown extent type {extent_type}; use {', '.join(EXTENT_TYPES)}."
+    try:
+        expansion_mm = float(data.get("expansion_size") or DEFAULT_EXPANSION_MM)
+        threads = int(data.get("number_of_threads") or DEFAULT_THREADS)
+    except ValueError:
+        return None, "The expansion size and the number of threads must be numbers."
+    if not math.isfinite(expansion_mm) or expansion_mm < 0 or not 1 <= threads <= MAX_THREADS:
+        return None, f"Use a finite expansion size >= 0 and 1 to {MAX_THREADS} threads."
+    return {"extent_type": extent_type, "expansion_size": expansion_mm / 1000.0, "number_of_threads": threads}, None
+
+
+def _groups(data, nets):
+    """Extra cutouts posted as ``cutout_groups``: ``[{name, signal_nets, reference_nets}]``."""
+    try:
+        posted = json.loads(data.get("cutout_groups") or "[]")
+    except ValueError:
+        posted = []
+    groups = []
+    used = set()
+    for group in posted if isinstance(posted, list) else []:
+        if not isinstance(group, dict):
+            continue
+        signal_nets = net_index.known(nets, _names(group.get("signal_nets")))
+        if not signal_nets:
+            continue
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(group.get("name") or "")).strip("._")
+        name = name or f"group{len(groups) + 1}"
+        while name in used:
+            name += "_"
+        used.add(name)
+        groups.append({
+            "name": name,
+            "signal_nets": signal_nets,
+            "reference_nets": net_index.known(nets, _names(group.get("reference_nets"))),
+        })
+    return groups
+
+
+def _cut(job_path, edb_version, cutout, options, affinity=None, private=False):
+    """Run one cutout into the cache."""
+    key = cutout["key"]
+    try:
+        edb_service.call(
+            "cutout",
+            job_path,
+            edb_version,
+            affinity=affinity,
+            signal_nets=cutout["signal_nets"],
+            reference_nets=cutout["reference_nets"],
+            output_path=cutout_cache.entry_path(job_path, key),
+            private=private,
+            **options,
+        )
+    except Exception:
+        cutout_cache.discard(job_path, key)
+        raise
+    cutout_cache.store(job_path, key, {
+        "signal_nets": cutout["signal_nets"],
+        "reference_nets": cutout["reference_nets"],
+        "options": options,
+    })
+
 
 def run(job_path, data=None, files=None, config=None):
     output_dir = os.path.join(job_path, "output")
@@ -15,43 +114,70 @@ def run(job_path, data=None, files=None, config=None):
     if not os.path.isdir(edb_dir):
         return {}
 
+    data = data or {}
+    options, error = _options(data)
+    if error:
+        return {"error": error}
     edb_version = (config or {}).get("edb_version", "2024.1")
-    edb = Edb(edb_dir, edbversion=edb_version)
-    all_nets = list(edb.nets.nets.keys())
-
-    selected_nets = []
-    pwr_nets = []
-    if data:
-        for net in all_nets:
-            if data.get(f"import_{net}"):
-                selected_nets.append(net)
-            if data.get(f"pwr_{net}"):
-                pwr_nets.append(net)
+    job_id = os.path.basename(os.path.normpath(job_path))
+    selected_nets, pwr_nets = _selection(data)
+    groups = []
+    if selected_nets or pwr_nets or data.get("cutout_groups"):
+        nets = net_index.job_nets(job_path, edb_version)
+        selected_nets = net_index.known(nets, selected_nets)
+        pwr_nets = net_index.known(nets, pwr_nets)
+        groups = _groups(data, nets)
 
+    cutouts = []
     if selected_nets:
-        cutout_dir = os.path.join(output_dir, "cutout.aedb")
-        remove_dir(cutout_dir)
-        edb.cutout(
-            signal_list=selected_nets,
-            reference_list=pwr_nets,
-            extent_type="Bounding",
-            output_aedb_path=cutout_dir,
-            open_cutout_at_end=False,
-        )
+        cutouts.append({"signal_nets": selected_nets, "reference_nets": pwr_nets,
+                        "target": os.path.join(output_dir, "cutout.aedb")})
+    for group in groups:
+        cutouts.append(dict(group, target=os.path.join(output_dir, "cutouts", f"{group['name']}.aedb")))
+
+    # The thread count does not change the result
+    key_options = {"extent_type": options["extent_type"], "expansion_size": options["expansion_size"]}
+    design = design_hash(job_path)
+    for cutout in cutouts:
+        cutout["key"] = cutout_cache.cutout_key(design, cutout["signal_nets"], cutout["reference_nets"], key_options)
+        cutout["cached"] = cutout_cache.lookup(job_path, cutout["key"])
+    # Cutouts with the same nets share one cache entry; cut it once
+    pending = list({cutout["key"]: cutout for cutout in cutouts if not cutout["cached"]}.values())
+
+    if len(pending) == 1:
+        report_progress(20, "Running cutout")
+        _cut(job_path, edb_version, pending[0], options)
+    elif pending:
+        # Each cutout works on its own copy of the design in its own EDB worker
+        report_progress(20, f"Running {len(pending)} cutouts")
+        with ThreadPoolExecutor(max_workers=min(len(pending), edb_service.parallelism())) as pool:
+            futures = [
+                pool.submit(_cut, job_path, edb_version, cutout, options,
+                            affinity=f"{job_id}:cutout:{i}", private=True)
+                for i, cutout in enumerate(pending)
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                report_progress(20 + 70 * done // len(pending), f"{done} of {len(pending)} cutouts done")
 
-        zip_path = os.path.join(output_dir, "cutout.zip")
-        if os.path.isfile(zip_path):
-            os.remove(zip_path)
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for root, dirs, files in os.walk(cutout_dir):
-                for file in files:
-                    abs_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(abs_path, os.path.dirname(cutout_dir))
-                    zf.write(abs_path, rel_path)
+    remove_dir(os.path.join(output_dir, "cutouts"))
+    for cutout in cutouts:
+        cutout_cache.materialize(job_path, cutout["key"], cutout["target"])
+    cutout_cache.prune(job_path, keep={cutout["key"] for cutout in cutouts})
 
-    edb.close_edb()
+    # Step 5 is the last EDB step; release the design and its license
+    edb_service.close_job(job_id)
 
+    info = {"selected_nets": selected_nets, "pwr_nets": pwr_nets}
+    info.update(options)
+    info["cached"] = bool(selected_nets) and cutouts[0]["cached"]
+    info["groups"] = [
+        {key: cutout[key] for key in ("name", "signal_nets", "reference_nets", "cached")}
+        for cutout in cutouts if "name" in cutout
+    ]
     with open(os.path.join(output_dir, "cutout_info.json"), "w") as fp:
-        json.dump({"selected_nets": selected_nets, "pwr_nets": pwr_nets}, fp)
+        json.dump(info, fp)
 
+    # Zip the downloads of Step 6 in the background
+    packaging.start(job_path, bundle=bool(data.get("bundle")))
     return {}
@@ -0,0 +1,424 @@
+"""Step queue shared by the nodes that execute flow steps.
+
+Every node (a process started by ``run.py``) registers itself with the
+queue, sends heartbeats and claims queued steps while it has free slots
+(see :mod:`app.executor`).  A step is described by plain data so any node
+can run it; it carries the job id, not a path, and each node resolves the
+job under its own ``jobs/`` folder.
+
+Each step carries the requirements of its resource class (see
+:mod:`app.scheduler`): Ansys license tokens, counted across all nodes, and
+CPUs and memory, counted per node.  EDB designs stay open after their step
+(pooled handles, page views), so each node also reports in its heartbeat
+the jobs whose design it holds open, and each of those counts as one
+license until it is closed.  Queued steps are claimed in priority
+order; a step's priority improves the longer it waits, so batch and heavy
+steps are not starved by a stream of interactive ones.
+
+Affinity: the first node to run a step of a job pins the job to its host,
+so later steps run where the workspace (and the job's open EDB designs)
+already are.  Another host only takes the job over when no live node is
+left on the pinned host.  A node whose heartbeat is older than the node
+timeout is considered lost; its running steps are queued again.
+
+Backends are selected by ``STEP_QUEUE_URL``:
+
+- ``memory://`` - in-process SQLite, a single node (the default)
+- ``sqlite:///<path>`` - a database file that every node
+  can reach, e.g. next to ``jobs/`` on shared storage
+
+Other backends (e.g. Redis) implement the methods of :class:`SqliteQueue`
+and are added to :data:`BACKENDS`.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    slots INTEGER,
+    running INTEGER DEFAULT 0,
+    started_at REAL,
+    heartbeat REAL,
+    edb_jobs TEXT DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL UNIQUE,
+    step TEXT,
+    user TEXT,
+    status TEXT NOT NULL,
+    node TEXT,
+    queued_at REAL,
+    started_at REAL,
+    attempts INTEGER DEFAULT 0,
+    payload TEXT,
+    origin TEXT DEFAULT 'interactive',
+    resource TEXT,
+    priority REAL DEFAULT 0,
+    licenses INTEGER DEFAULT 0,
+    cpus REAL DEFAULT 0,
+    memory_mb INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, queued_at);
+CREATE TABLE IF NOT EXISTS history (
+    resource TEXT,
+    origin TEXT,
+    queued_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_history_finished ON history (finished_at);
+CREATE TABLE IF NOT EXISTS affinity (
+    job_id TEXT PRIMARY KEY,
+    host TEXT
+);
+"""
+
+# Columns added to ``tasks`` after the first release of the queue
+TASK_COLUMNS = {
+    'origin': "TEXT DEFAULT 'interactive'",
+    'resource': 'TEXT',
+    'priority': 'REAL DEFAULT 0',
+    'licenses': 'INTEGER DEFAULT 0',
+    'cpus': 'REAL DEFAULT 0',
+    'memory_mb': 'INTEGER DEFAULT 0',
+}
+
+# Columns added to ``nodes`` after the first release of the queue
+NODE_COLUMNS = {
+    'edb_jobs': "TEXT DEFAULT '[]'",
+}
+
+# Finished steps kept for the wait and run time statistics
+HISTORY_SECONDS = 24 * 3600
+
+
+def _record(row):
+    record = dict(row)
+    record['payload'] = json.loads(record['payload'] or '{}')
+    return record
+
+
+def _rank(row, now, aging):
+    """Sort key of a queued step: priority, less one level per ``aging`` s waited."""
+    waited = now - row['queued_at']
+    return (row['priority'] - (waited / aging if aging > 0 else 0), row['queued_at'], row['seq'])
+
+
+class SqliteQueue:
+    """Queue kept in a SQLite database; ``':memory:'`` for a single process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._shared = None
+        if path == ':memory:':
+            self._shared = self._connect(check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db()
+
+    def _connect(self, **kwargs):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None, **kwargs)
+        db.row_factory = sqlite3.Row
+        if self.path != ':memory:':
+            db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(tasks)')}
+        for name, definition in TASK_COLUMNS.items():
+            if name not in columns:
+                db.execute(f'ALTER TABLE tasks ADD COLUMN {name} {definition}')
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(nodes)')}
+        for name, definition in NODE_COLUMNS.items():
+            if name not in columns:
+                db.execute(f'ALTER TABLE nodes ADD COLUMN {name} {definition}')
+        return db
+
+    def _db(self):
+        if self._shared is not None:
+            return self._shared
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+
+    # Nodes
+
+    def register(self, node_id, host, slots):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO nodes (id, host, slots, running, started_at, heartbeat) '
+                'VALUES (?, ?, ?, 0, ?, ?)', (node_id, host, slots, now, now))
+
+    def heartbeat(self, node_id, host, slots, running, edb_jobs=()):
+        """Refresh a node; re-registers it if it was declared lost meanwhile.
+
+        ``edb_jobs`` are the jobs whose EDB design the node holds open.
+        """
+        now = time.time()
+        edb_jobs = json.dumps(sorted(edb_jobs))
+        with self._transaction() as db:
+            updated = db.execute('UPDATE nodes SET heartbeat = ?, running = ?, slots = ?, edb_jobs = ? WHERE id = ?',
+                                 (now, running, slots, edb_jobs, node_id)).rowcount
+            if not updated:
+                db.execute(
+                    'INSERT INTO nodes (id, host, slots, running, started_at, heartbeat, edb_jobs) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', (node_id, host, slots, running, now, now, edb_jobs))
+
+    def unregister(self, node_id):
+        """Remove a node that shuts down; its running steps are queued again."""
+        with self._transaction() as db:
+            requeued = self._requeue(db, [node_id])
+            db.execute('DELETE FROM nodes WHERE id = ?', (node_id,))
+        return requeued
+
+    def nodes(self):
+        with self._lock:
+            rows = self._db().execute('SELECT * FROM nodes ORDER BY host, id').fetchall()
+        return [dict(row, edb_jobs=json.loads(row['edb_jobs'] or '[]')) for row in rows]
+
+    @staticmethod
+    def _idle_licenses(db, running, live_since):
+        """Jobs holding an open EDB design on a live node without a licensed step running."""
+        held = set()
+        for row in db.execute('SELECT edb_jobs FROM nodes WHERE heartbeat >= ?', (live_since,)):
+            held.update(json.loads(row['edb_jobs'] or '[]'))
+        return held - {row['job_id'] for row in running if row['licenses']}
+
+    def requeue_lost(self, timeout):
+        """Drop nodes without a heartbeat for ``timeout`` s; returns their requeued steps."""
+        deadline = time.time() - timeout
+        with self._transaction() as db:
+            lost = [row['id'] for row in db.execute('SELECT id FROM nodes WHERE heartbeat < ?', (deadline,))]
+            if not lost:
+                return []
+            requeued = self._requeue(db, lost)
+            db.executemany('DELETE FROM nodes WHERE id = ?', [(node_id,) for node_id in lost])
+        return requeued
+
+    @staticmethod
+    def _requeue(db, node_ids):
+        marks = ','.join('?' * len(node_ids))
+        rows = db.execute(f"SELECT * FROM tasks WHERE status = 'running' AND node IN ({marks})",
+                          node_ids).fetchall()
+        db.execute(
+            f"UPDATE tasks SET status = 'queued', started_at = NULL, attempts = attempts + 1 "
+            f"WHERE status = 'running' AND node IN ({marks})", node_ids)
+        return [_record(row) for row in rows]
+
+    # Tasks
+
+    def enqueue(self, record):
+        """Add a step; returns False if the job already has a queued or running step."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO tasks (id, job_id, step, user, status, queued_at, payload, "
+                "origin, resource, priority, licenses, cpus, memory_mb) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record['id'], record['job_id'], record['step'], record.get('user', ''),
+                 record.get('queued_at') or time.time(), json.dumps(record.get('payload') or {}),
+                 record.get('origin') or 'interactive', record.get('resource'), record.get('priority', 0),
+                 record.get('licenses', 0), record.get('cpus', 0), record.get('memory_mb', 0)))
+        return cursor.rowcount == 1
+
+    def claim(self, node_id, host, limits, node_timeout, can_run=None):
+        """Mark queued steps as running on ``node_id`` and return them.
+
+        ``limits`` holds the node's ``slots``, ``cpus`` and ``memory_mb``, the
+        cluster-wide ``licenses`` budget (None for no limit), ``per_user`` and
+        the priority ``aging`` in seconds.  Steps are taken in priority order,
+        skipping those that do not fit, interactive steps of users that
+        already run ``per_user`` of them anywhere, jobs pinned to another host
+        that still has a live node and steps ``can_run(record)`` rejects.  A
+        node without running steps always fits one step, however large.
+        """
+        now = time.time()
+        live_since = now - node_timeout
+        claimed = []
+        with self._transaction() as db:
+            live_hosts = {row['host'] for row in
+                          db.execute('SELECT DISTINCT host FROM nodes WHERE heartbeat >= ?', (live_since,))}
+            running = db.execute("SELECT * FROM tasks WHERE status = 'running'").fetchall()
+            # Open designs hold licenses too; a step of such a job reuses its design's
+            idle = self._idle_licenses(db, running, live_since)
+            licenses = sum(row['licenses'] for row in running) + len(idle)
+            mine = [row for row in running if row['node'] == node_id]
+            slots = len(mine)
+            cpus = sum(row['cpus'] for row in mine)
+            memory = sum(row['memory_mb'] for row in mine)
+            user_running = {}
+            for row in running:
+                if row['origin'] == 'interactive':
+                    user_running[row['user']] = user_running.get(row['user'], 0) + 1
+            rows = db.execute(
+                "SELECT tasks.rowid AS seq, tasks.*, affinity.host AS pinned FROM tasks "
+                "LEFT JOIN affinity ON affinity.job_id = tasks.job_id "
+                "WHERE tasks.status = 'queued'").fetchall()
+            rows.sort(key=lambda row: _rank(row, now, limits['aging']))
+            for row in rows:
+                if slots >= limits['slots']:
+                    break
+                if row['origin'] == 'interactive' and limits['per_user'] \
+                        and user_running.get(row['user'], 0) >= limits['per_user']:
+                    continue
+                if row['pinned'] and row['pinned'] != host and row['pinned'] in live_hosts:
+                    continue
+                needed = row['licenses'] - (1 if row['licenses'] and row['job_id'] in idle else 0)
+                if limits['licenses'] is not None and licenses + needed > limits['licenses']:
+                    continue
+                if slots and (cpus + row['cpus'] > limits['cpus']
+                              or memory + row['memory_mb'] > limits['memory_mb']):
+                    continue
+                record = _record(row)
+                if can_run is not None and not can_run(record):
+                    continue
+                db.execute("UPDATE tasks SET status = 'running', node = ?, started_at = ? WHERE id = ?",
+                           (node_id, now, row['id']))
+                db.execute('INSERT OR REPLACE INTO affinity (job_id, host) VALUES (?, ?)', (row['job_id'], host))
+                slots += 1
+                licenses += needed
+                if row['licenses']:
+                    idle.discard(row['job_id'])
+                cpus += row['cpus']
+                memory += row['memory_mb']
+                if row['origin'] == 'interactive':
+                    user_running[row['user']] = user_running.get(row['user'], 0) + 1
+                record.update(status='running', node=node_id, started_at=now)
+                claimed.append(record)
+        return claimed
+
+    def finish(self, task_id, node_id, attempts=None):
+        """Remove a step that ``node_id`` finished running and record its timings.
+
+        Returns False, and changes nothing, when the node no longer owns the
+        step: it was queued again as lost, possibly claimed since, or (with
+        ``attempts``) claimed again under a later attempt.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT * FROM tasks WHERE id = ? AND node = ? AND status = 'running'",
+                             (task_id, node_id)).fetchone()
+            if row is None or (attempts is not None and row['attempts'] != attempts):
+                return False
+            db.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+            db.execute('INSERT INTO history (resource, origin, queued_at, started_at, finished_at) '
+                       'VALUES (?, ?, ?, ?, ?)',
+                       (row['resource'], row['origin'], row['queued_at'], row['started_at'], now))
+            db.execute('DELETE FROM history WHERE finished_at < ?', (now - HISTORY_SECONDS,))
+        return True
+
+    def cancel(self, job_id):
+        """Drop the job's queued step; returns False if it is running."""
+        with self._transaction() as db:
+            running = db.execute("SELECT 1 FROM tasks WHERE job_id = ? AND status = 'running'",
+                                 (job_id,)).fetchone()
+            if running:
+                return False
+            db.execute('DELETE FROM tasks WHERE job_id = ?', (job_id,))
+        return True
+
+    def forget(self, job_id):
+        """Drop the affinity of a deleted job."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM affinity WHERE job_id = ?', (job_id,))
+
+    def task(self, job_id):
+        """The job's queued or running step, or None."""
+        with self._lock:
+            row = self._db().execute('SELECT * FROM tasks WHERE job_id = ?', (job_id,)).fetchone()
+        return _record(row) if row else None
+
+    def position(self, job_id, aging=0):
+        """1-based position of the job's queued step in claim order, or None."""
+        now = time.time()
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT rowid AS seq, job_id, priority, queued_at FROM tasks WHERE status = 'queued'").fetchall()
+        rows.sort(key=lambda row: _rank(row, now, aging))
+        for index, row in enumerate(rows):
+            if row['job_id'] == job_id:
+                return index + 1
+        return None
+
+    def queued_ids(self):
+        with self._lock:
+            rows = self._db().execute("SELECT id FROM tasks WHERE status = 'queued'").fetchall()
+        return {row['id'] for row in rows}
+
+    def stats(self, window=3600, node_timeout=None):
+        """Queue depth, license use, the nodes and per-class timings.
+
+        ``classes`` maps each resource class to its queued and running steps
+        and the mean wait and run seconds of the steps finished within the
+        last ``window`` seconds.  ``edb_licenses`` counts the open designs
+        of nodes seen within ``node_timeout`` seconds (all nodes when None)
+        that no running step accounts for.
+        """
+        now = time.time()
+        since = now - window
+        with self._lock:
+            db = self._db()
+            tasks = db.execute('SELECT job_id, status, resource, licenses FROM tasks').fetchall()
+            running = [row for row in tasks if row['status'] == 'running']
+            idle = self._idle_licenses(db, running, now - node_timeout if node_timeout else 0)
+            history = db.execute(
+                'SELECT resource, COUNT(*) AS n, AVG(started_at - queued_at) AS wait, '
+                'AVG(finished_at - started_at) AS run FROM history '
+                'WHERE finished_at >= ? AND started_at IS NOT NULL GROUP BY resource', (since,)).fetchall()
+        classes = {}
+        for row in tasks:
+            entry = classes.setdefault(row['resource'], {'queued': 0, 'running': 0})
+            entry[row['status']] = entry.get(row['status'], 0) + 1
+        for row in history:
+            entry = classes.setdefault(row['resource'], {'queued': 0, 'running': 0})
+            entry.update(finished=row['n'], mean_wait=round(row['wait'], 1), mean_run=round(row['run'], 1))
+        return {
+            'queued': sum(1 for row in tasks if row['status'] == 'queued'),
+            'running': sum(1 for row in tasks if row['status'] == 'running'),
+            'licenses_in_use': sum(row['licenses'] for row in running) + len(idle),
+            'edb_licenses': len(idle),
+            'classes': classes,
+            'nodes': self.nodes(),
+        }
+
+
+def _sqlite(location):
+    return SqliteQueue(location)
+
+
+def _memory(location):
+    return SqliteQueue(':memory:')
+
+
+BACKENDS = {'memory': _memory, 'sqlite': _sqlite}
+
+
+def open_queue(url):
+    """Create the queue backend for a ``scheme://location`` URL."""
+    scheme, sep, location = url.partition('://')
+    if location.startswith('/'):
+        # sqlite:///relative.db, sqlite:////abs/path.db, sqlite:///C:\path.db
+        location = location[1:]
+    if not sep or scheme not in BACKENDS or (scheme == 'sqlite' and not location):
+        raise ValueError(f'Unsupported STEP_QUEUE_URL: {url}')
+    return BACKENDS[scheme](location)
@@ -0,0 +1,203 @@
+"""Render signal layer images in parallel.
+
+The primitive geometry of the design is read from EDB once, then every
+signal layer is drawn in its own process with the matplotlib Agg backend.
+A layer that fails to render is logged to ``plot_error.log`` without
+stopping the others.  Images are written as ``<layer>.png`` in the output
+directory, the names the Step 2 viewer expects, together with a tile
+pyramid per layer under ``tiles/<layer>`` (see :mod:`app.tiles`).
+"""
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.tiles import build_pyramid
+from app.utils import remove_dir
+
+DEFAULT_DPI = 150
+
+
+def default_workers():
+    """Worker count from ``LAYER_RENDER_WORKERS`` or the number of CPUs."""
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context() and current_app.config.get('LAYER_RENDER_WORKERS'):
+            return int(current_app.config['LAYER_RENDER_WORKERS'])
+    except ImportError:
+        pass
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _ring(primitive):
+    xs, ys = primitive.points()
+    return list(zip(xs, ys))
+
+
+def extract_geometry(edb, layers):
+    """Return ``{layer: [(net, outline, [voids])]}`` and the overall bounds."""
+    geometry = {name: [] for name in layers}
+    bounds = [float('inf'), float('inf'), float('-inf'), float('-inf')]
+    for prim in edb.modeler.primitives:
+        layer = prim.layer_name
+        if layer not in geometry:
+            continue
+        try:
+            outline = _ring(prim)
+            voids = [_ring(void) for void in prim.voids]
+        except Exception:
+            continue
+        if len(outline) < 3:
+            continue
+        for x, y in outline:
+            bounds[0] = min(bounds[0], x)
+            bounds[1] = min(bounds[1], y)
+            bounds[2] = max(bounds[2], x)
+            bounds[3] = max(bounds[3], y)
+        geometry[layer].append((prim.net_name or '', outline, voids))
+    return geometry, bounds
+
+
+def _signed_area(ring):
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area / 2.0
+
+
+def _net_color(net, cmap):
+    return cmap(zlib.crc32(net.encode()) % cmap.N)
+
+
+def render_layer(layer_name, shapes, bounds, img_path, dpi=DEFAULT_DPI):
+    """Draw one layer to ``img_path``; runs inside a worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path
+
+    def closed_path(ring):
+        # Path(closed=True) replaces the last vertex with CLOSEPOLY
+        return Path(list(ring) + [ring[0]], closed=True)
+
+    cmap = plt.get_cmap('tab20')
+    patches = []
+    colors = []
+    for net, outline, voids in shapes:
+        orientation = _signed_area(outline) >= 0
+        rings = [closed_path(outline)]
+        for void in voids:
+            if len(void) < 3:
+                continue
+            if (_signed_area(void) >= 0) == orientation:
+                void = void[::-1]
+            rings.append(closed_path(void))
+        patches.append(PathPatch(Path.make_compound_path(*rings)))
+        colors.append(_net_color(net, cmap))
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    try:
+        ax.add_collection(PatchCollection(patches, facecolors=colors, edgecolors='none'))
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
+        ax.set_aspect('equal')
+        ax.set_title(layer_name)
+        ax.axis('off')
+        fig.savefig(img_path, dpi=dpi, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return img_path
+
+
+def render_and_tile(layer_name, shapes, bounds, img_path, dpi=DEFAULT_DPI, tiles_dir=None):
+    """Render one layer and cut its tile pyramid.
+
+    Returns ``(img_path, tile_error)``; a tiling failure keeps the PNG.
+    """
+    render_layer(layer_name, shapes, bounds, img_path, dpi)
+    return img_path, _tile(img_path, tiles_dir)
+
+
+def _tile(img_path, tiles_dir):
+    if not tiles_dir:
+        return None
+    try:
+        build_pyramid(img_path, tiles_dir)
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def _log_error(output_dir, layer_name, error):
+    with open(os.path.join(output_dir, 'plot_error.log'), 'a') as fp:
+        fp.write(f'Failed to plot {layer_name}: {error}\n')
+
+
+def _tiles_dir(output_dir, layer_name, tiles):
+    return os.path.join(output_dir, 'tiles', layer_name) if tiles else None
+
+
+def _plot_serial(edb, layers, output_dir, progress=None, tiles=True):
+    """Fallback using ``edb.nets.plot`` one layer at a time."""
+    images = []
+    for idx, layer_name in enumerate(layers):
+        img_path = os.path.join(output_dir, f'{layer_name}.png')
+        try:
+            edb.nets.plot(layers=[layer_name], show=False, save_plot=img_path)
+            images.append(img_path)
+            tile_error = _tile(img_path, _tiles_dir(output_dir, layer_name, tiles))
+            if tile_error:
+                _log_error(output_dir, f'{layer_name} tiles', tile_error)
+        except Exception as e:
+            _log_error(output_dir, layer_name, e)
+        if progress:
+            progress(idx + 1, len(layers), layer_name)
+    return images
+
+
+def render_layers(edb, output_dir, workers=None, dpi=DEFAULT_DPI, progress=None, tiles=True):
+    """Write ``<layer>.png`` for every signal layer and return the image paths.
+
+    With ``tiles`` a tile pyramid is also written for each layer.
+    ``progress`` is called as ``progress(done, total, layer_name)`` after
+    each layer finishes.
+    """
+    layers = list(edb.stackup.signal_layers)
+    remove_dir(os.path.join(output_dir, 'tiles'))
+    if not layers:
+        return []
+    try:
+        geometry, bounds = extract_geometry(edb, layers)
+    except Exception as e:
+        _log_error(output_dir, '(geometry)', e)
+        geometry = None
+    if not geometry or not any(geometry.values()):
+        return _plot_serial(edb, layers, output_dir, progress, tiles)
+
+    workers = workers or default_workers()
+    images = []
+    done = 0
+    # spawn: forking a process that has .NET loaded is not safe
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(layers)), mp_context=ctx) as pool:
+        futures = {
+            pool.submit(render_and_tile, name, geometry[name], bounds,
+                        os.path.join(output_dir, f'{name}.png'), dpi,
+                        _tiles_dir(output_dir, name, tiles)): name
+            for name in layers
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                img_path, tile_error = future.result()
+                images.append(img_path)
+                if tile_error:
+                    _log_error(output_dir, f'{name} tiles', tile_error)
+            except Exception as e:
+                _log_error(output_dir, name, e)
+            done += 1
+            if progress:
+                progress(done, len(layers), name)
+    return images
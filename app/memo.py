@@ -0,0 +1,120 @@
+"""Reuse the result of a step whose inputs have not changed.
+
+When a step succeeds its outputs are kept as the snapshot
+``workspace/<step>.result`` and the fingerprint of its inputs is written to
+``cache/memo.json``.  The fingerprint covers the step module source, the
+form fields, the uploaded files, the design, the other job outputs and the
+user configuration.  Submitting the step again with the same fingerprint
+links the recorded outputs back into place instead of running it.  The
+executor computes the fingerprint on the worker, since hashing large inputs
+takes a while; a file sent through the chunked upload API is represented by
+the checksums verified during the upload instead of being read again.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+
+from app.snapshot import design_hash, file_hash, upload_checksum
+from app.workspace import has_snapshot, restore, snapshot_step
+
+MEMO_VERSION = 1
+# Covered by the design hash, or derived from other outputs
+_OUTPUT_SKIP = ('design.aedb', 'tiles')
+
+_lock = threading.Lock()
+
+
+def memo_path(job_path):
+    return os.path.join(job_path, 'cache', 'memo.json')
+
+
+def _result_name(step):
+    return f'{step}.result'
+
+
+def _form_items(data):
+    if data is None:
+        return []
+    if hasattr(data, 'lists'):
+        return sorted((key, values) for key, values in data.lists())
+    return sorted((key, [value]) for key, value in data.items())
+
+
+def _outputs_digest(job_path, digest):
+    output_dir = os.path.join(job_path, 'output')
+    for root, dirs, files in os.walk(output_dir):
+        if root == output_dir:
+            dirs[:] = [d for d in dirs if d not in _OUTPUT_SKIP]
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update(os.path.relpath(path, output_dir).encode())
+            digest.update(struct.pack('<QQ', st.st_size, st.st_mtime_ns))
+
+
+def fingerprint(step_module, job_path, data=None, staged=None, config=None):
+    """Hash of everything a step run depends on."""
+    digest = hashlib.sha256(f'memo-{MEMO_VERSION}'.encode())
+    with open(step_module, 'rb') as fh:
+        digest.update(hashlib.sha256(fh.read()).digest())
+    form = _form_items(data)
+    digest.update(json.dumps(form).encode())
+    for field in sorted(staged or {}):
+        for filename, path, _ in staged[field]:
+            digest.update(f'{field}:{filename}:{file_hash(path)}'.encode())
+    uploaded = data.get('uploaded_file') if data else None
+    if uploaded:
+        name = os.path.basename(uploaded)
+        checksum = upload_checksum(job_path, name) or file_hash(os.path.join(job_path, 'input', name))
+        digest.update(f'uploaded:{checksum}'.encode())
+    digest.update(f'design:{design_hash(job_path)}'.encode())
+    _outputs_digest(job_path, digest)
+    digest.update(json.dumps(config or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _load(job_path):
+    try:
+        with open(memo_path(job_path)) as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def lookup(job_path, step, fp):
+    """True when the last successful run of ``step`` had fingerprint ``fp``."""
+    entry = _load(job_path).get(step)
+    return bool(entry and entry.get('fingerprint') == fp
+                and has_snapshot(job_path, _result_name(step)))
+
+
+def record(job_path, step, fp):
+    """Keep the current outputs as the result of ``step`` for ``fp``."""
+    try:
+        # Every later step unshares what it writes when its own snapshot is taken
+        snapshot_step(job_path, _result_name(step), writes=())
+    except OSError:
+        return
+    path = memo_path(job_path)
+    with _lock:
+        memo = _load(job_path)
+        memo[step] = {'fingerprint': fp}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as fp_out:
+            json.dump(memo, fp_out)
+        os.replace(tmp_path, path)
+
+
+def reuse(job_path, step):
+    """Put the recorded outputs of ``step`` in place.
+
+    Pooled EDB handles of the job must be closed by the caller first.
+    """
+    restore(job_path, _result_name(step))
@@ -0,0 +1,124 @@
+"""Filtered, paginated views of a job's nets for the Step 5 nets API.
+
+The net names and their power/ground classification come from the design
+snapshot.  They are kept in memory per job while the design and the
+snapshot file are unchanged, so paging through a board with tens of
+thousands of nets does not parse the snapshot on every request.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from app.snapshot import design_hash, get_snapshot, snapshot_path
+
+MAX_CACHED = 32
+MAX_LIMIT = 1000
+MAX_PATTERN = 200
+KINDS = ('all', 'power', 'signal')
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+class NetQueryError(ValueError):
+    """The filter of a nets query is invalid."""
+
+
+class _Nets:
+    def __init__(self, names, power):
+        self.names = names
+        self.power = power
+        self._sorted = None
+
+    def sorted_names(self):
+        if self._sorted is None:
+            self._sorted = sorted(self.names, key=_natural_key)
+        return self._sorted
+
+
+def _natural_key(name):
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part.lower())
+            for part in re.split(r'(\d+)', name) if part]
+
+
+def _stamp(job_path):
+    try:
+        st = os.stat(snapshot_path(job_path))
+    except OSError:
+        return None
+    return design_hash(job_path), st.st_size, st.st_mtime_ns
+
+
+def job_nets(job_path, edb_version='2024.1'):
+    """The nets of a job from its snapshot, extracting it when stale."""
+    stamp = _stamp(job_path)
+    with _lock:
+        entry = _cache.get(job_path)
+        if entry is not None and stamp is not None and entry[0] == stamp:
+            _cache.move_to_end(job_path)
+            return entry[1]
+    snapshot = get_snapshot(job_path, edb_version)
+    nets = _Nets(list(snapshot.get('nets', [])), frozenset(snapshot.get('power_nets', [])))
+    stamp = _stamp(job_path)
+    if stamp is not None:
+        with _lock:
+            _cache[job_path] = (stamp, nets)
+            _cache.move_to_end(job_path)
+            while len(_cache) > MAX_CACHED:
+                _cache.popitem(last=False)
+    return nets
+
+
+def query(nets, pattern=None, prefix=None, kind='all', offset=0, limit=200, order=None, regex=False):
+    """One page of the nets matching a filter.
+
+    ``pattern`` is a case-insensitive substring of the name, or a regular
+    expression searched in it when ``regex`` is true.  Patterns are capped
+    at ``MAX_PATTERN`` characters.  ``prefix`` is a case-insensitive name
+    prefix and ``kind`` one of
+    ``all``, ``power`` (power/ground nets) or ``signal``.  ``order`` is
+    None for design order, ``name`` or ``-name``.  Returns
+    ``{'nets': [{'name', 'power'}], 'matched', 'total', 'offset', 'limit'}``.
+    """
+    if kind not in KINDS:
+        raise NetQueryError(f"Unknown net kind {kind!r}; use {', '.join(KINDS)}")
+    if pattern and len(pattern) > MAX_PATTERN:
+        raise NetQueryError(f'The filter is longer than {MAX_PATTERN} characters')
+    try:
+        matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE) if pattern else None
+    except re.error as e:
+        raise NetQueryError(f'Invalid filter: {e}') from None
+    names = nets.sorted_names() if order in ('name', '-name') else nets.names
+    if order == '-name':
+        names = names[::-1]
+    if prefix:
+        prefix = prefix.lower()
+        names = [name for name in names if name.lower().startswith(prefix)]
+    if kind == 'power':
+        names = [name for name in names if name in nets.power]
+    elif kind == 'signal':
+        names = [name for name in names if name not in nets.power]
+    if matcher is not None:
+        names = [name for name in names if matcher.search(name)]
+    offset = max(0, offset)
+    limit = max(1, min(limit, MAX_LIMIT))
+    return {
+        'nets': [{'name': name, 'power': name in nets.power} for name in names[offset:offset + limit]],
+        'matched': len(names),
+        'total': len(nets.names),
+        'offset': offset,
+        'limit': limit,
+    }
+
+
+def known(nets, names):
+    """The entries of ``names`` that are nets of the design, without duplicates."""
+    valid = set(nets.names)
+    seen = set()
+    result = []
+    for name in names:
+        if name in valid and name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
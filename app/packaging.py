@@ -0,0 +1,251 @@
+"""Background packaging of a job's Step 6 downloads.
+
+When Step 5 completes, the cutouts and the design are zipped into
+``cache/archives`` (see :func:`app.archive.archive_cache_path`) on a small
+thread pool, so the Step 6 page never waits for a zip.  Its download
+route serves these files directly once they are current.  Progress is kept
+in ``cache/package.json``::
+
+    {"state": "running", "level": "fast", "bundle": true,
+     "updated_at": ..., "artifacts": [{"name": "cutout.zip", "state": "done", "size": ...}, ...]}
+
+The optional bundle is one zip of the cutouts, the stackup sheet and the
+JSON reports of Steps 3 to 5, described by a ``manifest.json`` entry.
+A run that stopped updating ``updated_at`` for ``PACKAGE_STALE_SECONDS``
+(for example because its process died) is started again by :func:`ensure`.
+A failed run is kept, so polling does not zip again and again; it is
+started again on an explicit retry or once its sources changed, which
+``inputs`` (a hash of the source files) records.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.archive import (LEVELS, archive_cache_path, collect_entries, file_entry, is_current,
+                         manifest_hash, read_manifest, write_archive, write_entries)
+
+BUNDLE_NAME = 'bundle'
+BUNDLE_FILES = ('stackup.xlsx', 'renamed_components.json', 'updated_values.json', 'cutout_info.json')
+BUNDLE_DIRS = ('cutout.aedb', 'cutouts')
+
+_settings = {'level': 'fast', 'workers': 2, 'stale': 120.0}
+_lock = threading.Lock()
+_active = set()
+_pool = {'executor': None}
+
+
+def init_app(app):
+    app.config.setdefault('PACKAGE_ZIP_LEVEL', 'fast')
+    app.config.setdefault('PACKAGE_WORKERS', 2)
+    app.config.setdefault('PACKAGE_STALE_SECONDS', 120)
+    if app.config['PACKAGE_ZIP_LEVEL'] not in LEVELS:
+        raise ValueError(f"PACKAGE_ZIP_LEVEL must be one of {', '.join(LEVELS)}")
+    _settings['level'] = app.config['PACKAGE_ZIP_LEVEL']
+    _settings['workers'] = max(1, int(app.config['PACKAGE_WORKERS']))
+    _settings['stale'] = float(app.config['PACKAGE_STALE_SECONDS'])
+
+
+def status_path(job_path):
+    return os.path.join(job_path, 'cache', 'package.json')
+
+
+def bundle_path(job_path):
+    return archive_cache_path(job_path, BUNDLE_NAME, _settings['level'])
+
+
+def artifacts(job_path, bundle=False):
+    """The downloads of a job: ``[{'name', 'subpath'}]``; the bundle has no subpath."""
+    output_dir = os.path.join(job_path, 'output')
+    found = []
+    if os.path.isdir(os.path.join(output_dir, 'cutout.aedb')):
+        found.append({'name': 'cutout.zip', 'subpath': 'output/cutout.aedb'})
+    groups_dir = os.path.join(output_dir, 'cutouts')
+    if os.path.isdir(groups_dir):
+        for name in sorted(os.listdir(groups_dir)):
+            if name.endswith('.aedb'):
+                found.append({'name': f'cutout_{name[:-len(".aedb")]}.zip', 'subpath': f'output/cutouts/{name}'})
+    if os.path.isdir(os.path.join(output_dir, 'design.aedb')):
+        found.append({'name': 'design.aedb.zip', 'subpath': 'output/design.aedb'})
+    if bundle:
+        job_id = os.path.basename(os.path.normpath(job_path))
+        found.append({'name': f'{job_id}_bundle.zip', 'subpath': None})
+    return found
+
+
+def load_status(job_path):
+    try:
+        with open(status_path(job_path)) as fp:
+            return json.load(fp)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+
+def _save_status(job_path, status):
+    path = status_path(job_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(status, fp)
+    os.replace(tmp_path, path)
+
+
+def _bundle_entries(job_path):
+    """Entries of the bundle, without its manifest."""
+    output_dir = os.path.join(job_path, 'output')
+    entries = []
+    for name in BUNDLE_DIRS:
+        if os.path.isdir(os.path.join(output_dir, name)):
+            entries.extend(collect_entries(os.path.join(output_dir, name)))
+    for name in BUNDLE_FILES:
+        if os.path.isfile(os.path.join(output_dir, name)):
+            entries.append(file_entry(os.path.join(output_dir, name), name))
+    return entries
+
+
+def _write_bundle(job_path):
+    """Write the bundle unless its sources are unchanged; returns its path."""
+    zip_path = bundle_path(job_path)
+    entries = _bundle_entries(job_path)
+    digest = manifest_hash(entries, _settings['level'])
+    if os.path.isfile(zip_path) and (read_manifest(zip_path) or {}).get('hash') == digest:
+        return zip_path
+    items = {}
+    for entry in entries:
+        parts = entry.arcname.decode('utf-8').split('/')
+        top = '/'.join(parts[:2]) if parts[0] == 'cutouts' else parts[0]
+        item = items.setdefault(top, {'path': top, 'files': 0, 'bytes': 0})
+        item['files'] += 1
+        item['bytes'] += entry.size
+    manifest = {
+        'job_id': os.path.basename(os.path.normpath(job_path)),
+        'created_at': time.time(),
+        'items': list(items.values()),
+    }
+    manifest_file = os.path.join(os.path.dirname(zip_path), f'{BUNDLE_NAME}.manifest.json')
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+    write_entries(entries + [file_entry(manifest_file, 'manifest.json')], zip_path,
+                  _settings['level'], manifest={'hash': digest})
+    return zip_path
+
+
+def _is_packaged(job_path, artifact):
+    if artifact['subpath'] is None:
+        zip_path = bundle_path(job_path)
+        digest = manifest_hash(_bundle_entries(job_path), _settings['level'])
+        return os.path.isfile(zip_path) and (read_manifest(zip_path) or {}).get('hash') == digest
+    src_dir = os.path.join(job_path, artifact['subpath'])
+    return is_current(src_dir, archive_cache_path(job_path, artifact['subpath'], _settings['level']))
+
+
+def _inputs_hash(job_path, found):
+    """Hash of the source files of the artifacts ``found``."""
+    entries = []
+    for artifact in found:
+        if artifact['subpath'] is None:
+            entries.extend(_bundle_entries(job_path))
+        else:
+            entries.extend(collect_entries(os.path.join(job_path, artifact['subpath'])))
+    return manifest_hash(entries, _settings['level'])
+
+
+def _heartbeat(job_path, done):
+    while not done.wait(max(1.0, _settings['stale'] / 4)):
+        with _lock:
+            status = load_status(job_path)
+            if status is not None:
+                status['updated_at'] = time.time()
+                _save_status(job_path, status)
+
+
+def _update(job_path, status, index=None, **fields):
+    with _lock:
+        target = status if index is None else status['artifacts'][index]
+        target.update(fields)
+        status['updated_at'] = time.time()
+        _save_status(job_path, status)
+
+
+def _package(job_path, status):
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_path, done), name='package-heartbeat', daemon=True).start()
+    try:
+        for index, artifact in enumerate(status['artifacts']):
+            _update(job_path, status, index, state='running')
+            try:
+                if artifact['subpath'] is None:
+                    zip_path = _write_bundle(job_path)
+                else:
+                    zip_path = archive_cache_path(job_path, artifact['subpath'], _settings['level'])
+                    write_archive(os.path.join(job_path, artifact['subpath']), zip_path, _settings['level'])
+                _update(job_path, status, index, state='done', size=os.path.getsize(zip_path))
+            except Exception as e:
+                _update(job_path, status, index, state='failed', error=str(e))
+        failed = any(artifact['state'] == 'failed' for artifact in status['artifacts'])
+        _update(job_path, status, state='failed' if failed else 'done', finished_at=time.time())
+    finally:
+        done.set()
+        with _lock:
+            _active.discard(job_path)
+
+
+def start(job_path, bundle=False):
+    """Package the downloads of a job in the background; returns the new status.
+
+    Archives that are already current are kept, so restarting is cheap.
+    Returns the current status when the job is being packaged already.
+    """
+    found = artifacts(job_path, bundle)
+    inputs = _inputs_hash(job_path, found)
+    with _lock:
+        if job_path in _active:
+            return load_status(job_path)
+        _active.add(job_path)
+        if _pool['executor'] is None:
+            _pool['executor'] = ThreadPoolExecutor(max_workers=_settings['workers'], thread_name_prefix='package')
+        now = time.time()
+        status = {
+            'state': 'running',
+            'level': _settings['level'],
+            'bundle': bool(bundle),
+            'started_at': now,
+            'updated_at': now,
+            'inputs': inputs,
+            'artifacts': [dict(artifact, state='pending', size=None) for artifact in found],
+        }
+        _save_status(job_path, status)
+    _pool['executor'].submit(_package, job_path, status)
+    return status
+
+
+def ensure(job_path, bundle=None, retry=False):
+    """The packaging status of a job, starting a run when the archives are out of date.
+
+    ``bundle`` None keeps the choice of the previous run.  A failed run is
+    returned as it is unless ``retry`` is true or its sources changed.
+    """
+    status = load_status(job_path)
+    with _lock:
+        if job_path in _active:
+            return status
+    if bundle is None:
+        bundle = bool(status and status.get('bundle'))
+    if status is not None and status.get('state') == 'running':
+        if time.time() - status.get('updated_at', 0) < _settings['stale']:
+            # Packaged by another process
+            return status
+    elif (status is not None and status.get('state') == 'failed' and not retry
+          and status.get('level') == _settings['level'] and bool(status.get('bundle')) == bundle):
+        if status.get('inputs') == _inputs_hash(job_path, artifacts(job_path, bundle)):
+            return status
+    elif (status is not None and status.get('state') == 'done' and status.get('level') == _settings['level']
+          and bool(status.get('bundle')) == bundle):
+        expected = artifacts(job_path, bundle)
+        listed = [(artifact['name'], artifact['subpath']) for artifact in status['artifacts']]
+        if listed == [(artifact['name'], artifact['subpath']) for artifact in expected] and \
+                all(_is_packaged(job_path, artifact) for artifact in expected):
+            return status
+    return start(job_path, bundle)
@@ -0,0 +1,238 @@
+"""SQLite index of job metadata.
+
+``metadata.json`` in each job folder stays the source of truth; every write
+of it goes through :func:`app.utils.save_metadata`, which also records the
+job here.  Listing jobs is then an indexed query instead of a scan of
+``jobs/*/metadata.json``.  The index can be rebuilt from disk at any time::
+
+    python -m app.registry rebuild
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from app import events
+from app.utils import parse_timestamp
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_DIR = os.path.join(os.path.dirname(BASE_DIR), 'jobs')
+
+_settings = {'path': os.path.join(JOB_DIR, 'registry.sqlite3')}
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user TEXT,
+    flow_id TEXT,
+    topic TEXT,
+    step TEXT,
+    status TEXT,
+    created_at REAL,
+    updated_at REAL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_step ON jobs (step);
+CREATE TABLE IF NOT EXISTS revisions (
+    user TEXT PRIMARY KEY,
+    rev INTEGER NOT NULL
+);
+"""
+
+
+def init_app(app):
+    path = app.config.setdefault('JOB_REGISTRY_PATH', _settings['path'])
+    _settings['path'] = path
+    db = connect()
+    empty = db.execute('SELECT 1 FROM jobs LIMIT 1').fetchone() is None
+    if empty:
+        rebuild(os.path.dirname(path))
+
+
+def connect():
+    """Return this thread's connection, creating the schema on first use."""
+    db = getattr(_local, 'db', None)
+    if db is not None and _local.path == _settings['path']:
+        return db
+    os.makedirs(os.path.dirname(_settings['path']), exist_ok=True)
+    db = sqlite3.connect(_settings['path'], timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(SCHEMA)
+    _local.db = db
+    _local.path = _settings['path']
+    return db
+
+
+def _row(job_id, meta):
+    return (
+        job_id,
+        meta.get('user'),
+        meta.get('flow_id'),
+        meta.get('topic'),
+        meta.get('step'),
+        meta.get('status'),
+        parse_timestamp(meta.get('created_at')),
+        time.time(),
+        json.dumps(meta),
+    )
+
+
+def _bump_revision(db, user):
+    db.execute(
+        'INSERT INTO revisions (user, rev) VALUES (?, 1) '
+        'ON CONFLICT (user) DO UPDATE SET rev = rev + 1',
+        (user or '',),
+    )
+
+
+def _job_event(job_id, meta):
+    return {
+        'id': job_id,
+        'flow_id': meta.get('flow_id'),
+        'topic': meta.get('topic'),
+        'created_at': meta.get('created_at'),
+        'step': meta.get('step'),
+        'status': meta.get('status'),
+        'progress': meta.get('progress'),
+    }
+
+
+def _event_kind(old, new):
+    """Name the change between two metadata versions, or None if irrelevant."""
+    if old is None:
+        return 'created'
+    if old.get('step') != new.get('step'):
+        return 'completed' if new.get('step') == 'completed' else 'step'
+    if old.get('status') != new.get('status'):
+        return 'status'
+    if old.get('progress') != new.get('progress'):
+        return 'progress'
+    return None
+
+
+def record(job_id, meta):
+    """Insert or update the index entry of a job."""
+    db = connect()
+    with db:
+        row = db.execute('SELECT meta FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        old = None
+        if row is not None:
+            try:
+                old = json.loads(row['meta'])
+            except (TypeError, json.JSONDecodeError):
+                old = {}
+        db.execute(
+            'INSERT OR REPLACE INTO jobs '
+            '(id, user, flow_id, topic, step, status, created_at, updated_at, meta) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            _row(job_id, meta),
+        )
+        kind = _event_kind(old, meta)
+        if kind:
+            _bump_revision(db, meta.get('user'))
+    if kind:
+        events.publish(meta.get('user') or '', kind, _job_event(job_id, meta))
+
+
+def remove(job_id):
+    db = connect()
+    with db:
+        row = db.execute('SELECT user FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        if row is not None:
+            _bump_revision(db, row['user'])
+    if row is not None:
+        events.publish(row['user'] or '', 'deleted', {'id': job_id})
+
+
+def revision(username):
+    """Counter bumped on every visible change to ``username``'s jobs."""
+    row = connect().execute('SELECT rev FROM revisions WHERE user = ?', (username or '',)).fetchone()
+    return row[0] if row else 0
+
+
+def query_jobs(username=None, limit=None, offset=0):
+    """Return job metadata dicts, newest first."""
+    sql = 'SELECT id, meta FROM jobs'
+    args = []
+    if username is not None:
+        sql += ' WHERE user = ?'
+        args.append(username)
+    sql += ' ORDER BY created_at DESC'
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        args.extend([int(limit), int(offset)])
+    jobs = []
+    for row in connect().execute(sql, args):
+        meta = {'id': row['id']}
+        try:
+            meta.update(json.loads(row['meta']))
+        except (TypeError, json.JSONDecodeError):
+            pass
+        jobs.append(meta)
+    return jobs
+
+
+def count_jobs(username=None):
+    if username is None:
+        row = connect().execute('SELECT COUNT(*) FROM jobs').fetchone()
+    else:
+        row = connect().execute('SELECT COUNT(*) FROM jobs WHERE user = ?', (username,)).fetchone()
+    return row[0]
+
+
+def rebuild(job_dir=JOB_DIR):
+    """Re-create the index from every ``jobs/*/metadata.json``; returns the count.
+
+    The revision of every user, including users seen for the first time, is
+    bumped, so no client keeps an ETag from before the rebuild.
+    """
+    rows = []
+    if os.path.isdir(job_dir):
+        for job_id in os.listdir(job_dir):
+            meta_file = os.path.join(job_dir, job_id, 'metadata.json')
+            if not os.path.isfile(meta_file):
+                continue
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                meta = {}
+            rows.append(_row(job_id, meta))
+    db = connect()
+    with db:
+        db.execute('DELETE FROM jobs')
+        db.execute('UPDATE revisions SET rev = rev + 1')
+        db.executemany('INSERT OR IGNORE INTO revisions (user, rev) VALUES (?, 1)',
+                       [(user or '',) for user in {row[1] for row in rows}])
+        db.executemany(
+            'INSERT INTO jobs '
+            '(id, user, flow_id, topic, step, status, created_at, updated_at, meta) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain the job registry.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild_cmd = sub.add_parser('rebuild', help='Rebuild the index from jobs/*/metadata.json')
+    rebuild_cmd.add_argument('--jobs', default=JOB_DIR, help='Jobs directory')
+    rebuild_cmd.add_argument('--db', default=None, help='Registry database path')
+    args = parser.parse_args(argv)
+    if args.command == 'rebuild':
+        _settings['path'] = args.db or os.path.join(args.jobs, 'registry.sqlite3')
+        count = rebuild(args.jobs)
+        print(f'Indexed {count} jobs into {_settings["path"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,17 @@
 import json
 import uuid
 import os
-import importlib.util
-import zipfile
-from app.utils import remove_dir
-from pyedb import Edb
-from collections import defaultdict
+from app.utils import remove_dir, load_metadata, save_metadata, update_metadata
+from app import events, flow_registry, net_index, packaging, registry
+from app.edb_service import close_job
+from app.snapshot import get_snapshot
+from app.stackup_io import FORMATS as STACKUP_FORMATS
+from app.workspace import has_snapshot, rewind, snapshot_step
+from app.archive import LEVELS as ARCHIVE_LEVELS, archive_cache_path, archive_size, collect_entries, is_current, iter_zip
+from app.executor import ACTIVE_STATUSES, StepTask, cancel, is_active, queue_status, queue_summary, stage_files, submit_step
 from functools import wraps
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, request, session, make_response, send_from_directory, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, session, make_response, send_file, send_from_directory, jsonify, Response
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FLOW_DIR = os.path.join(BASE_DIR, 'flows')
@@ -16,6 +19,9 @@ JOB_DIR = os.path.join(os.path.dirname(BASE_DIR), 'jobs')
 USERS_FILE = os.path.join(os.path.dirname(BASE_DIR), 'users.json')
 GROUPS_FILE = os.path.join(os.path.dirname(BASE_DIR), 'groups.json')
 os.makedirs(JOB_DIR, exist_ok=True)
+JOBS_PER_PAGE = 50
+TILE_MAX_AGE = 365 * 24 * 3600
+DOWNLOAD_ZIP_LEVEL = 'fast'
 
 DEFAULT_CONFIG = {
     'aedt_version': '2025.1',
@@ -133,24 +139,6 @@ def admin_required(f):
     return decorated
 
 
-def parse_timestamp(ts):
-    if ts is None:
-        return 0
-    if isinstance(ts, (int, float)):
-        return ts
-    if isinstance(ts, str):
-        if ts.isdigit():
-            return int(ts)
-        try:
-            return datetime.fromisoformat(ts).timestamp()
-        except ValueError:
-            try:
-                return float(ts)
-            except ValueError:
-                return 0
-    return 0
-
-
 def format_timestamp(ts):
     if ts is None:
         return ''
@@ -183,54 +171,32 @@ def _dir_tree(path):
 
 
 def load_flows():
-    flows = []
-    if not os.path.isdir(FLOW_DIR):
-        return flows
-    for name in os.listdir(FLOW_DIR):
-        fdir = os.path.join(FLOW_DIR, name)
-        if os.path.isdir(fdir):
-            fjson = os.path.join(fdir, 'flow.json')
-            if os.path.isfile(fjson):
-                with open(fjson) as f:
-                    data = json.load(f)
-                    data['id'] = name
-                    # Determine group
-                    group = None
-                    for gname, items in GROUPS.items():
-                        if name in items:
-                            group = gname
-                            break
-                    data['group'] = group
-                    flows.append(data)
+    flows = flow_registry.flows()
+    for data in flows:
+        # Determine group
+        group = None
+        for gname, items in GROUPS.items():
+            if data['id'] in items:
+                group = gname
+                break
+        data['group'] = group
     return flows
 
 
-def load_jobs(username=None):
-    jobs = []
-    if not os.path.isdir(JOB_DIR):
-        return jobs
-    for job_id in os.listdir(JOB_DIR):
-        jdir = os.path.join(JOB_DIR, job_id)
-        if os.path.isdir(jdir):
-            meta_file = os.path.join(jdir, 'metadata.json')
-            meta = {'id': job_id}
-            if os.path.isfile(meta_file):
-                with open(meta_file) as f:
-                    try:
-                        meta.update(json.load(f))
-                    except json.JSONDecodeError:
-                        pass
-            if username is None or meta.get('user') == username:
-                jobs.append(meta)
-    def sort_key(item):
-        return parse_timestamp(item.get('created_at'))
-
-    jobs.sort(key=sort_key, reverse=True)
+def load_jobs(username=None, limit=None, offset=0):
+    jobs = registry.query_jobs(username, limit=limit, offset=offset)
     for job in jobs:
         job['created_at'] = format_timestamp(job.get('created_at'))
     return jobs
 
 
+def page_args(per_page=None):
+    """Return ``(page, limit, offset)`` from the ``page`` query argument."""
+    limit = per_page or JOBS_PER_PAGE
+    page = max(1, request.args.get('page', 1, type=int))
+    return page, limit, (page - 1) * limit
+
+
 @main_bp.route('/')
 @login_required
 def deck():
@@ -245,9 +211,12 @@ def deck():
             flows = [f for f in flows if f.get('group') == selected_group]
     user = current_user()
     username = user['username'] if user else None
-    jobs = load_jobs(username)
+    page, limit, offset = page_args()
+    jobs = load_jobs(username, limit=limit, offset=offset)
+    pages = max(1, -(-registry.count_jobs(username) // limit))
     resp = make_response(render_template('deck.html', flows=flows, jobs=jobs, groups=groups,
-                                         selected_group=selected_group))
+                                         selected_group=selected_group, page=page, pages=pages,
+                                         page_size=limit))
     resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, private'
     resp.headers['Pragma'] = 'no-cache'
     resp.headers['Expires'] = '0'
@@ -260,28 +229,170 @@ def api_jobs():
     """Return jobs for the current user as JSON."""
     user = current_user()
     username = user['username'] if user else None
-    jobs = load_jobs(username)
-    return jsonify({'jobs': jobs})
+    limit = request.args.get('limit', JOBS_PER_PAGE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    etag = f'jobs-{username}-{registry.revision(username)}-{limit}-{offset}'
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+        resp.set_etag(etag)
+        return resp
+    jobs = load_jobs(username, limit=limit, offset=offset)
+    resp = jsonify({'jobs': jobs, 'total': registry.count_jobs(username)})
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache, private'
+    return resp
 
 
-@main_bp.route('/flow/<flow_id>/start', methods=['POST'])
+@main_bp.route('/api/jobs/stream')
 @login_required
-def start_flow(flow_id):
+def api_jobs_stream():
+    """Stream job status deltas for the current user as server-sent events."""
+    user = current_user()
+    stream = events.open_stream(user['username'], request.headers.get('Last-Event-ID'))
+    if stream is None:
+        # All stream slots are busy; the client falls back to polling
+        resp = make_response('', 503)
+        resp.headers['Retry-After'] = '60'
+        return resp
+    resp = Response(stream, mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+@main_bp.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    """Return the execution status of a single job."""
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return jsonify({'error': 'Job not found'}), 404
+    line = queue_status(job_id) or {}
+    return jsonify({
+        'id': job_id,
+        'step': meta.get('step'),
+        'status': meta.get('status'),
+        'progress': meta.get('progress'),
+        'progress_message': meta.get('progress_message'),
+        'queue_position': line.get('position'),
+        'queue_depth': line.get('depth'),
+        'resource': line.get('resource') or meta.get('resource'),
+        'waited_seconds': line.get('waited'),
+        'typical_wait_seconds': line.get('typical_wait'),
+    })
+
+
+@main_bp.route('/api/jobs/<job_id>/nets')
+@login_required
+def api_job_nets(job_id):
+    """Return one page of a job's nets, filtered on the server.
+
+    Query arguments: ``q`` (substring, or regex with ``regex=1``),
+    ``prefix``, ``kind`` (all, power or signal), ``order`` (name or -name),
+    ``offset`` and ``limit``.
+    """
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return jsonify({'error': 'Job not found'}), 404
+    if not os.path.isdir(os.path.join(job_path, 'output', 'design.aedb')):
+        return jsonify({'error': 'The job has no design yet'}), 404
+    edb_version = user.get('config', {}).get('edb_version', '2024.1')
+    try:
+        page = net_index.query(
+            net_index.job_nets(job_path, edb_version),
+            pattern=request.args.get('q'),
+            prefix=request.args.get('prefix'),
+            kind=request.args.get('kind', 'all'),
+            offset=request.args.get('offset', 0, type=int),
+            limit=request.args.get('limit', 200, type=int),
+            order=request.args.get('order'),
+            regex=request.args.get('regex') == '1',
+        )
+    except net_index.NetQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    resp = jsonify(page)
+    resp.headers['Cache-Control'] = 'no-cache, private'
+    return resp
+
+
+def _package_view(job_id, status):
+    """The packaging status with a download URL for each finished artifact."""
+    if status is None:
+        return None
+    view = dict(status, artifacts=[])
+    for artifact in status['artifacts']:
+        url = None
+        if artifact['state'] == 'done':
+            if artifact['subpath'] is None:
+                url = url_for('main.get_job_bundle', job_id=job_id, name=artifact['name'])
+            else:
+                url = url_for('main.get_job_archive', job_id=job_id, subpath=artifact['subpath'],
+                              name=artifact['name'], level=status['level'])
+        view['artifacts'].append(dict(artifact, url=url))
+    return view
+
+
+@main_bp.route('/api/jobs/<job_id>/package', methods=['GET', 'POST'])
+@login_required
+def api_job_package(job_id):
+    """Return the Step 6 packaging status of a job.
+
+    ``POST`` with ``bundle=1`` (form or JSON) packages the job again, with or
+    without the bundle; archives that are current are kept.  It is also how
+    a failed run is retried.
+    """
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return jsonify({'error': 'Job not found'}), 404
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        status = packaging.ensure(job_path, bundle=bool(data.get('bundle')), retry=True)
+    else:
+        status = packaging.load_status(job_path)
+    if status is None:
+        return jsonify({'error': 'The job has not been packaged'}), 404
+    resp = jsonify(_package_view(job_id, status))
+    resp.headers['Cache-Control'] = 'no-cache, private'
+    return resp
+
+
+@main_bp.route('/api/queue')
+@login_required
+def api_queue():
+    """Return the step queue depth, license use and wait times per resource class."""
+    return jsonify(queue_summary())
+
+
+def create_job(flow_id, username, topic='', **extra):
+    """Create a job folder at the first step; returns ``(job_id, job_path)``."""
     job_id = str(uuid.uuid4())
     job_path = os.path.join(JOB_DIR, job_id)
     os.makedirs(job_path, exist_ok=True)
     os.makedirs(os.path.join(job_path, 'output'), exist_ok=True)
-    user = current_user()
-    topic = request.form.get('topic', '').strip()
     meta = {
         'flow_id': flow_id,
         'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
         'step': 'step_01',
-        'user': user['username'] if user else '',
+        'user': username,
         'topic': topic
     }
-    with open(os.path.join(job_path, 'metadata.json'), 'w') as f:
-        json.dump(meta, f)
+    meta.update(extra)
+    save_metadata(job_path, meta)
+    return job_id, job_path
+
+
+@main_bp.route('/flow/<flow_id>/start', methods=['POST'])
+@login_required
+def start_flow(flow_id):
+    user = current_user()
+    topic = request.form.get('topic', '').strip()
+    job_id, _ = create_job(flow_id, user['username'] if user else '', topic)
     return redirect(url_for('main.run_step', flow_id=flow_id, step='step_01', job_id=job_id))
 
 
@@ -301,7 +412,10 @@ def delete_job(job_id):
                     pass
         user = current_user()
         if user and (user.get('role') == 'admin' or owner == user.get('username')):
-            remove_dir(job_path)
+            if cancel(job_id):
+                close_job(job_id)
+                remove_dir(job_path)
+                registry.remove(job_id)
     return redirect(url_for('main.deck'))
 
 
@@ -312,17 +426,143 @@ def get_job_file(job_id, filename):
     job_output = os.path.join(JOB_DIR, job_id, 'output')
     job_input = os.path.join(JOB_DIR, job_id, 'input')
     if os.path.isfile(os.path.join(job_output, filename)):
+        if filename.startswith('tiles/'):
+            # Tile URLs carry the pyramid version, so they never go stale
+            response = send_from_directory(job_output, filename, max_age=TILE_MAX_AGE)
+            response.cache_control.immutable = True
+            return response
         return send_from_directory(job_output, filename)
     if os.path.isfile(os.path.join(job_input, filename)):
         return send_from_directory(job_input, filename)
+    if filename.endswith('.zip') and '/' not in filename and not filename.startswith('.'):
+        # Older links to a pre-zipped output directory
+        subpath = f"output/{filename[:-len('.zip')]}"
+        if os.path.isdir(os.path.join(JOB_DIR, job_id, subpath)):
+            return redirect(archive_url(job_id, subpath, filename))
     return 'File not found', 404
 
 
+def archive_url(job_id, subpath, download_name=None):
+    """URL of the streamed zip of a job subdirectory."""
+    return url_for('main.get_job_archive', job_id=job_id, subpath=subpath, name=download_name)
+
+
+@main_bp.route('/job/<job_id>/archive', defaults={'subpath': ''})
+@main_bp.route('/job/<job_id>/archive/<path:subpath>')
+@login_required
+def get_job_archive(job_id, subpath):
+    """Stream a zip of a job directory (``subpath`` empty for the whole job).
+
+    ``?level=store|fast|default|best`` picks the compression and ``?name=``
+    the download name.  A stored archive has a known ``Content-Length``;
+    an archive already materialised under ``cache/archives`` is sent as a
+    file, so it supports ``Range`` requests.
+    """
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return 'File not found', 404
+    root = os.path.realpath(job_path)
+    src_dir = os.path.realpath(os.path.join(root, subpath))
+    if not (src_dir == root or src_dir.startswith(root + os.sep)) or not os.path.isdir(src_dir):
+        return 'File not found', 404
+    level = request.args.get('level', DOWNLOAD_ZIP_LEVEL)
+    if level not in ARCHIVE_LEVELS:
+        return 'Unknown compression level', 400
+    name = request.args.get('name') or f'{os.path.basename(src_dir)}.zip'
+
+    cached = archive_cache_path(job_path, subpath, level)
+    if is_current(src_dir, cached):
+        return send_file(cached, mimetype='application/zip', as_attachment=True,
+                         download_name=name, conditional=True)
+
+    # Never include materialised archives, cached cutouts or step snapshots in a zip of the whole job
+    entries = collect_entries(src_dir, skip=[os.path.join(root, 'cache', 'archives'),
+                                             os.path.join(root, 'cache', 'cutouts'),
+                                             os.path.join(root, 'workspace')])
+    headers = {'Content-Disposition': f'attachment; filename="{name}"'}
+    if level == 'store':
+        headers['Content-Length'] = str(archive_size(entries))
+    return Response(iter_zip(entries, level), mimetype='application/zip', headers=headers)
+
+
+@main_bp.route('/job/<job_id>/bundle')
+@login_required
+def get_job_bundle(job_id):
+    """Send the packaged bundle of a job, see :mod:`app.packaging`."""
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return 'File not found', 404
+    bundle = packaging.bundle_path(job_path)
+    if not os.path.isfile(bundle):
+        return 'File not found', 404
+    return send_file(bundle, mimetype='application/zip', as_attachment=True,
+                     download_name=request.args.get('name') or f'{job_id}_bundle.zip', conditional=True)
+
+
+def _layer_views(job_id, output_dir, output_files):
+    """Describe each layer image for the Step 2 viewer, with its tile pyramid if any."""
+    views = []
+    for img in sorted(f for f in output_files if f.lower().endswith('.png')):
+        name = os.path.splitext(img)[0]
+        view = {
+            'name': name,
+            'image': url_for('main.get_job_file', job_id=job_id, filename=img),
+            'tiles': None,
+        }
+        meta_file = os.path.join(output_dir, 'tiles', name, 'meta.json')
+        try:
+            with open(meta_file) as fp:
+                tiles = json.load(fp)
+            tiles['version'] = os.stat(meta_file).st_mtime_ns
+            tiles['base'] = url_for('main.get_job_file', job_id=job_id, filename=f'tiles/{name}/')
+            view['tiles'] = tiles
+        except (OSError, json.JSONDecodeError):
+            pass
+        views.append(view)
+    return views
+
+
+def advance_step(flow_id, step, form):
+    """Return the metadata changes that move a job past ``step``."""
+    changes = {}
+    if step == 'step_01':
+        changes['show_layout'] = 'show_layout' in form
+    changes['step'] = flow_registry.next_step(flow_id, step) or 'completed'
+    return changes
+
+
+@main_bp.route('/job/<job_id>/rewind/<step>', methods=['POST'])
+@login_required
+def rewind_job(job_id, step):
+    """Restore a job's outputs to how they were before ``step`` ran."""
+    job_path = os.path.join(JOB_DIR, job_id)
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return 'Job not found', 404
+    flow_id = meta.get('flow_id')
+    steps = flow_registry.steps(flow_id)
+    if step not in steps or not has_snapshot(job_path, step):
+        return 'No snapshot for this step', 404
+    if is_active(job_id):
+        return redirect(url_for('main.run_step', flow_id=flow_id, step=meta.get('step'), job_id=job_id))
+    close_job(job_id)
+    rewind(job_path, step, later_steps=steps[steps.index(step) + 1:])
+    update_metadata(job_path, step=step, status=None, error=None, error_kind=None,
+                    progress=None, progress_message=None)
+    return redirect(url_for('main.run_step', flow_id=flow_id, step=step, job_id=job_id))
+
+
 @main_bp.route('/flow/<flow_id>/<step>/<job_id>', methods=['GET', 'POST'])
 @login_required
 def run_step(flow_id, step, job_id):
-    flow_path = os.path.join(FLOW_DIR, flow_id)
-    step_module = os.path.join(flow_path, f'{step}.py')
+    if flow_registry.get_flow(flow_id) is None:
+        return 'Invalid step', 404
+    step_module = flow_registry.step_path(flow_id, step)
     if not os.path.isfile(step_module):
         return 'Invalid step', 404
     job_path = os.path.join(JOB_DIR, job_id)
@@ -331,24 +571,9 @@ def run_step(flow_id, step, job_id):
     user = current_user()
     cfg = user.get('config', {}) if user else {}
     edb_version = cfg.get('edb_version', '2024.1')
-    meta_file = os.path.join(job_path, 'metadata.json')
-    meta = {}
-    if os.path.isfile(meta_file):
-        try:
-            with open(meta_file) as f:
-                meta = json.load(f)
-        except json.JSONDecodeError:
-            pass
+    meta = load_metadata(job_path)
 
-    flow_json = os.path.join(flow_path, 'flow.json')
-    flow_name = flow_id
-    if os.path.isfile(flow_json):
-        try:
-            with open(flow_json) as f:
-                data = json.load(f)
-                flow_name = data.get('name', flow_id)
-        except json.JSONDecodeError:
-            pass
+    flow_name = flow_registry.flow_name(flow_id)
 
     job_topic = meta.get('topic', '')
 
@@ -364,63 +589,67 @@ def run_step(flow_id, step, job_id):
 
     error_msg = None
     disable_actions = False
+    status = meta.get('status')
+    if status in ACTIVE_STATUSES:
+        if is_active(job_id):
+            return render_template(
+                'step_status.html',
+                flow_id=flow_id,
+                flow_name=flow_name,
+                step=step,
+                job_id=job_id,
+                job_topic=job_topic,
+                status=status,
+                progress=meta.get('progress') or 0,
+                progress_message=meta.get('progress_message'),
+                queue=queue_status(job_id) or {},
+            )
+        # The worker that owned this step is gone (e.g. server restart)
+        meta = update_metadata(job_path, status='failed', error_kind='exception',
+                               error='The step was interrupted before it finished.')
+        status = 'failed'
+    if status == 'failed' and request.method == 'GET':
+        error_msg = meta.get('error')
+        disable_actions = meta.get('error_kind') == 'result'
+        meta = update_metadata(job_path, status=None, error=None, error_kind=None)
+
     if request.method == 'POST':
         action = request.form.get('action')
+        module = None
         if action != 'pass':
-            # Execute the current step if a run() function exists
-            spec = importlib.util.spec_from_file_location(step, step_module)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            if hasattr(module, 'run'):
-                try:
-                    result = module.run(job_path, data=request.form, files=request.files, config=cfg)
-                except TypeError:
-                    try:
-                        result = module.run(job_path, data=request.form, config=cfg)
-                    except TypeError:
-                        result = module.run(job_path, data=request.form)
-                if isinstance(result, dict) and result.get('error'):
-                    error_msg = result['error']
-                    disable_actions = True
-
-        if error_msg is None:
-            if step == 'step_01':
-                meta['show_layout'] = 'show_layout' in request.form
-            # Determine the next step from flow.json
-            next_step = None
-            flow_json = os.path.join(flow_path, 'flow.json')
-            if os.path.isfile(flow_json):
-                with open(flow_json) as f:
-                    data = json.load(f)
-                    steps = data.get('steps', [])
-                    if step in steps:
-                        idx = steps.index(step)
-                        if idx + 1 < len(steps):
-                            next_step = steps[idx + 1]
-
-            if next_step:
-                meta['step'] = next_step
-            else:
-                meta['step'] = 'completed'
-            with open(meta_file, 'w') as f:
-                json.dump(meta, f)
-
-            if next_step:
-                return redirect(url_for('main.run_step', flow_id=flow_id, step=next_step, job_id=job_id))
-            else:
-                return redirect(url_for('main.deck'))
+            module = flow_registry.load_step(flow_id, step)
+        if module is not None and hasattr(module, 'run'):
+            if is_active(job_id):
+                return redirect(url_for('main.run_step', flow_id=flow_id, step=step, job_id=job_id))
+            form = request.form.copy()
+            staged = stage_files(request.files, job_path)
+            snapshot_step(job_path, step, writes=flow_registry.step_writes(flow_id, step))
+            # Execute the current step in the background; the worker reuses
+            # the previous result when the inputs are unchanged
+            task = StepTask(
+                job_path,
+                step,
+                module.run,
+                data=form,
+                files=staged,
+                config=cfg,
+                user=user['username'] if user else '',
+                on_success=lambda: advance_step(flow_id, step, form),
+                flow_id=flow_id,
+                memoize=True,
+            )
+            submit_step(task)
+            return redirect(url_for('main.run_step', flow_id=flow_id, step=step, job_id=job_id))
+        else:
+            snapshot_step(job_path, step, writes=())
+            meta = update_metadata(job_path, **advance_step(flow_id, step, request.form))
+        next_step = meta['step'] if meta['step'] != 'completed' else None
+        if next_step:
+            return redirect(url_for('main.run_step', flow_id=flow_id, step=next_step, job_id=job_id))
+        else:
+            return redirect(url_for('main.deck'))
 
     output_dir = os.path.join(job_path, 'output')
-    if flow_id == 'Flow_SIwave_SYZ' and step == 'step_06':
-        edb_dir = os.path.join(output_dir, 'design.aedb')
-        zip_path = os.path.join(output_dir, 'design.aedb.zip')
-        if os.path.isdir(edb_dir) and not os.path.isfile(zip_path):
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, dirs, files in os.walk(edb_dir):
-                    for file in files:
-                        abs_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(abs_path, os.path.dirname(edb_dir))
-                        zf.write(abs_path, rel_path)
     output_files = []
     if os.path.isdir(output_dir):
         for f in os.listdir(output_dir):
@@ -450,7 +679,7 @@ def run_step(flow_id, step, job_id):
             url = url_for('main.get_job_file', job_id=job_id, filename=xlsx_file)
             info_lines.append(f'Step 1 Output: <a href="{url}" download>{xlsx_file}</a>')
         if meta.get('show_layout'):
-            layer_images = [f for f in output_files if f.lower().endswith('.png')]
+            layer_images = _layer_views(job_id, output_dir, output_files)
         else:
             layer_images = None
     elif flow_id == 'Flow_SIwave_SYZ' and step == 'step_03':
@@ -459,16 +688,12 @@ def run_step(flow_id, step, job_id):
         edb_dir = os.path.join(output_dir, 'design.aedb')
         if os.path.isdir(edb_dir):
             try:
-                edb = Edb(edb_dir, edbversion=edb_version)
-                type_part = defaultdict(set)
-                for cname, comp in edb.components.components.items():
-                    type_part[comp.type].add(comp.part_name)
+                type_part = get_snapshot(job_path, edb_version)['parts_by_type']
                 categories = {
-                    'IC Parts': sorted(type_part.get('IC', [])),
-                    'IO Parts': sorted(type_part.get('IO', [])),
-                    'Other Parts': sorted(type_part.get('Other', [])),
+                    'IC Parts': type_part.get('IC', []),
+                    'IO Parts': type_part.get('IO', []),
+                    'Other Parts': type_part.get('Other', []),
                 }
-                edb.close_edb()
             except Exception:
                 categories = {}
         rename_file = os.path.join(output_dir, 'renamed_components.json')
@@ -487,7 +712,7 @@ def run_step(flow_id, step, job_id):
             for f in os.listdir(input_dir):
                 if f.lower().endswith(('.brd', '.zip', '.aedb')) and not design_file:
                     design_file = f
-                if f.lower().endswith('.xlsx'):
+                if f.lower().endswith(STACKUP_FORMATS):
                     xlsx_input = f
         stackup_file = 'stackup.xlsx' if os.path.isfile(os.path.join(output_dir, 'stackup.xlsx')) else None
         if design_file:
@@ -504,20 +729,18 @@ def run_step(flow_id, step, job_id):
         edb_dir = os.path.join(output_dir, 'design.aedb')
         if os.path.isdir(edb_dir):
             try:
-                edb = Edb(edb_dir, edbversion=edb_version)
-                def _unique(comp_iter):
-                    uniq = {}
-                    for comp in comp_iter:
-                        if comp.part_name not in uniq:
-                            uniq[comp.part_name] = comp.value
-                    return sorted(uniq.items())
+                snapshot = get_snapshot(job_path, edb_version)
+                type_part = snapshot['parts_by_type']
+                values = snapshot['part_values']
+
+                def _unique(parts):
+                    return [(part, values.get(part)) for part in parts]
 
                 part_values = {
-                    'Resistors': _unique(edb.components.resistors.values()),
-                    'Capacitors': _unique(edb.components.capacitors.values()),
-                    'Inductors': _unique(edb.components.inductors.values()),
+                    'Resistors': _unique(type_part.get('Resistor', [])),
+                    'Capacitors': _unique(type_part.get('Capacitor', [])),
+                    'Inductors': _unique(type_part.get('Inductor', [])),
                 }
-                edb.close_edb()
             except Exception:
                 part_values = {}
         nets = None
@@ -529,7 +752,7 @@ def run_step(flow_id, step, job_id):
             for f in os.listdir(input_dir):
                 if f.lower().endswith(('.brd', '.zip', '.aedb')) and not design_file:
                     design_file = f
-                if f.lower().endswith('.xlsx'):
+                if f.lower().endswith(STACKUP_FORMATS):
                     xlsx_input = f
         stackup_file = 'stackup.xlsx' if os.path.isfile(os.path.join(output_dir, 'stackup.xlsx')) else None
         if design_file:
@@ -553,11 +776,13 @@ def run_step(flow_id, step, job_id):
             for f in os.listdir(input_dir):
                 if f.lower().endswith(('.brd', '.zip', '.aedb')) and not design_file:
                     design_file = f
-                if f.lower().endswith('.xlsx'):
+                if f.lower().endswith(STACKUP_FORMATS):
                     xlsx_input = f
         stackup_file = 'stackup.xlsx' if os.path.isfile(os.path.join(output_dir, 'stackup.xlsx')) else None
-        updated_file = 'updated.xlsx' if os.path.isfile(os.path.join(output_dir, 'updated.xlsx')) else None
-        zipped_file = 'updated_pyedb.zip' if os.path.isfile(os.path.join(output_dir, 'updated_pyedb.zip')) else None
+        updated_file = next((f'updated{ext}' for ext in STACKUP_FORMATS
+                             if os.path.isfile(os.path.join(output_dir, f'updated{ext}'))), None)
+        # The AEDB is zipped while it downloads, see get_job_archive
+        zipped_file = 'updated_pyedb.zip' if updated_file and os.path.isdir(os.path.join(output_dir, 'design.aedb')) else None
         info_lines = []
         if design_file:
             url = url_for('main.get_job_file', job_id=job_id, filename=design_file)
@@ -569,27 +794,19 @@ def run_step(flow_id, step, job_id):
             url = url_for('main.get_job_file', job_id=job_id, filename=xlsx_input)
             info_lines.append(f'Step 2 Input: <a href="{url}" download>{xlsx_input}</a>')
         if zipped_file:
-            url = url_for('main.get_job_file', job_id=job_id, filename=zipped_file)
+            url = archive_url(job_id, 'output/design.aedb', zipped_file)
             info_lines.append(f'Step 2 Output: <a href="{url}" download>{zipped_file}</a>')
 
-        nets = []
-        edb_dir = os.path.join(output_dir, 'design.aedb')
-        if os.path.isdir(edb_dir):
-            try:
-                edb = Edb(edb_dir, edbversion=edb_version)
-                nets = list(edb.nets.nets.keys())
-                edb.close_edb()
-            except Exception:
-                nets = []
+        nets_url = None
+        if os.path.isdir(os.path.join(output_dir, 'design.aedb')):
+            # The page loads the nets in pages from the nets API
+            nets_url = url_for('main.api_job_nets', job_id=job_id)
     elif flow_id == 'Flow_SIwave_SYZ' and step == 'step_06':
-        cutout_zip = 'cutout.zip' if os.path.isfile(os.path.join(output_dir, 'cutout.zip')) else None
-        design_zip = 'design.aedb.zip' if os.path.isfile(os.path.join(output_dir, 'design.aedb.zip')) else None
+        # The archives are written in the background, see app.packaging
         nets = None
         info_lines = []
-        for zf in (cutout_zip, design_zip):
-            if zf:
-                url = url_for('main.get_job_file', job_id=job_id, filename=zf)
-                info_lines.append(f'<strong>Output:</strong> <a href="{url}" download>{zf}</a>')
+        package = _package_view(job_id, packaging.ensure(job_path))
+        package_url = url_for('main.api_job_package', job_id=job_id)
 
     else:
         nets = None
@@ -597,6 +814,11 @@ def run_step(flow_id, step, job_id):
     input_tree = _dir_tree(os.path.join(job_path, 'input'))
     output_tree = _dir_tree(output_dir)
 
+    steps = flow_registry.steps(flow_id)
+    rewind_steps = []
+    if step in steps:
+        rewind_steps = [s for s in steps[:steps.index(step)] if has_snapshot(job_path, s)]
+
     template = f'{flow_id}/steps/{step}.html'
     return render_template(
         template,
@@ -608,6 +830,9 @@ def run_step(flow_id, step, job_id):
         output_files=output_files,
         info_lines=info_lines,
         nets=nets,
+        nets_url=locals().get('nets_url'),
+        package=locals().get('package'),
+        package_url=locals().get('package_url'),
         input_tree=input_tree,
         output_tree=output_tree,
         selected_nets=selected_nets,
@@ -619,6 +844,7 @@ def run_step(flow_id, step, job_id):
         renamed_map=locals().get('renamed_map'),
         error=error_msg,
         disable_actions=disable_actions,
+        rewind_steps=rewind_steps,
     )
 
 
@@ -0,0 +1,117 @@
+"""Resource classes and priorities of flow steps.
+
+Each flow declares the resource class of its steps in ``flow.json``::
+
+    "resources": {"step_01": "heavy", "step_03": "light", "step_06": "none"}
+
+Steps that are not listed use ``DEFAULT_RESOURCE_CLASS``.  A class
+(``RESOURCE_CLASSES``) says how many Ansys license tokens a step holds while
+it runs, the CPUs and memory it needs on its node and its base priority
+(lower runs first).  Batch steps get ``BATCH_PRIORITY`` added, so an
+interactive light step is claimed before a batch heavy one.
+
+The queue (:mod:`app.job_queue`) enforces the limits when a node claims a
+step: ``LICENSE_TOKENS`` across all nodes (give every node the same value)
+and ``NODE_CPUS`` / ``NODE_MEMORY_MB`` on each node.  A queued step gains one
+priority level per ``STEP_PRIORITY_AGING_SECONDS`` it waits.
+"""
+import os
+
+from app import flow_registry
+
+DEFAULT_CLASSES = {
+    # Steps that never open a design
+    'none': {'licenses': 0, 'cpus': 0, 'memory_mb': 0, 'priority': 0},
+    # Small edits of an open design
+    'light': {'licenses': 1, 'cpus': 1, 'memory_mb': 2048, 'priority': 10},
+    # BRD conversion, cutout
+    'heavy': {'licenses': 1, 'cpus': 4, 'memory_mb': 8192, 'priority': 20},
+}
+
+_settings = {
+    'classes': DEFAULT_CLASSES,
+    'default_class': 'light',
+    'batch_priority': 100,
+    'licenses': 4,
+    'cpus': os.cpu_count() or 1,
+    'memory_mb': 16384,
+    'aging': 300.0,
+}
+
+
+def _total_memory_mb():
+    """Physical memory of this host in MiB, or None if unknown."""
+    try:
+        import psutil
+        return psutil.virtual_memory().total // (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def init_app(app):
+    app.config.setdefault('RESOURCE_CLASSES', DEFAULT_CLASSES)
+    app.config.setdefault('DEFAULT_RESOURCE_CLASS', 'light')
+    app.config.setdefault('BATCH_PRIORITY', 100)
+    app.config.setdefault('LICENSE_TOKENS', 4)
+    app.config.setdefault('NODE_CPUS', os.cpu_count() or 1)
+    app.config.setdefault('NODE_MEMORY_MB', _total_memory_mb() or 16384)
+    app.config.setdefault('STEP_PRIORITY_AGING_SECONDS', 300)
+    classes = {name: dict(DEFAULT_CLASSES.get(name, {}), **spec)
+               for name, spec in app.config['RESOURCE_CLASSES'].items()}
+    if app.config['DEFAULT_RESOURCE_CLASS'] not in classes:
+        raise ValueError(f"DEFAULT_RESOURCE_CLASS {app.config['DEFAULT_RESOURCE_CLASS']!r} is not a resource class")
+    _settings['classes'] = classes
+    _settings['default_class'] = app.config['DEFAULT_RESOURCE_CLASS']
+    _settings['batch_priority'] = float(app.config['BATCH_PRIORITY'])
+    licenses = app.config['LICENSE_TOKENS']
+    _settings['licenses'] = None if licenses is None else int(licenses)
+    _settings['cpus'] = float(app.config['NODE_CPUS'])
+    _settings['memory_mb'] = int(app.config['NODE_MEMORY_MB'])
+    _settings['aging'] = float(app.config['STEP_PRIORITY_AGING_SECONDS'])
+
+
+def resource_class(flow_id, step):
+    """Name of the resource class ``flow.json`` declares for ``step``."""
+    flow = flow_registry.get_flow(flow_id)
+    declared = (flow['meta'].get('resources') or {}).get(step) if flow else None
+    return declared if declared in _settings['classes'] else _settings['default_class']
+
+
+def requirements(flow_id, step, origin='interactive'):
+    """``resource``, ``licenses``, ``cpus``, ``memory_mb`` and ``priority`` of a step."""
+    name = resource_class(flow_id, step)
+    spec = _settings['classes'][name]
+    priority = float(spec.get('priority', 0))
+    if origin == 'batch':
+        priority += _settings['batch_priority']
+    return {
+        'resource': name,
+        'licenses': int(spec.get('licenses', 0)),
+        'cpus': float(spec.get('cpus', 0)),
+        'memory_mb': int(spec.get('memory_mb', 0)),
+        'priority': priority,
+    }
+
+
+def limits(slots, per_user):
+    """The claim limits of this node for :meth:`app.job_queue.SqliteQueue.claim`."""
+    return {
+        'slots': slots,
+        'per_user': per_user,
+        'licenses': _settings['licenses'],
+        'cpus': _settings['cpus'],
+        'memory_mb': _settings['memory_mb'],
+        'aging': _settings['aging'],
+    }
+
+
+def aging():
+    return _settings['aging']
+
+
+def license_tokens():
+    return _settings['licenses']
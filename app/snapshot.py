@@ -0,0 +1,198 @@
+"""Per-job snapshot of design metadata used to render step pages.
+
+The snapshot holds everything the step pages list (components by type,
+part values, nets and which of them are power/ground, signal layers and
+the stackup) so a page view only reads a small JSON file.  It is stamped
+with the SHA-256 of ``design.aedb/edb.def`` and is ignored once the design
+changes on disk.  Steps that mutate the design update the affected sections
+in place instead of extracting everything again.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from app import edb_service
+from app.component_index import component_index
+from app.edb_pool import design_dir
+
+SNAPSHOT_VERSION = 2
+
+_hash_lock = threading.Lock()
+_hash_cache = {}
+
+
+def snapshot_path(job_path):
+    return os.path.join(job_path, 'cache', 'design_snapshot.json')
+
+
+def file_hash(path):
+    """Return the SHA-256 of a file, reusing the last result while unchanged."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        cached = _hash_cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    result = digest.hexdigest()
+    with _hash_lock:
+        _hash_cache[path] = (stamp, result)
+    return result
+
+
+def _uploads_path(job_path):
+    return os.path.join(job_path, 'cache', 'uploads.json')
+
+
+def _load_uploads(job_path):
+    try:
+        with open(_uploads_path(job_path)) as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def record_upload(job_path, filename, checksum):
+    """Remember the checksum verified while ``input/<filename>`` was uploaded."""
+    try:
+        st = os.stat(os.path.join(job_path, 'input', filename))
+    except OSError:
+        return
+    path = _uploads_path(job_path)
+    with _hash_lock:
+        uploads = _load_uploads(job_path)
+        uploads[filename] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'checksum': checksum}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(uploads, fp)
+        os.replace(tmp_path, path)
+
+
+def upload_checksum(job_path, filename):
+    """The checksum of an uploaded input file while it is unchanged, or None."""
+    entry = _load_uploads(job_path).get(filename)
+    try:
+        st = os.stat(os.path.join(job_path, 'input', filename))
+    except OSError:
+        return None
+    if entry and (entry.get('size'), entry.get('mtime_ns')) == (st.st_size, st.st_mtime_ns):
+        return entry.get('checksum')
+    return None
+
+
+def design_hash(job_path):
+    """Content hash of the job's ``design.aedb/edb.def``."""
+    return file_hash(os.path.join(design_dir(job_path), 'edb.def'))
+
+
+def extract_stackup(edb):
+    layers = []
+    materials = edb.materials.materials
+    for layer_name, layer in edb.stackup.stackup_layers.items():
+        mat = materials.get(layer.material)
+        entry = {
+            'name': layer_name,
+            'type': layer.type,
+            'thickness': layer.thickness,
+            'material': layer.material,
+        }
+        if mat is not None:
+            if layer.type == 'signal':
+                entry['conductivity'] = mat.conductivity
+            else:
+                entry['permittivity'] = mat.permittivity
+                entry['loss_tangent'] = mat.dielectric_loss_tangent
+        layers.append(entry)
+    return layers
+
+
+def extract(edb):
+    """Read the snapshot sections from an open EDB."""
+    index = component_index(edb)
+    nets = edb.nets.nets
+    return {
+        'parts_by_type': {t: sorted(parts) for t, parts in index.parts_by_type.items()},
+        'part_values': index.part_values(),
+        'nets': list(nets.keys()),
+        'power_nets': [name for name, net in nets.items() if net.is_power_ground],
+        'layers': list(edb.stackup.signal_layers),
+        'stackup': extract_stackup(edb),
+    }
+
+
+def save_snapshot(job_path, snapshot):
+    snapshot['version'] = SNAPSHOT_VERSION
+    snapshot['design_hash'] = design_hash(job_path)
+    path = snapshot_path(job_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(snapshot, fp, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return snapshot
+
+
+def load_snapshot(job_path):
+    """Return the stored snapshot if it matches the design on disk, else None."""
+    path = snapshot_path(job_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as fp:
+            snapshot = json.load(fp)
+    except (json.JSONDecodeError, OSError):
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    if snapshot.get('design_hash') != design_hash(job_path):
+        return None
+    return snapshot
+
+
+def build_snapshot(job_path, edb):
+    """Extract a full snapshot from ``edb`` and store it."""
+    return save_snapshot(job_path, extract(edb))
+
+
+def get_snapshot(job_path, edb_version='2024.1'):
+    """Return a fresh snapshot, extracting it from EDB only when stale."""
+    snapshot = load_snapshot(job_path)
+    if snapshot is not None:
+        return snapshot
+    return edb_service.call('build_snapshot', job_path, edb_version)
+
+
+def update_snapshot(job_path, edb, previous, renames=None, values=None, stackup=False):
+    """Store the snapshot after a step changed the design.
+
+    ``previous`` is the snapshot loaded before the change; when it is None
+    (missing or stale) the whole snapshot is extracted again.  Otherwise
+    only the sections touched by the step are updated.
+    """
+    if previous is None:
+        return build_snapshot(job_path, edb)
+    snapshot = dict(previous)
+    if renames:
+        snapshot['parts_by_type'] = {
+            t: sorted({renames.get(p, p) for p in parts})
+            for t, parts in snapshot.get('parts_by_type', {}).items()
+        }
+        snapshot['part_values'] = {
+            renames.get(p, p): v for p, v in snapshot.get('part_values', {}).items()
+        }
+    if values:
+        part_values = dict(snapshot.get('part_values', {}))
+        part_values.update(values)
+        snapshot['part_values'] = part_values
+    if stackup:
+        snapshot['stackup'] = extract_stackup(edb)
+        snapshot['layers'] = list(edb.stackup.signal_layers)
+    return save_snapshot(job_path, snapshot)
@@ -0,0 +1,191 @@
+"""Reading and writing stackup sheets.
+
+A stackup sheet lists one layer per row: name, type, thickness, permittivity,
+loss tangent and conductivity.  Three formats are understood, chosen by the
+file extension:
+
+* ``.xlsx`` -- the workbook Step 1 exports: ``unit`` in ``A1:B1``, a header
+  row, then the layers;
+* ``.csv`` -- the same rows as comma separated text;
+* ``.json`` -- ``{"unit": "mm", "layers": [{"name", "type", "thickness",
+  "permittivity", "loss_tangent", "conductivity"}, ...]}``.
+
+Thicknesses are written in ``unit`` (``mm``, ``mil`` or ``um``) and read
+back in metres.  The numeric columns are validated and converted as NumPy
+arrays in one pass; a bad cell raises :class:`StackupError` naming its row.
+openpyxl and NumPy are imported on first use, so importing this module is
+cheap.
+"""
+import csv
+import json
+import os
+
+# Metres per unit
+UNITS = {'mm': 1e-3, 'mil': 25.4e-6, 'um': 1e-6}
+FORMATS = ('.xlsx', '.csv', '.json')
+COLUMNS = ('name', 'type', 'thickness', 'permittivity', 'loss_tangent', 'conductivity')
+
+
+class StackupError(ValueError):
+    """A stackup sheet could not be read."""
+
+
+def _format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise StackupError(f"Unsupported stackup format {ext or path!r}; use {', '.join(FORMATS)}")
+    return ext
+
+
+def _header(unit):
+    return ['Layer Name', 'Type', f'Thickness ({unit})', 'Permittivity', 'Loss Tangent', 'Conductivity (S/m)']
+
+
+def _read_xlsx(path):
+    import openpyxl
+
+    # read_only streams the rows without loading styles
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if 'Stackup' not in wb.sheetnames:
+            raise StackupError('The workbook has no "Stackup" sheet')
+        rows = wb['Stackup'].iter_rows(values_only=True)
+        first = next(rows, ())
+        unit = first[1] if len(first) > 1 else None
+        next(rows, None)
+        return unit, [row[:6] for row in rows]
+    finally:
+        wb.close()
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as fp:
+        rows = csv.reader(fp)
+        first = next(rows, [])
+        unit = first[1] if len(first) > 1 else None
+        next(rows, None)
+        return unit, [row[:6] for row in rows]
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as fp:
+            data = json.load(fp)
+        return data.get('unit'), [tuple(layer.get(col) for col in COLUMNS) for layer in data['layers']]
+    except (json.JSONDecodeError, AttributeError, KeyError, TypeError) as e:
+        raise StackupError(f'Invalid stackup JSON: {e}') from e
+
+
+def _numbers(values, names, label, required=False):
+    """``values`` as a float array; blank cells are NaN unless ``required``."""
+    import numpy as np
+
+    cells = [None if value is None or value == '' else value for value in values]
+    try:
+        return np.array([np.nan if cell is None else cell for cell in cells], dtype=float)
+    except (TypeError, ValueError):
+        pass
+    # Find the offending row for the message
+    for name, cell in zip(names, cells):
+        try:
+            float(np.nan if cell is None else cell)
+        except (TypeError, ValueError):
+            raise StackupError(f'Layer {name}: {label} {cell!r} is not a number') from None
+    raise StackupError(f'Invalid {label} column')
+
+
+def read_stackup(path):
+    """The layers of a stackup sheet, thicknesses in metres.
+
+    Returns ``[{'name', 'type', 'thickness', 'permittivity', 'loss_tangent',
+    'conductivity'}]``; blank material cells are ``None``.
+    """
+    import numpy as np
+
+    ext = _format(path)
+    reader = {'.xlsx': _read_xlsx, '.csv': _read_csv, '.json': _read_json}[ext]
+    unit, rows = reader(path)
+    unit = str(unit or 'mm').strip().lower()
+    if unit not in UNITS:
+        raise StackupError(f"Unknown thickness unit {unit!r}; use {', '.join(UNITS)}")
+    rows = [tuple(row) + (None,) * (6 - len(row)) for row in rows if row and row[0] not in (None, '')]
+    if not rows:
+        raise StackupError('The stackup sheet has no layers')
+    names, types, thickness, permittivity, loss_tangent, conductivity = zip(*rows)
+    names = [str(name).strip() for name in names]
+    seen = set()
+    for name in names:
+        if name in seen:
+            raise StackupError(f'Layer {name} is listed twice')
+        seen.add(name)
+
+    thickness = _numbers(thickness, names, 'thickness')
+    bad = ~np.isfinite(thickness) | (thickness < 0)
+    if bad.any():
+        raise StackupError(f'Layer {names[int(np.argmax(bad))]}: thickness must be a number >= 0')
+    thickness = (thickness * UNITS[unit]).tolist()
+    columns = [
+        [None if np.isnan(v) else v for v in _numbers(column, names, label).tolist()]
+        for column, label in ((permittivity, 'permittivity'), (loss_tangent, 'loss tangent'),
+                              (conductivity, 'conductivity'))
+    ]
+    return [
+        {
+            'name': name,
+            'type': str(layer_type or '').strip().lower(),
+            'thickness': t,
+            'permittivity': p,
+            'loss_tangent': lt,
+            'conductivity': c,
+        }
+        for name, layer_type, t, p, lt, c in zip(names, types, thickness, *columns)
+    ]
+
+
+def _table(layers, unit):
+    """Sheet rows for ``layers`` (as from :func:`app.snapshot.extract_stackup`)."""
+    import numpy as np
+
+    if unit not in UNITS:
+        raise StackupError(f"Unknown thickness unit {unit!r}; use {', '.join(UNITS)}")
+    thickness = (np.array([layer['thickness'] for layer in layers], dtype=float) / UNITS[unit]).tolist()
+    rows = []
+    for layer, t in zip(layers, thickness):
+        if layer['type'] == 'signal':
+            rows.append([layer['name'], layer['type'], t, '', '', layer.get('conductivity', '')])
+        else:
+            rows.append([layer['name'], layer['type'], t, layer.get('permittivity', ''),
+                         layer.get('loss_tangent', ''), ''])
+    return rows
+
+
+def write_stackup(layers, path, unit='mm'):
+    """Write ``layers`` (thicknesses in metres) to ``path`` in ``unit``."""
+    ext = _format(path)
+    rows = _table(layers, unit)
+    if ext == '.xlsx':
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Stackup')
+        ws.append(['unit', unit])
+        ws.append(_header(unit))
+        for row in rows:
+            ws.append(row)
+        wb.save(path)
+    elif ext == '.csv':
+        with open(path, 'w', newline='', encoding='utf-8') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['unit', unit])
+            writer.writerow(_header(unit))
+            writer.writerows(rows)
+    else:
+        data = {
+            'unit': unit,
+            'layers': [
+                {col: (None if value == '' else value) for col, value in zip(COLUMNS, row)}
+                for row in rows
+            ],
+        }
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, indent=2)
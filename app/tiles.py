@@ -0,0 +1,69 @@
+"""Multi-resolution tile pyramids for layer images.
+
+Each layer image is cut into ``tile_size`` square tiles at every zoom level
+from a single tile (level 0) up to the full resolution (``max_zoom``)::
+
+    tiles/<layer>/meta.json
+    tiles/<layer>/thumb.webp
+    tiles/<layer>/<z>/<x>_<y>.webp
+
+WebP is used when Pillow supports it, PNG otherwise.  The Step 2 viewer
+reads ``meta.json`` and requests only the tiles that are visible.
+"""
+import json
+import math
+import os
+
+TILE_SIZE = 256
+THUMB_SIZE = 256
+
+
+def tile_format():
+    from PIL import features
+    return 'webp' if features.check('webp') else 'png'
+
+
+def build_pyramid(image_path, out_dir, tile_size=TILE_SIZE, fmt=None):
+    """Cut ``image_path`` into a tile pyramid under ``out_dir``; returns the metadata."""
+    from PIL import Image
+
+    fmt = fmt or tile_format()
+    save_args = {'quality': 85, 'method': 4} if fmt == 'webp' else {'optimize': True}
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(image_path) as source:
+        image = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+    width, height = image.size
+    max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+
+    levels = []
+    for z in range(max_zoom + 1):
+        scale = 2 ** (z - max_zoom)
+        level_w = max(1, math.ceil(width * scale))
+        level_h = max(1, math.ceil(height * scale))
+        level = image if z == max_zoom else image.resize((level_w, level_h), Image.LANCZOS)
+        cols = math.ceil(level_w / tile_size)
+        rows = math.ceil(level_h / tile_size)
+        level_dir = os.path.join(out_dir, str(z))
+        os.makedirs(level_dir, exist_ok=True)
+        for x in range(cols):
+            for y in range(rows):
+                box = (x * tile_size, y * tile_size,
+                       min(level_w, (x + 1) * tile_size), min(level_h, (y + 1) * tile_size))
+                level.crop(box).save(os.path.join(level_dir, f'{x}_{y}.{fmt}'), **save_args)
+        levels.append({'z': z, 'width': level_w, 'height': level_h, 'cols': cols, 'rows': rows})
+
+    thumb = image.copy()
+    thumb.thumbnail((THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+    thumb.save(os.path.join(out_dir, f'thumb.{fmt}'), **save_args)
+
+    meta = {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'max_zoom': max_zoom,
+        'format': fmt,
+        'levels': levels,
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as fp:
+        json.dump(meta, fp)
+    return meta
@@ -0,0 +1,357 @@
+"""Chunked, resumable uploads into a job's ``input`` directory.
+
+A client first calls ``init`` with the file name and size and receives an
+upload id and chunk size.  Chunks are then ``PUT`` by index, in any order
+and possibly in parallel, each with an ``X-Chunk-Checksum`` header
+(``crc32=<hex>`` or ``sha256=<hex>``), and written straight into
+``input/<name>.part``.  After a disconnect the client asks for the status
+(or calls ``init`` again with the same name and size) and sends only the
+missing chunks.  ``complete`` renames the part file to its final name; the
+file is then handed to a step through ``data['uploaded_file']``.  The
+checksums of its chunks are combined into one for the whole file (see
+:func:`app.snapshot.record_upload`), so it is never hashed again.
+
+Zipped designs are checked as soon as possible: the first chunk must carry
+the zip signature and the last one the end-of-central-directory record, so a
+wrong or truncated archive is refused before the whole file is sent.
+
+An upload that receives nothing for ``UPLOAD_EXPIRY_SECONDS`` is abandoned;
+starting any upload removes the abandoned ones of every job.
+"""
+import hashlib
+import json
+import glob
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from flask import Blueprint, current_app, jsonify, request
+from werkzeug.utils import secure_filename
+
+from app.snapshot import record_upload
+from app.utils import load_metadata
+from .routes import JOB_DIR, current_user, login_required
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/job/<job_id>/uploads')
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 20 * 1024 ** 3
+DEFAULT_UPLOAD_EXPIRY = 24 * 3600
+# Abandoned uploads are looked for at most this often
+REAP_INTERVAL = 600
+# Bounds the chunk list of an upload; larger files get larger chunks
+MAX_CHUNKS = 10000
+ZIP_EXTENSIONS = ('.zip', '.aedb')
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+EOCD_MAGIC = b'PK\x05\x06'
+# The end-of-central-directory record sits in the last 22 + 65535 bytes
+EOCD_SEARCH = 22 + 65535
+
+# upload id -> [lock, number of requests holding or waiting for it]
+_locks = {}
+_locks_guard = threading.Lock()
+_reaped = {'at': 0.0}
+
+
+@contextmanager
+def _locked(upload_id):
+    """Serialize requests on one upload; the lock is dropped once unused."""
+    with _locks_guard:
+        entry = _locks.setdefault(upload_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                _locks.pop(upload_id, None)
+
+
+def _chunk_limit():
+    return int(current_app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+
+def _size_limit():
+    return int(current_app.config.get('MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE))
+
+
+def _expiry():
+    return float(current_app.config.get('UPLOAD_EXPIRY_SECONDS', DEFAULT_UPLOAD_EXPIRY))
+
+
+def _job_path(job_id):
+    """Return the job folder if the current user may upload to it, else None."""
+    job_path = os.path.join(JOB_DIR, secure_filename(job_id))
+    meta = load_metadata(job_path)
+    user = current_user()
+    if not meta or not (user.get('role') == 'admin' or meta.get('user') == user.get('username')):
+        return None
+    return job_path
+
+
+def _state_dir(job_path):
+    return os.path.join(job_path, 'tmp', 'chunked')
+
+
+def _state_path(job_path, upload_id):
+    return os.path.join(_state_dir(job_path), f'{upload_id}.json')
+
+
+def _load_state(job_path, upload_id):
+    if not upload_id.isalnum():
+        return None
+    try:
+        with open(_state_path(job_path, upload_id)) as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _save_state(job_path, state):
+    path = _state_path(job_path, state['id'])
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(state, fp)
+    os.replace(tmp_path, path)
+
+
+def _part_path(job_path, state):
+    return os.path.join(job_path, 'input', f"{state['filename']}.part")
+
+
+def _chunk_count(state):
+    return max(1, -(-state['size'] // state['chunk_size']))
+
+
+def _status(state):
+    received = set(state['received'])
+    return {
+        'upload_id': state['id'],
+        'filename': state['filename'],
+        'size': state['size'],
+        'chunk_size': state['chunk_size'],
+        'chunks': _chunk_count(state),
+        'received': sorted(received),
+        'missing': [i for i in range(_chunk_count(state)) if i not in received],
+    }
+
+
+def _file_checksum(state):
+    """One checksum for the whole file from the verified checksums of its chunks, or None."""
+    checksums = state.get('checksums') or {}
+    if len(checksums) < _chunk_count(state):
+        return None
+    digest = hashlib.sha256(f"chunks:{state['size']}:{state['chunk_size']}".encode())
+    for index in range(_chunk_count(state)):
+        digest.update(f":{checksums[str(index)]}".encode())
+    return digest.hexdigest()
+
+
+def _verify_checksum(header, body):
+    """Return an error message if ``body`` does not match ``header``."""
+    algo, _, expected = (header or '').partition('=')
+    algo = algo.strip().lower()
+    expected = expected.strip().lower()
+    if algo == 'crc32':
+        actual = f'{zlib.crc32(body):08x}'
+    elif algo == 'sha256':
+        actual = hashlib.sha256(body).hexdigest()
+    else:
+        return 'X-Chunk-Checksum must be crc32=<hex> or sha256=<hex>'
+    if actual != expected.zfill(len(actual)):
+        return f'{algo} mismatch'
+    return None
+
+
+def _validate_zip_chunk(state, index, body):
+    """Early sanity checks for zipped designs; returns an error message or None."""
+    if not state['filename'].lower().endswith(ZIP_EXTENSIONS):
+        return None
+    if index == 0 and not body.startswith(ZIP_MAGIC):
+        return 'The file is not a zip archive.'
+    if index == _chunk_count(state) - 1:
+        tail_start = max(0, state['size'] - EOCD_SEARCH)
+        offset = tail_start - index * state['chunk_size']
+        # Only conclusive when the whole search window is in this chunk
+        if offset >= 0 and EOCD_MAGIC not in body[offset:]:
+            return 'The zip archive is truncated or damaged.'
+    return None
+
+
+def _abort(job_path, state, message, status=400):
+    part = _part_path(job_path, state)
+    if os.path.isfile(part):
+        os.remove(part)
+    state_file = _state_path(job_path, state['id'])
+    if os.path.isfile(state_file):
+        os.remove(state_file)
+    return jsonify({'error': message}), status
+
+
+def reap_expired(expiry):
+    """Remove the uploads of every job that received nothing for ``expiry`` seconds."""
+    deadline = time.time() - expiry
+    for state_file in glob.glob(os.path.join(JOB_DIR, '*', 'tmp', 'chunked', '*.json')):
+        job_path = os.path.dirname(os.path.dirname(os.path.dirname(state_file)))
+        upload_id = os.path.basename(state_file)[:-len('.json')]
+        with _locked(upload_id):
+            try:
+                if os.stat(state_file).st_mtime >= deadline:
+                    continue
+            except OSError:
+                continue
+            state = _load_state(job_path, upload_id)
+            try:
+                if state and os.path.isfile(_part_path(job_path, state)):
+                    os.remove(_part_path(job_path, state))
+                os.remove(state_file)
+            except OSError:
+                pass
+    # Part files whose state is gone
+    for part in glob.glob(os.path.join(JOB_DIR, '*', 'input', '*.part')):
+        try:
+            if os.stat(part).st_mtime < deadline:
+                os.remove(part)
+        except OSError:
+            pass
+
+
+def _reap_if_due():
+    now = time.time()
+    with _locks_guard:
+        if now - _reaped['at'] < REAP_INTERVAL:
+            return
+        _reaped['at'] = now
+    reap_expired(_expiry())
+
+
+@uploads_bp.route('', methods=['POST'])
+@login_required
+def init_upload(job_id):
+    """Start an upload, or resume the pending one with the same name and size."""
+    job_path = _job_path(job_id)
+    if not job_path:
+        return jsonify({'error': 'Job not found'}), 404
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(body.get('filename') or '')
+    try:
+        size = int(body.get('size'))
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size <= 0:
+        return jsonify({'error': 'filename and a positive size are required'}), 400
+    if size > _size_limit():
+        return jsonify({'error': f'The file is larger than the {_size_limit()} byte limit'}), 413
+    try:
+        chunk_size = min(int(body.get('chunk_size') or _chunk_limit()), _chunk_limit())
+    except (TypeError, ValueError):
+        chunk_size = _chunk_limit()
+    chunk_size = max(chunk_size, -(-size // MAX_CHUNKS))
+    _reap_if_due()
+
+    state_dir = _state_dir(job_path)
+    os.makedirs(state_dir, exist_ok=True)
+    os.makedirs(os.path.join(job_path, 'input'), exist_ok=True)
+    for name in os.listdir(state_dir):
+        if not name.endswith('.json'):
+            continue
+        state = _load_state(job_path, name[:-len('.json')])
+        if (state and state['filename'] == filename and state['size'] == size
+                and os.path.isfile(_part_path(job_path, state))):
+            return jsonify(_status(state))
+
+    state = {
+        'id': uuid.uuid4().hex,
+        'filename': filename,
+        'size': size,
+        'chunk_size': chunk_size,
+        'received': [],
+        'checksums': {},
+    }
+    with open(_part_path(job_path, state), 'wb') as fp:
+        fp.truncate(size)
+    _save_state(job_path, state)
+    return jsonify(_status(state)), 201
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(job_id, upload_id):
+    job_path = _job_path(job_id)
+    state = _load_state(job_path, upload_id) if job_path else None
+    if not state:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_status(state))
+
+
+@uploads_bp.route('/<upload_id>/<int:index>', methods=['PUT'])
+@login_required
+def put_chunk(job_id, upload_id, index):
+    """Write one chunk at its offset after checking its checksum."""
+    job_path = _job_path(job_id)
+    state = _load_state(job_path, upload_id) if job_path else None
+    if not state:
+        return jsonify({'error': 'Upload not found'}), 404
+    if index >= _chunk_count(state):
+        return jsonify({'error': 'Chunk index out of range'}), 400
+    expected = min(state['chunk_size'], state['size'] - index * state['chunk_size'])
+    if request.content_length is not None and request.content_length != expected:
+        return jsonify({'error': f'Chunk {index} must be {expected} bytes'}), 400
+    body = request.get_data(cache=False)
+    if len(body) != expected:
+        return jsonify({'error': f'Chunk {index} must be {expected} bytes'}), 400
+    error = _verify_checksum(request.headers.get('X-Chunk-Checksum'), body)
+    if error:
+        # The client resends the chunk
+        return jsonify({'error': error}), 422
+    error = _validate_zip_chunk(state, index, body)
+    if error:
+        with _locked(upload_id):
+            return _abort(job_path, state, error)
+
+    # complete and abort move the part file away under the same lock
+    with _locked(upload_id):
+        state = _load_state(job_path, upload_id)
+        if not state:
+            return jsonify({'error': 'Upload not found'}), 404
+        try:
+            with open(_part_path(job_path, state), 'r+b') as fp:
+                fp.seek(index * state['chunk_size'])
+                fp.write(body)
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload not found'}), 404
+        except OSError as e:
+            return jsonify({'error': f'Chunk {index} could not be written: {e.strerror}'}), 409
+        if index not in state['received']:
+            state['received'].append(index)
+        state.setdefault('checksums', {})[str(index)] = request.headers['X-Chunk-Checksum'].strip().lower()
+        _save_state(job_path, state)
+    return jsonify({'received': len(state['received']), 'chunks': _chunk_count(state)})
+
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(job_id, upload_id):
+    """Move the finished file to ``input/<name>`` once every chunk arrived."""
+    job_path = _job_path(job_id)
+    if not job_path:
+        return jsonify({'error': 'Upload not found'}), 404
+    with _locked(upload_id):
+        state = _load_state(job_path, upload_id)
+        if not state:
+            return jsonify({'error': 'Upload not found'}), 404
+        status = _status(state)
+        if status['missing']:
+            return jsonify(dict(status, error='Upload is incomplete')), 409
+        final_path = os.path.join(job_path, 'input', state['filename'])
+        os.replace(_part_path(job_path, state), final_path)
+        os.remove(_state_path(job_path, upload_id))
+        checksum = _file_checksum(state)
+        if checksum:
+            record_upload(job_path, state['filename'], checksum)
+    return jsonify({'filename': state['filename'], 'size': state['size']})
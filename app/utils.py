@@ -1,6 +1,9 @@
+import json
 import os
 import shutil
 import stat
+import threading
+from datetime import datetime
 
 
 def remove_dir(path):
@@ -17,6 +20,65 @@ def remove_dir(path):
         shutil.rmtree(path, onerror=_onerror)
 
 
+# Linux ioctl that shares the data blocks of two files (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+def reflink_file(src, dst):
+    """Copy-on-write clone of ``src``; raises OSError where unsupported."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def clone_file(src, dst, link=False):
+    """Copy ``src`` to ``dst`` as cheaply as the filesystem allows.
+
+    A reflink is tried first, then a hard link when ``link`` is set (only
+    safe for files that are never modified in place), then a plain copy.
+    Returns the method used.
+    """
+    try:
+        reflink_file(src, dst)
+        return 'reflink'
+    except (ImportError, OSError):
+        pass
+    if link:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def clone_tree(src, dst, link=False):
+    """Recursively :func:`clone_file` the directory ``src`` into ``dst``."""
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            clone_file(os.path.join(root, name), os.path.join(target, name), link)
+
+
+def tree_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
 def is_file_locked(path):
     """Check if a file is locked by attempting to acquire an exclusive lock."""
     try:
@@ -39,3 +101,57 @@ def is_file_locked(path):
     except Exception:
         return True
     return False
+
+
+def parse_timestamp(ts):
+    if ts is None:
+        return 0
+    if isinstance(ts, (int, float)):
+        return ts
+    if isinstance(ts, str):
+        if ts.isdigit():
+            return int(ts)
+        try:
+            return datetime.fromisoformat(ts).timestamp()
+        except ValueError:
+            try:
+                return float(ts)
+            except ValueError:
+                return 0
+    return 0
+
+
+_metadata_lock = threading.RLock()
+
+
+def load_metadata(job_path):
+    """Return the job's metadata.json contents, or an empty dict."""
+    meta_file = os.path.join(job_path, 'metadata.json')
+    if os.path.isfile(meta_file):
+        try:
+            with open(meta_file) as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            pass
+    return {}
+
+
+def save_metadata(job_path, meta):
+    """Atomically write metadata.json for the job."""
+    meta_file = os.path.join(job_path, 'metadata.json')
+    tmp_file = f'{meta_file}.{threading.get_ident()}.tmp'
+    with _metadata_lock:
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, meta_file)
+        from app import registry
+        registry.record(os.path.basename(os.path.normpath(job_path)), meta)
+
+
+def update_metadata(job_path, **changes):
+    """Merge ``changes`` into metadata.json and return the new contents."""
+    with _metadata_lock:
+        meta = load_metadata(job_path)
+        meta.update(changes)
+        save_metadata(job_path, meta)
+        return meta
@@ -0,0 +1,130 @@
+"""Per-step snapshots of a job's outputs built from hard links.
+
+Before a step runs, ``output/`` and the design snapshot are hard linked into
+``workspace/<step>/``.  Taking a snapshot therefore costs no data, and a
+step only pays for the files it changes: the outputs it rewrites in place,
+declared per step as ``writes`` patterns in ``flow.json``, are given
+private copies right away (every output is, for steps that declare
+nothing), and ``design.aedb`` is unshared by the EDB pool just before a
+handle that may save it is opened.  Directories the steps only ever replace
+as a whole, such as the layer tiles or the cutouts, stay linked, and so
+does the design snapshot, which is always replaced rather than rewritten.
+
+Rewinding a job to step N links ``workspace/<step N>/`` back into place.
+"""
+import fnmatch
+import os
+import time
+
+from app.utils import clone_file, clone_tree, remove_dir
+
+# Unshared lazily by app.edb_pool before EDB may write to it
+LAZY_DIRS = ('design.aedb',)
+# Only ever removed and written again as a whole
+REPLACED_DIRS = ('tiles', 'cutout.aedb', 'cutouts')
+
+
+def workspace_dir(job_path, step=None):
+    path = os.path.join(job_path, 'workspace')
+    return os.path.join(path, step) if step else path
+
+
+def _design_snapshot(job_path):
+    return os.path.join(job_path, 'cache', 'design_snapshot.json')
+
+
+def has_links(path):
+    """True if any file below ``path`` shares its data with another path."""
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                if os.stat(os.path.join(root, name)).st_nlink > 1:
+                    return True
+            except OSError:
+                pass
+    return False
+
+
+def break_links(path, skip=(), only=None):
+    """Give every hard linked file below ``path`` its own copy of the data.
+
+    ``only`` limits this to the files whose path relative to ``path``
+    matches one of its glob patterns.
+    """
+    for root, dirs, files in os.walk(path):
+        if root == path:
+            dirs[:] = [d for d in dirs if d not in skip]
+        for name in files:
+            file_path = os.path.join(root, name)
+            if only is not None:
+                rel = os.path.relpath(file_path, path).replace(os.sep, '/')
+                if not any(fnmatch.fnmatchcase(rel, pattern) for pattern in only):
+                    continue
+            try:
+                if os.stat(file_path).st_nlink <= 1:
+                    continue
+            except OSError:
+                continue
+            tmp_path = f'{file_path}.unlink-tmp'
+            clone_file(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
+
+
+def unshare_outputs(job_path, writes=None):
+    """Give the outputs matching ``writes`` (all when None) private copies."""
+    break_links(os.path.join(job_path, 'output'), skip=LAZY_DIRS + REPLACED_DIRS, only=writes)
+
+
+def snapshot_step(job_path, step, writes=None):
+    """Record the job's outputs as they are before ``step`` runs.
+
+    ``writes`` are the patterns of the outputs the step rewrites in place
+    (see :func:`app.flow_registry.step_writes`); pass ``()`` when nothing
+    runs after the snapshot.
+    """
+    target = workspace_dir(job_path, step)
+    remove_dir(target)
+    output_dir = os.path.join(job_path, 'output')
+    if os.path.isdir(output_dir):
+        clone_tree(output_dir, os.path.join(target, 'output'), link=True)
+    else:
+        os.makedirs(target, exist_ok=True)
+    snapshot = _design_snapshot(job_path)
+    if os.path.isfile(snapshot):
+        clone_file(snapshot, os.path.join(target, 'design_snapshot.json'), link=True)
+    with open(os.path.join(target, 'taken_at'), 'w') as fp:
+        fp.write(str(time.time()))
+    # The step may rewrite these in place; keep the snapshot's data intact
+    unshare_outputs(job_path, writes)
+
+
+def has_snapshot(job_path, step):
+    return os.path.isfile(os.path.join(workspace_dir(job_path, step), 'taken_at'))
+
+
+def restore(job_path, name):
+    """Link the snapshot ``name`` back into place as the job's outputs.
+
+    Pooled EDB handles of the job must be closed by the caller first.
+    """
+    source = workspace_dir(job_path, name)
+    output_dir = os.path.join(job_path, 'output')
+    remove_dir(output_dir)
+    if os.path.isdir(os.path.join(source, 'output')):
+        clone_tree(os.path.join(source, 'output'), output_dir, link=True)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    snapshot = _design_snapshot(job_path)
+    if os.path.isfile(snapshot):
+        os.remove(snapshot)
+    saved = os.path.join(source, 'design_snapshot.json')
+    if os.path.isfile(saved):
+        os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+        clone_file(saved, snapshot, link=True)
+
+
+def rewind(job_path, step, later_steps=()):
+    """Restore the outputs recorded before ``step``; drops later snapshots."""
+    restore(job_path, step)
+    for later in later_steps:
+        remove_dir(workspace_dir(job_path, later))
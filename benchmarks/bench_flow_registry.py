@@ -0,0 +1,107 @@
+"""Per-request flow overhead with and without the flow registry.
+
+``before`` repeats what the deck page and a step POST used to do on every
+request: walk the flow folder and parse each ``flow.json``, read the flow
+name and step order from ``flow.json`` again and import the step module
+from its file.  ``after`` does the same lookups through
+``app.flow_registry``, once with hot reload off (production) and once with
+it on (development, one ``stat`` per file).
+
+Usage::
+
+    python benchmarks/bench_flow_registry.py [--step step_03] [-n 200]
+
+Steps whose module imports fail (e.g. pyedb is not installed) are reported
+and skipped.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import flow_registry  # noqa: E402
+
+FLOW_DIR = os.path.join(ROOT, 'app', 'flows')
+
+
+def _old_load_flows():
+    flows = []
+    for name in os.listdir(FLOW_DIR):
+        fdir = os.path.join(FLOW_DIR, name)
+        if os.path.isdir(fdir):
+            fjson = os.path.join(fdir, 'flow.json')
+            if os.path.isfile(fjson):
+                with open(fjson) as f:
+                    data = json.load(f)
+                    data['id'] = name
+                    flows.append(data)
+    return flows
+
+
+def old_request(flow_id, step):
+    _old_load_flows()
+    flow_path = os.path.join(FLOW_DIR, flow_id)
+    with open(os.path.join(flow_path, 'flow.json')) as f:
+        json.load(f).get('name', flow_id)
+    spec = importlib.util.spec_from_file_location(step, os.path.join(flow_path, f'{step}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with open(os.path.join(flow_path, 'flow.json')) as f:
+        steps = json.load(f).get('steps', [])
+    if step in steps and steps.index(step) + 1 < len(steps):
+        steps[steps.index(step) + 1]
+    return module
+
+
+def new_request(flow_id, step):
+    flow_registry.flows()
+    flow_registry.flow_name(flow_id)
+    module = flow_registry.load_step(flow_id, step)
+    flow_registry.next_step(flow_id, step)
+    return module
+
+
+def _time(func, flow_id, step, number):
+    func(flow_id, step)
+    start = time.perf_counter()
+    for _ in range(number):
+        func(flow_id, step)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--flow', help='flow id (default: every flow)')
+    parser.add_argument('--step', help='step name (default: every step)')
+    parser.add_argument('-n', '--number', type=int, default=200, help='requests per measurement')
+    args = parser.parse_args()
+
+    flow_registry.reload()
+    print(f"{'flow/step':<32}{'before us':>12}{'after us':>12}{'hot us':>12}{'speedup':>10}")
+    for flow in flow_registry.flows():
+        if args.flow and flow['id'] != args.flow:
+            continue
+        for step in flow.get('steps', []):
+            if args.step and step != args.step:
+                continue
+            label = f"{flow['id']}/{step}"
+            try:
+                before = _time(old_request, flow['id'], step, args.number)
+            except Exception as exc:
+                print(f'{label:<32}skipped: {type(exc).__name__}: {exc}')
+                continue
+            flow_registry._settings['hot_reload'] = False
+            after = _time(new_request, flow['id'], step, args.number)
+            flow_registry._settings['hot_reload'] = True
+            hot = _time(new_request, flow['id'], step, args.number)
+            flow_registry._settings['hot_reload'] = False
+            print(f'{label:<32}{before:>12.1f}{after:>12.1f}{hot:>12.1f}{before / after:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Stackup sheet I/O and apply on a synthetic stackup.
+
+``before`` repeats what Steps 1 and 2 used to do: build the workbook with
+one ``Workbook.append`` per layer, parse it with a full
+``openpyxl.load_workbook`` and convert each thickness in a Python loop.
+``after`` goes through :mod:`app.stackup_io` (streaming ``read_only`` /
+``write_only`` workbooks, NumPy unit conversion) for each supported format.
+
+The apply section opens the stackup in the fake EDB backend
+(:mod:`app.edb_fake`) and compares setting every layer from the sheet with
+the diff-based :func:`app.edb_ops.apply_changes`, after ``--changed`` layers
+were edited.  It reports layer property writes, which is what costs time
+with pyedb.
+
+Usage::
+
+    python benchmarks/bench_stackup_io.py [--layers 60] [--changed 2] [-n 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import edb_fake, edb_ops, stackup_io  # noqa: E402
+from app.snapshot import extract_stackup  # noqa: E402
+
+
+def synthetic_stackup(count):
+    """``count`` alternating signal/dielectric layers as from ``extract_stackup``."""
+    layers = []
+    for i in range(count):
+        if i % 2 == 0:
+            layers.append({'name': f'L{i // 2 + 1}', 'type': 'signal', 'thickness': 3.5e-5 + i * 1e-7,
+                           'material': 'copper', 'conductivity': 5.8e7})
+        else:
+            layers.append({'name': f'D{i // 2 + 1}', 'type': 'dielectric', 'thickness': 1e-4 + i * 1e-7,
+                           'material': 'FR4', 'permittivity': 4.4, 'loss_tangent': 0.02})
+    return layers
+
+
+def old_write(layers, path, unit='mm'):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Stackup'
+    ws.append(['unit', unit])
+    ws.append(stackup_io._header(unit))
+    for layer in layers:
+        if unit == 'mil':
+            thickness = layer['thickness'] * 1000.0 / 0.0254
+        else:
+            thickness = layer['thickness'] * 1000.0
+        if layer['type'] == 'signal':
+            ws.append([layer['name'], layer['type'], thickness, '', '', layer['conductivity']])
+        else:
+            ws.append([layer['name'], layer['type'], thickness, layer['permittivity'], layer['loss_tangent'], ''])
+    wb.save(path)
+
+
+def old_read(path):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path)
+    ws = wb['Stackup']
+    unit = str(ws.cell(row=1, column=2).value or 'mm').lower()
+    rows = []
+    for row in ws.iter_rows(min_row=3, values_only=True):
+        name, layer_type, thickness, permittivity, loss_tangent, conductivity = row[:6]
+        if not name:
+            continue
+        if unit == 'mil':
+            thickness_m = float(thickness) * 25.4e-6
+        else:
+            thickness_m = float(thickness) / 1000.0
+        rows.append((name, layer_type, thickness_m, permittivity, loss_tangent, conductivity))
+    return rows
+
+
+def _time(func, number):
+    func()
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1e3
+
+
+def _open_design(tmp, layers):
+    design = edb_fake.sample_design()
+    design['layers'] = {layer['name']: {'type': layer['type'], 'thickness': layer['thickness'],
+                                        'material': layer['material']} for layer in layers}
+    brd = os.path.join(tmp, 'design.brd')
+    with open(brd, 'w') as fp:
+        json.dump(design, fp)
+    return edb_fake.Edb(brd)
+
+
+def old_apply(edb, rows):
+    """Set every layer; returns the number of layer property writes."""
+    writes = 0
+    material_dic = {}
+    for row in rows:
+        layer = edb.stackup.stackup_layers[row['name']]
+        layer.thickness = row['thickness']
+        if row['type'] == 'signal':
+            key = row['conductivity']
+            if key not in material_dic:
+                material_dic[key] = edb.materials.add_conductor_material(f'metal_{key}', key)
+        else:
+            key = (row['permittivity'], row['loss_tangent'])
+            if key not in material_dic:
+                material_dic[key] = edb.materials.add_dielectric_material(f'dielectric_{key[0]}_{key[1]}', *key)
+        layer.material = material_dic[key].name
+        writes += 2
+    return writes
+
+
+def new_apply(edb, rows):
+    """Diff against the design and apply the changes; returns the writes."""
+    changes = edb_ops.diff_stackup(rows, extract_stackup(edb))
+    edb_ops.apply_changes(edb, changes, {'materials_created': [], 'materials_reused': []})
+    return sum(('thickness' in change) + ('material' in change) for change in changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--layers', type=int, default=60, help='layers in the synthetic stackup')
+    parser.add_argument('--changed', type=int, default=2, help='layers edited before applying')
+    parser.add_argument('-n', '--number', type=int, default=20, help='repetitions per measurement')
+    args = parser.parse_args()
+
+    layers = synthetic_stackup(args.layers)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f'{args.layers}-layer stackup')
+        print(f"{'format':<14}{'write ms':>10}{'read ms':>10}{'size B':>10}")
+        path = os.path.join(tmp, 'old.xlsx')
+        write = _time(lambda: old_write(layers, path), args.number)
+        read = _time(lambda: old_read(path), args.number)
+        print(f"{'xlsx (before)':<14}{write:>10.2f}{read:>10.2f}{os.path.getsize(path):>10}")
+        for ext in stackup_io.FORMATS:
+            path = os.path.join(tmp, f'stackup{ext}')
+            write = _time(lambda: stackup_io.write_stackup(layers, path), args.number)
+            read = _time(lambda: stackup_io.read_stackup(path), args.number)
+            print(f"{ext[1:]:<14}{write:>10.2f}{read:>10.2f}{os.path.getsize(path):>10}")
+
+        rows = stackup_io.read_stackup(os.path.join(tmp, 'stackup.json'))
+        for row in rows[:args.changed]:
+            row['thickness'] *= 1.5
+        print(f'\napply with {args.changed} edited layers')
+        print(f"{'':<14}{'ms':>10}{'writes':>10}")
+        results = {}
+        for label, func in (('before', old_apply), ('after', new_apply)):
+            results[label] = func(_open_design(tmp, layers), rows)
+            ms = _time(lambda: func(_open_design(tmp, layers), rows), args.number)
+            print(f'{label:<14}{ms:>10.2f}{results[label]:>10}')
+
+
+if __name__ == '__main__':
+    main()
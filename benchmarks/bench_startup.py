@@ -0,0 +1,120 @@
+"""Time from a cold interpreter to the first served request.
+
+Imports ``run.py`` and builds the app as its ``__main__`` block does, in a
+fresh ``python -X importtime`` process, serves ``GET /login`` through the test
+client and reports:
+
+* the time to import the app, to build it and to answer the first request,
+* the slowest imports by cumulative time (from ``-X importtime``),
+* whether any of the heavyweight libraries the web tier must not load
+  (pyedb, openpyxl, matplotlib, ...) were imported.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--budget 1.0] [--json]
+
+``--target app`` builds the app with ``app.create_app()`` instead of
+importing ``run.py``, for environments without waitress.
+
+The exit status is 1 when a heavyweight library was imported or the median
+time to first request is over ``--budget`` seconds, so the script can be
+tracked in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = {
+    'run': 'import run; app = run.create_app()',
+    'app': 'from app import create_app; app = create_app()',
+}
+HEAVY = ('pyedb', 'clr', 'pythonnet', 'openpyxl', 'matplotlib', 'numpy', 'PIL', 'pandas')
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+%s
+imported = time.perf_counter()
+client = app.test_client()
+status = client.get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first_request': served - start,
+    'status': status,
+    'heavy': sorted(m for m in %r if m in sys.modules),
+}))
+'''
+
+
+def _parse_importtime(stderr):
+    """Return ``[(cumulative_us, module)]`` from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].rstrip()))
+    return rows
+
+
+def run_once(target):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD % (TARGETS[target], HEAVY)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith('{'):
+            result = json.loads(line)
+    if proc.returncode != 0 or result is None:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        sys.stderr.write('\n'.join(errors[-20:]) + '\n')
+        raise SystemExit(f'startup failed with exit code {proc.returncode}')
+    result['imports'] = _parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target', choices=sorted(TARGETS), default='run')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds to first request')
+    parser.add_argument('--json', action='store_true', help='print a JSON summary only')
+    args = parser.parse_args()
+
+    runs = [run_once(args.target) for _ in range(max(1, args.runs))]
+    first = statistics.median(r['first_request'] for r in runs)
+    summary = {
+        'runs': len(runs),
+        'import_s': statistics.median(r['import'] for r in runs),
+        'first_request_s': first,
+        'status': runs[-1]['status'],
+        'heavy_imports': runs[-1]['heavy'],
+        'budget_s': args.budget,
+    }
+    ok = not summary['heavy_imports'] and first <= args.budget
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"import app         {summary['import_s'] * 1000:8.1f} ms (median of {len(runs)})")
+        print(f"first request      {first * 1000:8.1f} ms (budget {args.budget * 1000:.0f} ms)")
+        print(f"heavy imports      {', '.join(summary['heavy_imports']) or 'none'}")
+        print('\nslowest imports (cumulative, last run):')
+        top = sorted(runs[-1]['imports'], reverse=True)[:args.top]
+        for cumulative, module in top:
+            print(f'  {cumulative / 1000:8.1f} ms  {module.strip()}')
+        print('\nOK' if ok else '\nFAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,11 @@
 from app import create_app
+from app.executor import start_node
 from waitress import serve
 import socket
 import threading
 import webbrowser
 import time
 
-app = create_app()
 
 def open_browser(url):
     # 等待幾秒讓 server 啟動
@@ -13,6 +13,8 @@ def open_browser(url):
     webbrowser.open(url)
 
 if __name__ == "__main__":
+    # Only here: EDB workers and layer renderers are spawned and re-import __main__
+    app = create_app()
     host = "0.0.0.0"
     port = 5000
     try:
@@ -25,5 +27,9 @@ if __name__ == "__main__":
     # 啟動新執行緒開啟瀏覽器
     threading.Thread(target=open_browser, args=(url,)).start()
 
+    # Take steps from the (possibly shared) queue as soon as the node is up
+    start_node()
+
     print(f"Server running on http://{ip}:{port}")
-    serve(app, host=host, port=port)
+    # Extra threads leave room for the job event streams (SSE_MAX_STREAMS)
+    serve(app, host=host, port=port, threads=8)
@@ -0,0 +1,38 @@
+import pytest
+
+from app import create_app, design_cache, registry
+
+
+@pytest.fixture(autouse=True)
+def job_registry(tmp_path, monkeypatch):
+    """Keep the job index of every test in its own database."""
+    monkeypatch.setitem(registry._settings, 'path', str(tmp_path / 'registry.sqlite3'))
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    """An empty ``jobs`` folder used by every module in place of the real one."""
+    from app import admin, batch, executor, routes, uploads
+
+    path = tmp_path / 'jobs'
+    path.mkdir()
+    for module in (admin, batch, executor, registry, routes, uploads):
+        monkeypatch.setattr(module, 'JOB_DIR', str(path))
+    monkeypatch.setitem(design_cache._settings, 'root', str(path / '.design_cache'))
+    return path
+
+
+@pytest.fixture
+def app(jobs_dir):
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as ``admin``."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'admin'
+    return client
@@ -0,0 +1,106 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from app import archive
+
+
+def _tree(root):
+    """A small AEDB-like folder with empty, compressible and incompressible files."""
+    src = root / 'design.aedb'
+    (src / 'sub').mkdir(parents=True)
+    files = {
+        'design.aedb/edb.def': os.urandom(archive.BLOCK_SIZE + 12345),
+        'design.aedb/sub/text.txt': b'layer stack\n' * 200000,
+        'design.aedb/empty.lock': b'',
+        'design.aedb/sub/tiny.bin': b'x',
+    }
+    for name, data in files.items():
+        (root / name).write_bytes(data)
+    return src, files
+
+
+def _sparse(path, size):
+    with open(path, 'wb') as fp:
+        fp.truncate(size)
+    return str(path)
+
+
+def _write_sparse(chunks, path):
+    """Write a stream to ``path``, skipping runs of zeros so a huge zip stays sparse."""
+    with open(path, 'wb') as out:
+        for chunk in chunks:
+            if chunk.count(0) == len(chunk):
+                out.seek(len(chunk), os.SEEK_CUR)
+            else:
+                out.write(chunk)
+        out.truncate()
+
+
+@pytest.mark.parametrize('level', sorted(archive.LEVELS))
+def test_every_level_round_trips(tmp_path, level):
+    src, files = _tree(tmp_path)
+
+    data = b''.join(archive.iter_zip(archive.collect_entries(str(src)), level, threads=2))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(files)
+        for name, content in files.items():
+            assert zf.read(name) == content
+        method = zipfile.ZIP_STORED if level == 'store' else zipfile.ZIP_DEFLATED
+        assert {info.compress_type for info in zf.infolist()} == {method}
+
+
+def test_archive_size_is_the_streamed_length(tmp_path):
+    src, _ = _tree(tmp_path)
+    entries = archive.collect_entries(str(src))
+
+    assert archive.archive_size(entries) == sum(len(chunk) for chunk in archive.iter_zip(entries, 'store'))
+    assert archive.archive_size([]) == len(b''.join(archive.iter_zip([], 'store')))
+
+
+def test_zip64_thresholds(tmp_path):
+    below = archive.file_entry(_sparse(tmp_path / 'below', archive.ZIP64_LIMIT - 1), 'below')
+    at = archive.file_entry(_sparse(tmp_path / 'at', archive.ZIP64_LIMIT), 'at')
+    # Deflate switches early, since incompressible data grows slightly
+    deflate_edge = int(archive.ZIP64_LIMIT / (1 + archive._DEFLATE_SLACK)) - 2048
+    compressible = archive.file_entry(_sparse(tmp_path / 'edge', deflate_edge), 'edge')
+
+    assert not archive._needs_zip64(below, 0)
+    assert archive._needs_zip64(at, 0)
+    assert archive._needs_zip64(below, 8)
+    assert not archive._needs_zip64(compressible, 8)
+
+
+def test_stored_zip64_archive_of_a_sparse_large_file(tmp_path):
+    src = tmp_path / 'big'
+    src.mkdir()
+    _sparse(src / 'huge.bin', archive.ZIP64_LIMIT + 1)
+    (src / 'z_after.txt').write_bytes(b'after the 4 GiB mark')
+    entries = archive.collect_entries(str(src))
+    zip_path = tmp_path / 'big.zip'
+
+    _write_sparse(archive.iter_zip(entries, 'store'), zip_path)
+
+    assert os.path.getsize(zip_path) == archive.archive_size(entries)
+    with zipfile.ZipFile(zip_path) as zf:
+        huge, after = zf.infolist()
+        assert huge.file_size == archive.ZIP64_LIMIT + 1
+        assert after.header_offset > archive.ZIP64_LIMIT
+        assert zf.read('big/z_after.txt') == b'after the 4 GiB mark'
+
+
+def test_write_archive_skips_an_unchanged_tree(tmp_path):
+    src, _ = _tree(tmp_path)
+    zip_path = str(tmp_path / 'out' / 'design.zip')
+
+    assert archive.write_archive(str(src), zip_path, 'fast')
+    assert archive.is_current(str(src), zip_path)
+    assert not archive.write_archive(str(src), zip_path, 'fast')
+
+    (src / 'sub' / 'tiny.bin').write_bytes(b'changed')
+    assert not archive.is_current(str(src), zip_path)
+    assert archive.write_archive(str(src), zip_path, 'fast')
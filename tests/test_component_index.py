@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from app.component_index import ComponentIndex
+
+
+class _Def:
+    def __init__(self, name):
+        self.name = name
+
+    def GetName(self):
+        return self.name
+
+    def SetName(self, name):
+        self.name = name
+
+
+def _edb(**parts):
+    """A stand-in EDB with one resistor per ``refdes=part_name``."""
+    comps = {refdes: SimpleNamespace(part_name=part_name, type='Resistor', value='1k')
+             for refdes, part_name in parts.items()}
+    defs = [_Def(part_name) for part_name in sorted(set(parts.values()))]
+    return SimpleNamespace(component_defs=defs, components=SimpleNamespace(components=comps))
+
+
+def test_rename_moves_definition_and_instances():
+    index = ComponentIndex(_edb(R1='A', R2='A'))
+
+    assert index.rename('A', 'B')
+    assert index.defs['B'].GetName() == 'B'
+    assert 'A' not in index.defs
+    assert len(index.instances['B']) == 2
+    assert index.parts_by_type['Resistor'] == {'B'}
+
+
+def test_rename_onto_existing_part_is_refused():
+    edb = _edb(R1='A', R2='B')
+    index = ComponentIndex(edb)
+
+    assert not index.rename('A', 'B')
+    assert [comp_def.GetName() for comp_def in edb.component_defs] == ['A', 'B']
+    assert len(index.instances['A']) == 1
+    assert len(index.instances['B']) == 1
+    assert index.parts_by_type['Resistor'] == {'A', 'B'}
@@ -0,0 +1,113 @@
+import io
+import json
+import time
+import zipfile
+
+import pytest
+
+from app import archive, packaging
+
+
+def _tree(root):
+    src = root / 'design.aedb'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'edb.def').write_bytes(b'edb' * 100000)
+    (src / 'sub' / 'tiny.bin').write_bytes(b'x')
+    (src / 'empty.lock').write_bytes(b'')
+
+
+@pytest.fixture
+def job(jobs_dir):
+    path = jobs_dir / 'job-a'
+    (path / 'output').mkdir(parents=True)
+    (path / 'metadata.json').write_text(json.dumps({'user': 'admin', 'step': 'completed'}))
+    _tree(path / 'output')
+    (path / 'output' / 'stackup.xlsx').write_bytes(b'sheet')
+    return path
+
+
+def test_streamed_and_materialised_downloads_agree(client, job):
+    url = '/job/job-a/archive/output/design.aedb?level=store'
+
+    streamed = client.get(url)
+    body = streamed.get_data()
+    assert int(streamed.headers['Content-Length']) == len(body)
+    assert zipfile.ZipFile(io.BytesIO(body)).testzip() is None
+
+    archive.write_archive(str(job / 'output' / 'design.aedb'),
+                          archive.archive_cache_path(str(job), 'output/design.aedb', 'store'), 'store')
+    sent = client.get(url)
+    assert sent.headers.get('Accept-Ranges') == 'bytes'
+    assert int(sent.headers['Content-Length']) == len(sent.get_data())
+    assert sent.get_data() == body
+
+
+def test_deflated_download_has_no_content_length(client, job):
+    resp = client.get('/job/job-a/archive/output/design.aedb?level=best')
+
+    assert 'Content-Length' not in resp.headers
+    assert zipfile.ZipFile(io.BytesIO(resp.get_data())).testzip() is None
+    assert client.get('/job/job-a/archive/output?level=huge').status_code == 400
+    assert client.get('/job/job-a/archive/../job-b').status_code == 404
+
+
+def _packaged(client):
+    for _ in range(200):
+        status = client.get('/api/jobs/job-a/package').get_json()
+        if status['state'] != 'running':
+            return status
+        time.sleep(0.05)
+    raise AssertionError('packaging did not finish')
+
+
+def test_package_api_builds_the_downloads_and_bundle(client, job):
+    assert client.get('/api/jobs/job-a/package').status_code == 404
+
+    assert client.post('/api/jobs/job-a/package', data={'bundle': '1'}).status_code == 200
+    status = _packaged(client)
+
+    assert status['state'] == 'done'
+    assert [artifact['name'] for artifact in status['artifacts']] == ['design.aedb.zip', 'job-a_bundle.zip']
+    for artifact in status['artifacts']:
+        resp = client.get(artifact['url'])
+        assert resp.status_code == 200
+        assert int(resp.headers['Content-Length']) == len(resp.get_data()) == artifact['size']
+    bundle = zipfile.ZipFile(io.BytesIO(client.get(status['artifacts'][1]['url']).get_data()))
+    assert 'stackup.xlsx' in bundle.namelist()
+    assert json.loads(bundle.read('manifest.json'))['job_id'] == 'job-a'
+    assert packaging.ensure(str(job))['started_at'] == status['started_at']
+
+
+def test_failed_packaging_waits_for_a_retry(client, job, monkeypatch):
+    write_archive = packaging.write_archive
+    broken = {'on': True}
+
+    def flaky(*args, **kwargs):
+        if broken['on']:
+            raise OSError('disk full')
+        return write_archive(*args, **kwargs)
+
+    monkeypatch.setattr(packaging, 'write_archive', flaky)
+    (job / 'metadata.json').write_text(json.dumps({'user': 'admin', 'step': 'step_06'}))
+    packaging.start(str(job))
+    failed = _packaged(client)
+    assert failed['state'] == 'failed'
+    assert failed['artifacts'][0]['error'] == 'disk full'
+
+    # Opening Step 6 and polling keep the failed run
+    assert client.get('/flow/Flow_SIwave_SYZ/step_06/job-a').status_code == 200
+    assert packaging.ensure(str(job))['started_at'] == failed['started_at']
+    assert _packaged(client)['started_at'] == failed['started_at']
+
+    # Changed sources package again
+    (job / 'output' / 'design.aedb' / 'sub' / 'new.bin').write_bytes(b'new')
+    changed = packaging.ensure(str(job))
+    assert changed['started_at'] != failed['started_at']
+    assert _packaged(client)['state'] == 'failed'
+
+    # So does an explicit retry
+    broken['on'] = False
+    client.post('/api/jobs/job-a/package')
+    retried = _packaged(client)
+    assert retried['state'] == 'done'
+    assert retried['started_at'] != changed['started_at']
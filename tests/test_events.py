@@ -0,0 +1,62 @@
+import pytest
+
+from app import events
+
+
+@pytest.fixture(autouse=True)
+def slots(monkeypatch):
+    monkeypatch.setattr(events, '_slots', {})
+    monkeypatch.setattr(events, '_settings', dict(events._settings, max_streams=2, max_user_streams=1,
+                                                  stream_seconds=0))
+
+
+def test_closing_an_unstarted_stream_frees_its_slot():
+    stream = events.open_stream('u')
+    assert events.open_stream('u') is None
+
+    # The client left before the first event was sent
+    stream.close()
+
+    assert events._slots == {}
+    assert events.open_stream('u') is not None
+
+
+def test_streams_are_capped_per_user_and_in_all():
+    first = events.open_stream('u')
+
+    assert events.open_stream('u') is None
+    second = events.open_stream('v')
+    assert second is not None
+    assert events.open_stream('w') is None
+    first.close()
+    assert events.open_stream('w') is not None
+
+
+def test_finished_stream_frees_its_slot():
+    stream = events.open_stream('u')
+
+    body = list(stream)
+
+    assert body[0].startswith('retry:')
+    assert events._slots == {}
+    stream.close()
+    assert events._slots == {}
+
+
+def test_lost_unstarted_slot_is_given_up(monkeypatch):
+    events.open_stream('u')
+    assert events.open_stream('u') is None
+
+    monkeypatch.setattr(events, 'UNSTARTED_SECONDS', -1)
+
+    assert events.open_stream('u') is not None
+
+
+def test_response_close_frees_the_slot(client):
+    resp = client.get('/api/jobs/stream')
+    assert resp.status_code == 200
+    assert len(events._slots) == 1
+
+    resp.close()
+
+    assert events._slots == {}
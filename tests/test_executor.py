@@ -0,0 +1,72 @@
+import json
+import os
+
+from app import executor, job_queue
+from app.executor import StepTask
+from app.utils import load_metadata
+
+LIMITS = {'slots': 4, 'per_user': 0, 'licenses': None, 'cpus': 8, 'memory_mb': 65536, 'aging': 300}
+
+
+def _job(tmp_path):
+    job_path = tmp_path / 'job-a'
+    staged = job_path / 'tmp' / 'uploads' / 'design_file' / 'x.brd'
+    staged.parent.mkdir(parents=True)
+    staged.write_bytes(b'brd')
+    (job_path / 'metadata.json').write_text(json.dumps({'user': 'u', 'step': 'step_01', 'status': 'queued'}))
+    return str(job_path), str(staged)
+
+
+def _claim(queue, node_id):
+    queue.register(node_id, f'host-{node_id}', 4)
+    [record] = queue.claim(node_id, f'host-{node_id}', LIMITS, node_timeout=30)
+    return record
+
+
+def _setup(tmp_path, monkeypatch):
+    queue = job_queue.open_queue('memory://')
+    monkeypatch.setitem(executor._node, 'queue', queue)
+    job_path, staged = _job(tmp_path)
+    runs = []
+    task = StepTask(job_path, 'step_01', lambda job_path, data=None, files=None, config=None: runs.append(1),
+                    files={'design_file': [('x.brd', staged, None)]}, user='u')
+    queue.enqueue({'id': task.task_id, 'job_id': task.job_id, 'step': 'step_01', 'user': 'u', 'payload': {}})
+    return queue, task, staged, runs
+
+
+def test_stale_attempt_keeps_staged_files_for_the_new_owner(tmp_path, monkeypatch):
+    queue, task, staged, runs = _setup(tmp_path, monkeypatch)
+    stale = _claim(queue, 'node-a')
+    # node-a is presumed lost and node-b takes the step over
+    queue.requeue_lost(timeout=-1)
+    current = _claim(queue, 'node-b')
+    assert current['attempts'] == stale['attempts'] + 1
+
+    monkeypatch.setitem(executor._settings, 'node_id', 'node-a')
+    executor._execute(task, stale)
+
+    assert runs == [1]
+    assert not queue.finish(stale['id'], 'node-a', stale['attempts'])
+    assert os.path.isfile(staged)
+    assert load_metadata(task.job_path)['status'] == 'running'
+    with open(os.path.join(task.job_path, 'error.log')) as fp:
+        assert 'result discarded on node-a' in fp.read()
+
+    monkeypatch.setitem(executor._settings, 'node_id', 'node-b')
+    executor._execute(task, current)
+
+    assert load_metadata(task.job_path)['status'] == 'done'
+    assert not os.path.exists(staged)
+    assert queue.task(task.job_id) is None
+
+
+def test_failed_step_of_owner_discards_staged_files(tmp_path, monkeypatch):
+    queue, task, staged, _ = _setup(tmp_path, monkeypatch)
+    task.run = lambda job_path, data=None: 1 / 0
+    record = _claim(queue, 'node-a')
+
+    monkeypatch.setitem(executor._settings, 'node_id', 'node-a')
+    executor._execute(task, record)
+
+    assert load_metadata(task.job_path)['status'] == 'failed'
+    assert not os.path.exists(staged)
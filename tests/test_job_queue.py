@@ -0,0 +1,72 @@
+import time
+
+from app import job_queue
+
+LIMITS = {'slots': 4, 'per_user': 0, 'licenses': 1, 'cpus': 8, 'memory_mb': 65536, 'aging': 300}
+
+
+def _record(task_id, job_id, licenses=1):
+    return {
+        'id': task_id, 'job_id': job_id, 'step': 'step_02', 'user': 'u', 'queued_at': time.time(),
+        'payload': {}, 'origin': 'interactive', 'resource': 'light', 'priority': 10,
+        'licenses': licenses, 'cpus': 1, 'memory_mb': 1024,
+    }
+
+
+def _queue():
+    queue = job_queue.open_queue('memory://')
+    queue.register('node-a', 'host-a', 4)
+    return queue
+
+
+def test_idle_pooled_design_blocks_licensed_claim():
+    queue = _queue()
+    # job-a's step finished, but its design is still open in the EDB pool
+    queue.heartbeat('node-a', 'host-a', 4, 0, edb_jobs=['job-a'])
+    queue.enqueue(_record('t-b', 'job-b'))
+
+    assert queue.claim('node-a', 'host-a', LIMITS, node_timeout=30) == []
+    assert queue.stats(node_timeout=30)['licenses_in_use'] == 1
+
+    queue.heartbeat('node-a', 'host-a', 4, 0, edb_jobs=[])
+    assert [r['id'] for r in queue.claim('node-a', 'host-a', LIMITS, node_timeout=30)] == ['t-b']
+
+
+def test_step_reuses_license_of_its_own_open_design():
+    queue = _queue()
+    queue.heartbeat('node-a', 'host-a', 4, 0, edb_jobs=['job-a'])
+    queue.enqueue(_record('t-a', 'job-a'))
+
+    assert [r['id'] for r in queue.claim('node-a', 'host-a', LIMITS, node_timeout=30)] == ['t-a']
+    assert queue.stats(node_timeout=30)['licenses_in_use'] == 1
+
+
+def test_unlicensed_step_still_runs_next_to_open_designs():
+    queue = _queue()
+    queue.heartbeat('node-a', 'host-a', 4, 0, edb_jobs=['job-a'])
+    queue.enqueue(_record('t-b', 'job-b', licenses=0))
+
+    assert [r['id'] for r in queue.claim('node-a', 'host-a', LIMITS, node_timeout=30)] == ['t-b']
+
+
+def test_designs_of_lost_nodes_are_not_counted():
+    queue = _queue()
+    queue.heartbeat('node-a', 'host-a', 4, 0, edb_jobs=['job-a'])
+    queue.enqueue(_record('t-b', 'job-b'))
+
+    # node-a stopped sending heartbeats long ago
+    assert [r['id'] for r in queue.claim('node-b', 'host-a', LIMITS, node_timeout=-1)] == ['t-b']
+
+
+def test_finish_refuses_a_stale_attempt():
+    queue = _queue()
+    queue.enqueue(_record('t-a', 'job-a', licenses=0))
+    [stale] = queue.claim('node-a', 'host-a', LIMITS, node_timeout=30)
+    queue.requeue_lost(timeout=-1)
+    queue.register('node-a', 'host-a', 4)
+    [current] = queue.claim('node-a', 'host-a', LIMITS, node_timeout=30)
+
+    assert not queue.finish('t-a', 'node-a', stale['attempts'])
+    assert queue.task('job-a')['status'] == 'running'
+    assert queue.finish('t-a', 'node-a', current['attempts'])
+    assert queue.task('job-a') is None
@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app import memo, snapshot, utils
+from app.workspace import rewind, snapshot_step, workspace_dir
+
+
+@pytest.fixture(autouse=True)
+def no_reflinks(monkeypatch):
+    def refuse(src, dst):
+        raise OSError('reflinks are not supported here')
+    monkeypatch.setattr(utils, 'reflink_file', refuse)
+
+
+@pytest.fixture
+def job(tmp_path):
+    path = tmp_path / 'job'
+    (path / 'output' / 'design.aedb').mkdir(parents=True)
+    (path / 'output' / 'design.aedb' / 'edb.def').write_bytes(b'design')
+    (path / 'output' / 'stackup.xlsx').write_bytes(b'stackup v1')
+    (path / 'input').mkdir()
+    (path / 'input' / 'board.brd').write_bytes(b'brd')
+    return path
+
+
+@pytest.fixture
+def module(tmp_path):
+    path = tmp_path / 'step_02.py'
+    path.write_text('def run(job_path, data=None):\n    pass\n')
+    return str(path)
+
+
+def _restart(monkeypatch):
+    """Forget everything the process cached, as after a server restart."""
+    monkeypatch.setattr(snapshot, '_hash_cache', {})
+
+
+def _fingerprint(module, job, **form):
+    return memo.fingerprint(module, str(job), MultiDict(form or {'action': 'apply'}), config={'edb_version': '2024.1'})
+
+
+def test_fingerprint_is_stable_and_tracks_inputs(job, module, monkeypatch):
+    first = _fingerprint(module, job)
+    _restart(monkeypatch)
+
+    assert _fingerprint(module, job) == first
+    assert _fingerprint(module, job, action='upload') != first
+    assert memo.fingerprint(module, str(job), MultiDict({'action': 'apply'}), config={'edb_version': '2025.1'}) != first
+    (job / 'output' / 'design.aedb' / 'edb.def').write_bytes(b'other design')
+    assert _fingerprint(module, job) != first
+
+
+def test_fingerprint_covers_staged_and_uploaded_files(job, module, tmp_path):
+    staged = tmp_path / 'staged.xlsx'
+    staged.write_bytes(b'sheet')
+    data = MultiDict({'uploaded_file': 'board.brd'})
+    files = {'xlsx_file': [('s.xlsx', str(staged), None)]}
+    first = memo.fingerprint(module, str(job), data, files)
+
+    staged.write_bytes(b'sheet 2')
+    second = memo.fingerprint(module, str(job), data, files)
+    assert second != first
+    (job / 'input' / 'board.brd').write_bytes(b'brd 2')
+    assert memo.fingerprint(module, str(job), data, files) != second
+
+
+def test_verified_upload_checksum_replaces_hashing(job, module, monkeypatch):
+    snapshot.record_upload(str(job), 'board.brd', 'checksum-1')
+    hashed = []
+    monkeypatch.setattr(memo, 'file_hash', lambda path: hashed.append(path) or 'x')
+    data = MultiDict({'uploaded_file': 'board.brd'})
+
+    first = memo.fingerprint(module, str(job), data)
+    assert not any(path.endswith('board.brd') for path in hashed)
+
+    snapshot.record_upload(str(job), 'board.brd', 'checksum-2')
+    assert memo.fingerprint(module, str(job), data) != first
+    # A file changed after its upload is hashed again
+    (job / 'input' / 'board.brd').write_bytes(b'replaced')
+    memo.fingerprint(module, str(job), data)
+    assert any(path.endswith('board.brd') for path in hashed)
+
+
+def test_recorded_result_is_reused_after_a_restart(job, module, monkeypatch):
+    output = job / 'output'
+    fp = _fingerprint(module, job)
+    snapshot_step(str(job), 'step_02', writes=['stackup.xlsx'])
+    (output / 'stackup.xlsx').write_bytes(b'stackup v2')
+    (output / 'stackup_changes.json').write_text('[]')
+    memo.record(str(job), 'step_02', fp)
+    assert memo.lookup(str(job), 'step_02', fp)
+
+    # Rewind and submit the same inputs again in a new process
+    rewind(str(job), 'step_02')
+    assert (output / 'stackup.xlsx').read_bytes() == b'stackup v1'
+    _restart(monkeypatch)
+    with open(memo.memo_path(str(job))) as fp_in:
+        assert json.load(fp_in)['step_02']['fingerprint'] == fp
+    again = _fingerprint(module, job)
+    assert again == fp
+    assert memo.lookup(str(job), 'step_02', again)
+    assert not memo.lookup(str(job), 'step_02', _fingerprint(module, job, action='upload'))
+
+    memo.reuse(str(job), 'step_02')
+
+    assert (output / 'stackup.xlsx').read_bytes() == b'stackup v2'
+    assert (output / 'stackup_changes.json').read_text() == '[]'
+    result = os.path.join(workspace_dir(str(job), 'step_02.result'), 'output', 'stackup.xlsx')
+    assert os.stat(output / 'stackup.xlsx').st_nlink == os.stat(result).st_nlink == 2
+
+
+def test_lookup_needs_the_result_snapshot(job, module):
+    fp = _fingerprint(module, job)
+    memo.record(str(job), 'step_02', fp)
+
+    utils.remove_dir(workspace_dir(str(job), 'step_02.result'))
+
+    assert not memo.lookup(str(job), 'step_02', fp)
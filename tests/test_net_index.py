@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from app import net_index
+from app.net_index import NetQueryError, _Nets, query
+
+NAMES = ['DQ10', 'GND', 'dq2', 'VDD_1V8', 'CLK_P', 'DQ1', 'VCC_CORE', 'CLK_N']
+POWER = frozenset({'GND', 'VDD_1V8', 'VCC_CORE'})
+
+
+def _names(page):
+    return [net['name'] for net in page['nets']]
+
+
+@pytest.fixture
+def nets():
+    return _Nets(list(NAMES), POWER)
+
+
+def test_pattern_is_a_case_insensitive_substring(nets):
+    page = query(nets, pattern='dq1')
+    assert _names(page) == ['DQ10', 'DQ1']
+    assert page['matched'] == 2 and page['total'] == len(NAMES)
+    # Regex syntax is literal without regex=1
+    assert _names(query(nets, pattern='DQ.')) == []
+    assert _names(query(nets, pattern='[')) == []
+
+
+def test_regex_is_searched_in_the_name(nets):
+    assert _names(query(nets, pattern=r'^dq\d$', regex=True)) == ['dq2', 'DQ1']
+    assert _names(query(nets, pattern='_[PN]$', regex=True)) == ['CLK_P', 'CLK_N']
+
+
+def test_invalid_or_long_patterns_are_rejected(nets):
+    with pytest.raises(NetQueryError, match='Invalid filter'):
+        query(nets, pattern='DQ[', regex=True)
+    with pytest.raises(NetQueryError, match='longer than'):
+        query(nets, pattern='a' * (net_index.MAX_PATTERN + 1))
+    with pytest.raises(NetQueryError, match='Unknown net kind'):
+        query(nets, kind='ground')
+
+
+def test_kind_and_prefix_filters(nets):
+    assert _names(query(nets, kind='power')) == ['GND', 'VDD_1V8', 'VCC_CORE']
+    assert _names(query(nets, kind='signal')) == ['DQ10', 'dq2', 'CLK_P', 'DQ1', 'CLK_N']
+    assert all(net['power'] for net in query(nets, kind='power')['nets'])
+    assert _names(query(nets, prefix='v', kind='power', pattern='core')) == ['VCC_CORE']
+
+
+def test_order_is_natural_by_name(nets):
+    by_name = _names(query(nets, order='name'))
+    assert by_name == ['CLK_N', 'CLK_P', 'DQ1', 'dq2', 'DQ10', 'GND', 'VCC_CORE', 'VDD_1V8']
+    assert _names(query(nets, order='-name')) == by_name[::-1]
+    assert _names(query(nets)) == NAMES
+
+
+def test_offset_and_limit_page_the_matches(nets):
+    page = query(nets, order='name', offset=2, limit=3)
+    assert _names(page) == ['DQ1', 'dq2', 'DQ10']
+    assert (page['offset'], page['limit'], page['matched']) == (2, 3, len(NAMES))
+    assert _names(query(nets, offset=len(NAMES))) == []
+    clamped = query(nets, offset=-5, limit=net_index.MAX_LIMIT + 1)
+    assert clamped['offset'] == 0 and clamped['limit'] == net_index.MAX_LIMIT
+    assert query(nets, limit=0)['limit'] == 1
+
+
+def test_nets_api_reports_invalid_filters(client, jobs_dir, monkeypatch):
+    job = jobs_dir / 'job1'
+    (job / 'output' / 'design.aedb').mkdir(parents=True)
+    (job / 'metadata.json').write_text(json.dumps({'user': 'admin'}))
+    monkeypatch.setattr(net_index, 'job_nets', lambda job_path, version: _Nets(list(NAMES), POWER))
+
+    resp = client.get('/api/jobs/job1/nets?q=dq&order=name&limit=2')
+    assert resp.status_code == 200
+    assert _names(resp.get_json()) == ['DQ1', 'dq2']
+
+    resp = client.get('/api/jobs/job1/nets?q=DQ[&regex=1')
+    assert resp.status_code == 400
+    assert 'Invalid filter' in resp.get_json()['error']
+    assert client.get('/api/jobs/job1/nets?kind=ground').status_code == 400
@@ -0,0 +1,82 @@
+import json
+
+from app import registry
+from app.utils import update_metadata
+
+
+def _job(jobs_dir, job_id, user, created_at, **meta):
+    path = jobs_dir / job_id
+    path.mkdir()
+    meta = dict(meta, user=user, created_at=created_at, step='step_01', flow_id='Flow_SIwave_SYZ')
+    (path / 'metadata.json').write_text(json.dumps(meta))
+    return path
+
+
+def test_query_jobs_pages_newest_first(jobs_dir):
+    for n in range(5):
+        _job(jobs_dir, f'a{n}', 'alice', 1000 + n)
+    _job(jobs_dir, 'b0', 'bob', 2000)
+    registry.rebuild(str(jobs_dir))
+
+    assert [job['id'] for job in registry.query_jobs('alice', limit=2)] == ['a4', 'a3']
+    assert [job['id'] for job in registry.query_jobs('alice', limit=2, offset=2)] == ['a2', 'a1']
+    assert [job['id'] for job in registry.query_jobs('alice', limit=2, offset=4)] == ['a0']
+    assert registry.query_jobs('alice', limit=2, offset=6) == []
+    assert [job['id'] for job in registry.query_jobs()][:2] == ['b0', 'a4']
+    assert registry.count_jobs('alice') == 5 and registry.count_jobs() == 6
+    assert registry.query_jobs('bob')[0]['user'] == 'bob'
+
+
+def test_rebuild_bumps_every_users_revision(jobs_dir):
+    _job(jobs_dir, 'a0', 'alice', 1000)
+    registry.record('a0', {'user': 'alice', 'created_at': 1000})
+    known = registry.revision('alice')
+    # bob's job was written while the index was not maintained
+    _job(jobs_dir, 'b0', 'bob', 2000)
+    assert registry.revision('bob') == 0
+
+    assert registry.rebuild(str(jobs_dir)) == 2
+
+    assert registry.revision('alice') == known + 1
+    assert registry.revision('bob') == 1
+    assert registry.count_jobs('bob') == 1
+
+
+def test_rebuild_drops_jobs_gone_from_disk(jobs_dir):
+    registry.record('gone', {'user': 'alice', 'created_at': 1})
+    _job(jobs_dir, 'a0', 'alice', 1000)
+
+    registry.rebuild(str(jobs_dir))
+
+    assert [job['id'] for job in registry.query_jobs('alice')] == ['a0']
+
+
+def test_api_jobs_etag(client, jobs_dir):
+    path = _job(jobs_dir, 'a0', 'admin', 1000)
+    registry.rebuild(str(jobs_dir))
+
+    first = client.get('/api/jobs')
+    etag = first.headers['ETag']
+    assert first.get_json()['total'] == 1
+    assert client.get('/api/jobs', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/jobs?offset=50', headers={'If-None-Match': etag}).status_code == 200
+
+    update_metadata(str(path), status='running')
+    changed = client.get('/api/jobs', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['jobs'][0]['status'] == 'running'
+
+
+def test_rebuild_from_the_command_line_invalidates_etags(client, jobs_dir, tmp_path, monkeypatch):
+    # No job of admin was indexed yet, so admin has no revision
+    etag = client.get('/api/jobs').headers['ETag']
+    _job(jobs_dir, 'a0', 'admin', 1000)
+    # The CLI points the registry at its own path; keep the app's database
+    monkeypatch.setitem(registry._settings, 'path', registry._settings['path'])
+
+    registry.main(['rebuild', '--jobs', str(jobs_dir), '--db', registry._settings['path']])
+
+    resp = client.get('/api/jobs', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert [job['id'] for job in resp.get_json()['jobs']] == ['a0']
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from app.edb_ops import diff_stackup
+from app.stackup_io import StackupError, read_stackup, write_stackup
+
+LAYERS = [
+    {'name': 'TOP', 'type': 'signal', 'thickness': 35e-6, 'conductivity': 5.8e7},
+    {'name': 'D1', 'type': 'dielectric', 'thickness': 0.1e-3, 'permittivity': 4.2, 'loss_tangent': 0.02},
+    {'name': 'BOTTOM', 'type': 'signal', 'thickness': 35e-6, 'conductivity': 5.8e7},
+]
+
+
+def _expected(layer):
+    signal = layer['type'] == 'signal'
+    return {
+        'name': layer['name'],
+        'type': layer['type'],
+        'thickness': pytest.approx(layer['thickness']),
+        'permittivity': None if signal else pytest.approx(layer['permittivity']),
+        'loss_tangent': None if signal else pytest.approx(layer['loss_tangent']),
+        'conductivity': pytest.approx(layer['conductivity']) if signal else None,
+    }
+
+
+@pytest.mark.parametrize('ext', ['.xlsx', '.csv', '.json'])
+@pytest.mark.parametrize('unit', ['mm', 'mil', 'um'])
+def test_round_trip(tmp_path, ext, unit):
+    path = str(tmp_path / f'stackup{ext}')
+    write_stackup(LAYERS, path, unit=unit)
+
+    assert read_stackup(path) == [_expected(layer) for layer in LAYERS]
+
+
+def test_round_trip_has_no_changes(tmp_path):
+    path = str(tmp_path / 'stackup.csv')
+    write_stackup(LAYERS, path, unit='mil')
+
+    assert diff_stackup(read_stackup(path), LAYERS) == []
+
+
+def _csv(tmp_path, *rows, unit='mm'):
+    path = tmp_path / 'stackup.csv'
+    lines = [f'unit,{unit}', 'Layer Name,Type,Thickness,Permittivity,Loss Tangent,Conductivity']
+    path.write_text('\n'.join(lines + list(rows)) + '\n')
+    return str(path)
+
+
+def test_missing_columns(tmp_path):
+    # Short rows are padded with blanks; a blank thickness is rejected
+    path = _csv(tmp_path, 'TOP,signal,0.035', 'D1,dielectric')
+    with pytest.raises(StackupError, match='Layer D1: thickness'):
+        read_stackup(path)
+
+    # Blank material columns are left alone
+    path = _csv(tmp_path, 'TOP,signal,0.035')
+    assert read_stackup(path)[0]['conductivity'] is None
+
+
+def test_missing_json_layers(tmp_path):
+    path = tmp_path / 'stackup.json'
+    path.write_text(json.dumps({'unit': 'mm'}))
+    with pytest.raises(StackupError, match='Invalid stackup JSON'):
+        read_stackup(str(path))
+
+    path.write_text('{"unit": "mm", "layers": [')
+    with pytest.raises(StackupError, match='Invalid stackup JSON'):
+        read_stackup(str(path))
+
+
+def test_missing_xlsx_sheet(tmp_path):
+    from openpyxl import Workbook
+
+    path = str(tmp_path / 'stackup.xlsx')
+    wb = Workbook()
+    wb.active.title = 'Layers'
+    wb.save(path)
+    with pytest.raises(StackupError, match='no "Stackup" sheet'):
+        read_stackup(path)
+
+
+def test_non_numeric_cells(tmp_path):
+    with pytest.raises(StackupError, match="Layer D1: thickness 'thick' is not a number"):
+        read_stackup(_csv(tmp_path, 'TOP,signal,0.035', 'D1,dielectric,thick,4.2,0.02'))
+    with pytest.raises(StackupError, match="Layer D1: permittivity 'FR4' is not a number"):
+        read_stackup(_csv(tmp_path, 'D1,dielectric,0.1,FR4,0.02'))
+    with pytest.raises(StackupError, match='Layer D1: thickness must be'):
+        read_stackup(_csv(tmp_path, 'D1,dielectric,-0.1,4.2,0.02'))
+
+
+def test_invalid_sheets(tmp_path):
+    with pytest.raises(StackupError, match='Unknown thickness unit'):
+        read_stackup(_csv(tmp_path, 'TOP,signal,0.035', unit='inch'))
+    with pytest.raises(StackupError, match='listed twice'):
+        read_stackup(_csv(tmp_path, 'TOP,signal,0.035', 'TOP,signal,0.035'))
+    with pytest.raises(StackupError, match='no layers'):
+        read_stackup(_csv(tmp_path))
+    with pytest.raises(StackupError, match='Unsupported stackup format'):
+        read_stackup(str(tmp_path / 'stackup.txt'))
+    with pytest.raises(StackupError, match='Unknown thickness unit'):
+        write_stackup(LAYERS, str(tmp_path / 'out.csv'), unit='inch')
+
+
+def test_unknown_layer(tmp_path):
+    path = _csv(tmp_path, 'TOP,signal,0.035', 'INNER9,signal,0.035')
+    with pytest.raises(ValueError, match="INNER9 is not in the design's stackup"):
+        diff_stackup(read_stackup(path), LAYERS)
@@ -0,0 +1,166 @@
+import io
+import json
+import os
+import time
+import zipfile
+import zlib
+
+import pytest
+
+from app import snapshot, uploads
+
+
+@pytest.fixture
+def job(jobs_dir):
+    path = jobs_dir / 'job-a'
+    path.mkdir()
+    (path / 'metadata.json').write_text(json.dumps({'user': 'admin', 'step': 'step_01'}))
+    return path
+
+
+def _crc(body):
+    return {'X-Chunk-Checksum': f'crc32={zlib.crc32(body):08x}'}
+
+
+def _init(client, filename, size, chunk_size=4):
+    resp = client.post('/job/job-a/uploads', json={'filename': filename, 'size': size, 'chunk_size': chunk_size})
+    return resp.status_code, resp.get_json()
+
+
+def _put(client, upload, index, body, headers=None):
+    resp = client.put(f"/job/job-a/uploads/{upload['upload_id']}/{index}", data=body,
+                      headers=_crc(body) if headers is None else headers)
+    return resp.status_code, resp.get_json()
+
+
+def _upload(client, filename, body, chunk_size=4):
+    status, upload = _init(client, filename, len(body), chunk_size)
+    assert status == 201
+    for index in range(upload['chunks']):
+        assert _put(client, upload, index, body[index * chunk_size:(index + 1) * chunk_size])[0] == 200
+    return upload
+
+
+def _zip_bytes():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('design.aedb/edb.def', b'edb')
+    return buf.getvalue()
+
+
+def test_chunks_in_any_order_complete_into_input(client, job):
+    body = b'0123456789'
+    status, upload = _init(client, 'x.brd', len(body))
+    assert status == 201
+    assert upload['chunks'] == 3 and upload['missing'] == [0, 1, 2]
+    for index in (2, 0, 1):
+        assert _put(client, upload, index, body[index * 4:(index + 1) * 4])[0] == 200
+
+    resp = client.post(f"/job/job-a/uploads/{upload['upload_id']}/complete")
+
+    assert resp.get_json() == {'filename': 'x.brd', 'size': 10}
+    assert (job / 'input' / 'x.brd').read_bytes() == body
+    assert not (job / 'input' / 'x.brd.part').exists()
+    assert snapshot.upload_checksum(str(job), 'x.brd')
+
+
+def test_resume_reports_the_missing_chunks(client, job):
+    _, upload = _init(client, 'x.brd', 10)
+    _put(client, upload, 1, b'4567')
+
+    status, resumed = _init(client, 'x.brd', 10)
+
+    assert status == 200
+    assert resumed['upload_id'] == upload['upload_id']
+    assert resumed['received'] == [1] and resumed['missing'] == [0, 2]
+    assert client.get(f"/job/job-a/uploads/{upload['upload_id']}").get_json()['missing'] == [0, 2]
+
+
+def test_checksum_mismatch_is_refused(client, job):
+    _, upload = _init(client, 'x.brd', 10)
+
+    assert _put(client, upload, 0, b'0123', headers=_crc(b'9999'))[0] == 422
+    assert _put(client, upload, 0, b'0123', headers={'X-Chunk-Checksum': 'md5=00'})[0] == 422
+    assert _init(client, 'x.brd', 10)[1]['received'] == []
+
+
+def test_chunk_index_and_length_are_checked(client, job):
+    _, upload = _init(client, 'x.brd', 10)
+
+    assert _put(client, upload, 3, b'0123')[0] == 400
+    assert _put(client, upload, 0, b'012')[0] == 400
+    # The last chunk holds the remaining 2 bytes
+    assert _put(client, upload, 2, b'8901')[0] == 400
+    assert _put(client, upload, 2, b'89')[0] == 200
+
+
+def test_sizes_outside_the_limits_are_refused(app, client, job):
+    app.config['MAX_UPLOAD_SIZE'] = 100
+
+    assert _init(client, 'x.brd', 0)[0] == 400
+    assert _init(client, 'x.brd', -5)[0] == 400
+    assert _init(client, 'x.brd', 101)[0] == 413
+    assert not (job / 'input').exists() or not os.listdir(job / 'input')
+
+
+def test_complete_with_missing_chunks_is_refused(client, job):
+    _, upload = _init(client, 'x.brd', 10)
+    _put(client, upload, 0, b'0123')
+
+    resp = client.post(f"/job/job-a/uploads/{upload['upload_id']}/complete")
+
+    assert resp.status_code == 409
+    assert resp.get_json()['missing'] == [1, 2]
+    assert not (job / 'input' / 'x.brd').exists()
+
+
+def test_zip_without_signature_is_refused_at_the_first_chunk(client, job):
+    _, upload = _init(client, 'x.zip', 10)
+
+    status, body = _put(client, upload, 0, b'NOTAZIP!'[:4])
+
+    assert status == 400 and 'not a zip' in body['error']
+    assert not (job / 'input' / 'x.zip.part').exists()
+    assert client.get(f"/job/job-a/uploads/{upload['upload_id']}").status_code == 404
+
+
+def test_truncated_zip_is_refused_at_the_last_chunk(client, job):
+    truncated = _zip_bytes()[:-22]
+    # The end-of-central-directory search window only fits in a single chunk here
+    _, upload = _init(client, 'x.zip', len(truncated), chunk_size=len(truncated))
+
+    status, body = _put(client, upload, 0, truncated)
+
+    assert status == 400 and 'truncated' in body['error']
+    assert not (job / 'input' / 'x.zip.part').exists()
+
+
+def test_valid_zip_is_accepted(client, job):
+    data = _zip_bytes()
+    upload = _upload(client, 'x.zip', data, chunk_size=16)
+
+    assert client.post(f"/job/job-a/uploads/{upload['upload_id']}/complete").status_code == 200
+    assert zipfile.is_zipfile(job / 'input' / 'x.zip')
+
+
+def test_chunk_after_complete_is_not_written(client, job):
+    upload = _upload(client, 'x.brd', b'0123456789')
+    client.post(f"/job/job-a/uploads/{upload['upload_id']}/complete")
+
+    assert _put(client, upload, 0, b'abcd')[0] == 404
+    assert (job / 'input' / 'x.brd').read_bytes() == b'0123456789'
+
+
+def test_abandoned_uploads_are_reaped(client, job):
+    _, stale = _init(client, 'old.brd', 10)
+    _, fresh = _init(client, 'new.brd', 10)
+    old = time.time() - 2 * uploads.DEFAULT_UPLOAD_EXPIRY
+    for path in (job / 'input' / 'old.brd.part', job / 'tmp' / 'chunked' / f"{stale['upload_id']}.json"):
+        os.utime(path, (old, old))
+
+    uploads.reap_expired(uploads.DEFAULT_UPLOAD_EXPIRY)
+
+    assert not (job / 'input' / 'old.brd.part').exists()
+    assert client.get(f"/job/job-a/uploads/{stale['upload_id']}").status_code == 404
+    assert (job / 'input' / 'new.brd.part').exists()
+    assert client.get(f"/job/job-a/uploads/{fresh['upload_id']}").status_code == 200
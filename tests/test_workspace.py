@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from app import edb_fake, edb_ops, edb_pool, utils
+from app.workspace import LAZY_DIRS, has_snapshot, restore, rewind, snapshot_step, unshare_outputs, workspace_dir
+
+
+@pytest.fixture(autouse=True)
+def no_reflinks(monkeypatch):
+    """Clone by hard link or copy, as on filesystems without reflinks."""
+    def refuse(src, dst):
+        raise OSError('reflinks are not supported here')
+    monkeypatch.setattr(utils, 'reflink_file', refuse)
+
+
+@pytest.fixture
+def job(tmp_path):
+    output = tmp_path / 'job' / 'output'
+    (output / 'design.aedb').mkdir(parents=True)
+    (output / 'tiles' / 'top').mkdir(parents=True)
+    (output / 'design.aedb' / 'edb.def').write_bytes(b'design v1')
+    (output / 'tiles' / 'top' / '0_0.webp').write_bytes(b'tile')
+    (output / 'stackup.xlsx').write_bytes(b'stackup v1')
+    (output / 'renamed_components.json').write_text('{}')
+    (tmp_path / 'job' / 'cache').mkdir()
+    (tmp_path / 'job' / 'cache' / 'design_snapshot.json').write_text('{"v": 1}')
+    return tmp_path / 'job'
+
+
+def _links(path):
+    return os.stat(path).st_nlink
+
+
+def test_snapshot_links_everything_but_the_declared_writes(job):
+    output = job / 'output'
+
+    snapshot_step(str(job), 'step_03', writes=['renamed_components.json'])
+
+    saved = workspace_dir(str(job), 'step_03')
+    assert has_snapshot(str(job), 'step_03')
+    assert _links(output / 'renamed_components.json') == 1
+    assert _links(os.path.join(saved, 'output', 'renamed_components.json')) == 1
+    assert _links(output / 'stackup.xlsx') == 2
+    assert _links(output / 'tiles' / 'top' / '0_0.webp') == 2
+    # Unshared by the EDB pool only when a writable handle is opened
+    assert _links(output / LAZY_DIRS[0] / 'edb.def') == 2
+    assert _links(job / 'cache' / 'design_snapshot.json') == 2
+
+
+def test_patterns_match_below_output(job):
+    snapshot_step(str(job), 'step_02', writes=['stack*.xlsx', 'missing.json'])
+
+    assert _links(job / 'output' / 'stackup.xlsx') == 1
+    assert _links(job / 'output' / 'renamed_components.json') == 2
+
+
+def test_no_declaration_unshares_every_output_except_lazy_and_replaced_dirs(job):
+    snapshot_step(str(job), 'step_01')
+
+    assert _links(job / 'output' / 'stackup.xlsx') == 1
+    assert _links(job / 'output' / 'renamed_components.json') == 1
+    assert _links(job / 'output' / 'design.aedb' / 'edb.def') == 2
+    assert _links(job / 'output' / 'tiles' / 'top' / '0_0.webp') == 2
+
+
+def test_writes_after_snapshot_leave_it_intact_and_rewind_restores(job):
+    output = job / 'output'
+    snapshot_step(str(job), 'step_02', writes=['stackup.xlsx'])
+    (output / 'stackup.xlsx').write_bytes(b'stackup v2')
+    (output / 'extra.json').write_text('[]')
+    (job / 'cache' / 'design_snapshot.json').unlink()
+    (job / 'cache' / 'design_snapshot.json').write_text('{"v": 2}')
+    snapshot_step(str(job), 'step_03', writes=[])
+
+    rewind(str(job), 'step_02', later_steps=['step_03'])
+
+    assert (output / 'stackup.xlsx').read_bytes() == b'stackup v1'
+    assert not (output / 'extra.json').exists()
+    assert (output / 'design.aedb' / 'edb.def').read_bytes() == b'design v1'
+    assert (job / 'cache' / 'design_snapshot.json').read_text() == '{"v": 1}'
+    assert not has_snapshot(str(job), 'step_03')
+    # Restored outputs share their data with the snapshot again
+    assert _links(output / 'stackup.xlsx') == 2
+
+
+def test_restore_of_a_snapshot_without_outputs(tmp_path):
+    job = tmp_path / 'job'
+    job.mkdir()
+    snapshot_step(str(job), 'step_01')
+    (job / 'output').mkdir()
+    (job / 'output' / 'design.aedb').mkdir()
+
+    restore(str(job), 'step_01')
+
+    assert os.listdir(job / 'output') == []
+
+
+def test_design_is_unshared_only_for_a_writable_handle(job, monkeypatch):
+    monkeypatch.setitem(edb_pool._settings, 'backend', 'fake')
+    edb_def = job / 'output' / 'design.aedb' / 'edb.def'
+    edb_fake.Edb._write(str(edb_def.parent), edb_fake.sample_design())
+    snapshot_step(str(job), 'step_04', writes=[])
+    saved = os.path.join(workspace_dir(str(job), 'step_04'), 'output', 'design.aedb', 'edb.def')
+    original = edb_def.read_bytes()
+    try:
+        with edb_pool.edb_session(str(job), writable=False) as edb:
+            assert edb.nets.nets
+        assert _links(edb_def) == 2
+
+        with edb_pool.edb_session(str(job)) as edb:
+            assert _links(edb_def) == 1
+            edb.data['nets'].append('NEW')
+            edb.save()
+    finally:
+        edb_pool.close_job('job')
+
+    assert b'NEW' in edb_def.read_bytes()
+    with open(saved, 'rb') as fp:
+        assert fp.read() == original
+
+
+def test_cutout_reads_the_shared_design(job, monkeypatch):
+    monkeypatch.setitem(edb_pool._settings, 'backend', 'fake')
+    edb_def = job / 'output' / 'design.aedb' / 'edb.def'
+    design = edb_fake.sample_design()
+    edb_fake.Edb._write(str(edb_def.parent), design)
+    snapshot_step(str(job), 'step_05', writes=[])
+    nets = design['nets'][:2]
+    try:
+        edb_ops.cutout(str(job), '2024.1', None, nets[:1], nets[1:], str(job / 'output' / 'cutout.aedb'))
+    finally:
+        edb_pool.close_job('job')
+
+    assert _links(edb_def) == 2
+    assert (job / 'output' / 'cutout.aedb' / 'edb.def').exists()